@@ -0,0 +1,134 @@
+##############################################################################
+#
+# NAME:        bench_errmatch.py
+#
+# FACILITY:    SAM (Service Availability Monitoring)
+#
+# DESCRIPTION:
+#
+#         Benchmarks of gridmon.errmatch module.
+#
+# AUTHORS:     SAM team, CERN
+#
+# CREATED:     Oct 16, 2026
+#
+# NOTES:
+#
+# MODIFIED:
+#
+##############################################################################
+
+"""
+Benchmarks of `gridmon.errmatch` module.
+
+`ErrorsMatching` construction and `ErrorsMatching.match()` on synthetic
+Errors DBs of 10 to 10k patterns against outputs of 1KB to 10MB - with no
+matching error (the whole output is scanned) and with an error at the end.
+"""
+
+import os
+import random
+import atexit
+import shutil
+import tempfile
+
+from gridmon.errmatch import ErrorsMatching
+
+PATTERNS = [10, 100, 1000, 10000]
+OUTPUTS = [1024, 100 * 1024, 10 * 1024 * 1024]
+QUICK_PATTERNS = [10, 1000]
+QUICK_OUTPUTS = [1024, 1024 * 1024]
+
+PATTERNS_PER_OPTION = 10
+OPTIONS_PER_TOPIC = 10
+
+_tmpdir = None
+
+def _pattern(i):
+    "Mix of literal patterns and patterns with regular expressions."
+    if i % 3 == 0:
+        return 'Failed to contact service %i: connection refused' % i
+    if i % 3 == 1:
+        return 'error code %i\\S* while transferring \\d+ bytes' % i
+    return 'Timeout after \\d+ seconds waiting for reply %i' % i
+
+def make_errdb(n):
+    """Write Errors DB of `n` patterns.
+
+    :return: path to the file and list of its topics.
+    """
+    global _tmpdir
+    if _tmpdir is None:
+        _tmpdir = tempfile.mkdtemp(prefix='bench_errmatch.')
+        atexit.register(shutil.rmtree, _tmpdir, True)
+    path = os.path.join(_tmpdir, 'errdb.%i' % n)
+    topics = []
+    lines = []
+    i = 0
+    while i < n:
+        topic = 'topic%i' % (i / (PATTERNS_PER_OPTION * OPTIONS_PER_TOPIC))
+        if not topic in topics:
+            topics.append(topic)
+            lines.append('\n[%s]' % topic)
+        opt = 'opt%i' % (i / PATTERNS_PER_OPTION)
+        lines.append('%s_status = CRITICAL' % opt)
+        lines.append('%s:' % opt)
+        pats = [_pattern(j) for j in range(i, min(i + PATTERNS_PER_OPTION, n))]
+        lines.append(' ' + '|\n '.join(pats))
+        i += PATTERNS_PER_OPTION
+    open(path, 'w').write('\n'.join(lines) + '\n')
+    return path, topics
+
+def make_output(size, error=None):
+    """Command output like text of `size` bytes; `error` is the last line.
+    """
+    rnd = random.Random(size)
+    words = ['transfer', 'file', 'srm', 'gsiftp', 'request', 'status',
+             'queued', 'ready', 'done', 'bytes', 'checksum', 'adler32',
+             'token', 'space', 'pool', 'ok', 'host', 'port', 'reply']
+    lines = []
+    n = 0
+    while n < size:
+        l = ' '.join([rnd.choice(words) for i in range(rnd.randint(5, 15))])
+        l = '%s %i' % (l, rnd.randint(0, 1000000))
+        lines.append(l)
+        n += len(l) + 1
+    if error:
+        lines.append(error)
+    return '\n'.join(lines)
+
+def _construct(path, topics):
+    def f():
+        ErrorsMatching(path, topics)
+    return f
+
+def _match(path, topics, size, error):
+    def factory():
+        em = ErrorsMatching(path, topics)
+        out = make_output(size, error)
+        def f():
+            em.match(out)
+        return f
+    return factory
+
+def _size(s):
+    for unit, scale in (('MB', 1024 * 1024), ('KB', 1024)):
+        if s >= scale:
+            return '%i%s' % (s / scale, unit)
+    return '%iB' % s
+
+def benchmarks(quick=False):
+    res = []
+    patterns = quick and QUICK_PATTERNS or PATTERNS
+    outputs = quick and QUICK_OUTPUTS or OUTPUTS
+    for n in patterns:
+        path, topics = make_errdb(n)
+        res.append(('errmatch.construct.%i' % n,
+                    lambda path=path, topics=topics: _construct(path, topics)))
+        for size in outputs:
+            res.append(('errmatch.match.%i.%s.nomatch' % (n, _size(size)),
+                        _match(path, topics, size, None)))
+            error = _pattern(n - 1).replace('\\S*', '').replace('\\d+', '42')
+            res.append(('errmatch.match.%i.%s.last' % (n, _size(size)),
+                        _match(path, topics, size, error)))
+    return res
@@ -0,0 +1,57 @@
+##############################################################################
+#
+# NAME:        bench_metricoutput.py
+#
+# FACILITY:    SAM (Service Availability Monitoring)
+#
+# DESCRIPTION:
+#
+#         Benchmarks of gridmon.metricoutput module.
+#
+# AUTHORS:     SAM team, CERN
+#
+# CREATED:     Oct 16, 2026
+#
+# NOTES:
+#
+# MODIFIED:
+#
+##############################################################################
+
+"""
+Benchmarks of `gridmon.metricoutput.MetricOutputHandler.printd()` under
+heavy logging - 10k lines per metric run, kept in memory or spilled to a
+file, and below the verbosity level.
+"""
+
+import atexit
+import shutil
+import tempfile
+
+from gridmon.metricoutput import MetricOutputHandler, VERBOSITY_MAX, \
+                                 VERBOSITY_MIN
+
+LINES = 10000
+LINE = 'srm-ls: srm://se.example.org:8446/dpm/example.org/home/ops/file 1024 OK'
+
+def _printd(verbosity, v, spill=None):
+    def factory():
+        mo = MetricOutputHandler(v=verbosity)
+        if spill:
+            d = tempfile.mkdtemp(prefix='bench_metricoutput.')
+            atexit.register(shutil.rmtree, d, True)
+            mo.set_spill(spill, d)
+        def f():
+            for i in xrange(LINES):
+                mo.printd(LINE, v=v)
+            mo.get_detdata()
+            mo.clear_details()
+        return f
+    return factory
+
+def benchmarks(quick=False):
+    return [('metricoutput.printd.10k', _printd(VERBOSITY_MAX, VERBOSITY_MIN)),
+            ('metricoutput.printd.10k.spill',
+                    _printd(VERBOSITY_MAX, VERBOSITY_MIN, 64 * 1024)),
+            ('metricoutput.printd.10k.suppressed',
+                    _printd(VERBOSITY_MIN, VERBOSITY_MAX))]
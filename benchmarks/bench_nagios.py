@@ -0,0 +1,89 @@
+##############################################################################
+#
+# NAME:        bench_nagios.py
+#
+# FACILITY:    SAM (Service Availability Monitoring)
+#
+# DESCRIPTION:
+#
+#         Benchmarks of gridmon.nagios package.
+#
+# AUTHORS:     SAM team, CERN
+#
+# CREATED:     Oct 16, 2026
+#
+# NOTES:
+#
+# MODIFIED:
+#
+##############################################################################
+
+"""
+Benchmarks of formatting passive check results for Nagios command file
+and NSCA clients, and of encoding plugin output of 1KB to 10MB with and
+without a size budget.
+"""
+
+from gridmon import utils
+from gridmon.nagios import nagios
+from gridmon.nagios import nsca
+
+RESULTS = [1, 100]
+DETAILS = [1024, 1024 * 1024, 10 * 1024 * 1024]
+QUICK_DETAILS = [1024, 1024 * 1024]
+BUDGET = 8192
+
+def _results(n):
+    details = 'Invoking metric: [2026-10-16T10:00:00Z] org.sam.SRM-Put\n' * 20
+    return [{'host'    : 'se%i.example.org' % i,
+             'service' : 'org.sam.SRM-Put-ops',
+             'status'  : i % 4,
+             'summary' : 'OK: file put to srm://se%i.example.org' % i,
+             'details' : details} for i in range(n)]
+
+def _strings(n):
+    def factory():
+        res = _results(n)
+        def f():
+            nagios._getPassiveResultString(res)
+        return f
+    return factory
+
+def _packets(n):
+    def factory():
+        res = _results(n)
+        def f():
+            for r in res:
+                nsca.build_packet(1792144800, r['host'], r['service'],
+                                  r['status'],
+                                  r['summary'] + '\\n' + r['details'])
+        return f
+    return factory
+
+def _encode(size, budget):
+    def factory():
+        line = 'Invoking metric: [2026-10-16T10:00:00Z] org.sam.SRM-Put | ok\n'
+        details = (line * (size / len(line) + 1))[:size]
+        def f():
+            utils.encode_output('CRITICAL: failed', details, 't=1.5s;;',
+                                budget, True, '/var/lib/gridprobes/x.output')
+        return f
+    return factory
+
+def _size(s):
+    for unit, scale in (('MB', 1024 * 1024), ('KB', 1024)):
+        if s >= scale:
+            return '%i%s' % (s / scale, unit)
+    return '%iB' % s
+
+def benchmarks(quick=False):
+    res = []
+    for n in RESULTS:
+        res.append(('nagios.result_strings.%i' % n, _strings(n)))
+        res.append(('nagios.nsca_packets.%i' % n, _packets(n)))
+    for size in quick and QUICK_DETAILS or DETAILS:
+        res.append(('nagios.encode_output.%s.nobudget' % _size(size),
+                    _encode(size, None)))
+        res.append(('nagios.encode_output.%s.budget%i' % (_size(size), BUDGET),
+                    _encode(size, BUDGET)))
+    return res
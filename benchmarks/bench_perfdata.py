@@ -0,0 +1,86 @@
+##############################################################################
+#
+# NAME:        bench_perfdata.py
+#
+# FACILITY:    SAM (Service Availability Monitoring)
+#
+# DESCRIPTION:
+#
+#         Benchmarks of gridmon.nagios.perfdata module.
+#
+# AUTHORS:     SAM team, CERN
+#
+# CREATED:     Oct 16, 2026
+#
+# NOTES:
+#
+# MODIFIED:
+#
+##############################################################################
+
+"""
+Benchmarks of `gridmon.nagios.perfdata.PerfData.update()` with 5 to 500
+ordered keys, of `PerfData.merge()` of a single key and of parsing and
+aggregating performance data of 100 to 1000 results.
+"""
+
+from gridmon.nagios import perfdata
+
+KEYS = [5, 50, 500]
+RESULTS = [100, 1000]
+
+def _update(n):
+    def factory():
+        order = ['key%i' % i for i in range(n)]
+        data = {}
+        for i in range(n):
+            if i % 3 == 0:
+                data[order[i]] = i
+            elif i % 3 == 1:
+                data[order[i]] = (i * 0.5, 10, 20, 0, 100)
+            # the rest is left empty
+        pd = perfdata.PerfData(order)
+        def f():
+            pd.update(data)
+            pd.get()
+        return f
+    return factory
+
+def _merge(n):
+    def factory():
+        order = ['key%i' % i for i in range(n)]
+        pd = perfdata.PerfData(order)
+        data = {order[n / 2] : (0.5, 10, 20, 0, 100)}
+        def f():
+            pd.merge(data)
+            pd.get()
+        return f
+    return factory
+
+def _results(n):
+    return [('host%i' % i,
+             "time=%i.%ims;1000;5000;0; size=%iKB;;;0; 'jobs queued'=%i" % \
+                 (i, i % 10, i * 3, i % 17)) for i in range(n)]
+
+def _table(n):
+    def factory():
+        results = _results(n)
+        def f():
+            perfdata.PerfDataTable().add_many(results)
+        return f
+    return factory
+
+def _summary(n):
+    def factory():
+        t = perfdata.PerfDataTable()
+        t.add_many(_results(n))
+        def f():
+            t.summary()
+        return f
+    return factory
+
+def benchmarks(quick=False):
+    return [('perfdata.update.%i' % n, _update(n)) for n in KEYS] + \
+           [('perfdata.merge.%i' % n, _merge(n)) for n in KEYS] + \
+           [('perfdata.parse.%i' % n, _table(n)) for n in RESULTS] + \
+           [('perfdata.summary.%i' % n, _summary(n)) for n in RESULTS]
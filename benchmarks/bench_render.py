@@ -0,0 +1,91 @@
+##############################################################################
+#
+# NAME:        bench_render.py
+#
+# FACILITY:    SAM (Service Availability Monitoring)
+#
+# DESCRIPTION:
+#
+#         Benchmarks of gridmon.probe.ProbeFormatRenderer.
+#
+# AUTHORS:     SAM team, CERN
+#
+# CREATED:     Oct 16, 2026
+#
+# NOTES:
+#
+# MODIFIED:
+#
+##############################################################################
+
+"""
+Benchmarks of `gridmon.probe.ProbeFormatRenderer.render()` with details
+data of 1KB to 1MB, with and without sanitising and performance data, in
+Nagios and JSON lines formats, and of `render_many()` of 1000 results.
+"""
+
+from gridmon.probe import ProbeFormatRenderer
+
+DETAILS = [1024, 100 * 1024, 1024 * 1024]
+QUICK_DETAILS = [1024, 100 * 1024]
+
+class NullStream(object):
+    def write(self, s):
+        pass
+
+def _details(size):
+    line = 'Invoking metric: <org.sam.SRM-Put> srm://se.example.org:8446/'\
+           'dpm/example.org/home/ops & <done> "100%" \\ status: OK|'
+    return (line * (size / len(line) + 1))[:size]
+
+def _size(s):
+    if s >= 1024 * 1024:
+        return '%iMB' % (s / (1024 * 1024))
+    return '%iKB' % (s / 1024)
+
+def _render(size, sanitize, perf, output_format='nagios'):
+    def factory():
+        r = ProbeFormatRenderer(stream=NullStream(), sanitize=sanitize,
+                                output_format=output_format)
+        details = _details(size)
+        data = {'metricStatus' : 'OK',
+                'summaryData'  : 'OK: file put to srm://se.example.org',
+                'detailsData'  : details}
+        if perf:
+            data['perfData'] = ' '.join(['t%i=%i.5s;;' % (i, i)
+                                         for i in range(20)])
+        def f():
+            r.render(data, sanitize=sanitize)
+        return f
+    return factory
+
+def _render_many(n, output_format):
+    def factory():
+        r = ProbeFormatRenderer(stream=NullStream(),
+                                output_format=output_format)
+        results = [{'metricStatus' : i % 4,
+                    'summaryData'  : 'OK: host%i.example.org|up' % i,
+                    'detailsData'  : _details(512),
+                    'perfData'     : 't=%i.5s;;' % i,
+                    'hostName'     : 'host%i.example.org' % i}
+                   for i in range(n)]
+        def f():
+            r.render_many(results)
+        return f
+    return factory
+
+def benchmarks(quick=False):
+    res = []
+    for size in quick and QUICK_DETAILS or DETAILS:
+        for sanitize in (True, False):
+            for perf in (False, True):
+                name = 'render.%s.%s%s' % (_size(size),
+                                           sanitize and 'sanitize' or 'raw',
+                                           perf and '.perfdata' or '')
+                res.append((name, _render(size, sanitize, perf)))
+        res.append(('render.%s.jsonl.perfdata' % _size(size),
+                    _render(size, True, True, 'jsonl')))
+    for output_format in ProbeFormatRenderer.FORMATS:
+        res.append(('render_many.1000.%s' % output_format,
+                    _render_many(1000, output_format)))
+    return res
@@ -0,0 +1,201 @@
+##############################################################################
+#
+# NAME:        benchlib.py
+#
+# FACILITY:    SAM (Service Availability Monitoring)
+#
+# DESCRIPTION:
+#
+#         Harness of micro-benchmarks of gridmon package.
+#
+# AUTHORS:     SAM team, CERN
+#
+# CREATED:     Oct 16, 2026
+#
+# NOTES:
+#
+# MODIFIED:
+#
+##############################################################################
+
+"""
+Harness of micro-benchmarks of `gridmon` package.
+
+A benchmark is a pair ``(name, factory)``. `factory()` does the set up and
+returns a callable, which is timed. Benchmark modules (``bench_*.py``)
+provide ``benchmarks(quick)`` returning a list of them.
+
+Results are dictionaries ``{name: {'min': sec, 'median': sec, 'number': N,
+'repeat': R}}`` with times per call; they are stored as JSON and compared
+against a baseline with `compare()`.
+"""
+
+__docformat__ = 'restructuredtext en'
+
+import os
+import re
+import gc
+import sys
+import time
+import platform
+from timeit import default_timer
+
+MIN_TIME = 0.2
+"seconds a timed run of a benchmark takes at least."
+REPEAT = 3
+"number of timed runs; the best one counts."
+THRESHOLD = 1.2
+"ratio of current and baseline time reported as regression."
+
+def measure(func, min_time=MIN_TIME, repeat=REPEAT):
+    """Time `func`. The number of calls per run is increased tenfold till
+    a run takes `min_time`. Garbage collection is disabled while timing.
+
+    :return: ``{'min': sec, 'median': sec, 'number': N, 'repeat': R}``
+    :rtype: `dict`
+    """
+    def run(number):
+        gcold = gc.isenabled()
+        gc.disable()
+        try:
+            t = default_timer()
+            for i in xrange(number):
+                func()
+            return default_timer() - t
+        finally:
+            if gcold:
+                gc.enable()
+
+    number = 1
+    t = run(number)
+    while t < min_time:
+        if t > 0:
+            number = int(number * min(10, 1.2 * min_time / t)) + 1
+        else:
+            number = number * 10
+        t = run(number)
+    times = [t]
+    for i in range(repeat - 1):
+        times.append(run(number))
+    times = [x / number for x in times]
+    times.sort()
+    return {'min'    : times[0],
+            'median' : times[len(times) / 2],
+            'number' : number,
+            'repeat' : repeat}
+
+def run_benchmarks(benchmarks, pattern=None, min_time=MIN_TIME,
+                   repeat=REPEAT, out=sys.stdout):
+    """Run benchmarks which names match regular expression `pattern`.
+
+    :param benchmarks: list of ``(name, factory)``.
+    :return: results - name: measurement (see `measure()`).
+    :rtype: `dict`
+    """
+    results = {}
+    for name, factory in benchmarks:
+        if pattern and not re.search(pattern, name):
+            continue
+        func = factory()
+        results[name] = measure(func, min_time, repeat)
+        if out:
+            out.write('%-50s %12s %12s %9i\n' % (name,
+                                           format_time(results[name]['min']),
+                                           format_time(results[name]['median']),
+                                           results[name]['number']))
+            out.flush()
+    return results
+
+def format_time(t):
+    "Human readable time."
+    for unit, scale in (('s', 1), ('ms', 1e3), ('us', 1e6)):
+        if t * scale >= 1:
+            return '%.3f %s' % (t * scale, unit)
+    return '%.3f ns' % (t * 1e9)
+
+def environment():
+    "Description of the environment benchmarks run in."
+    return {'python'   : sys.version.split()[0],
+            'platform' : platform.platform(),
+            'host'     : platform.node(),
+            'time'     : time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())}
+
+def _dumps(o, indent=0):
+    "JSON of dictionaries, lists, strings and numbers."
+    pad = ' ' * (indent + 2)
+    if isinstance(o, dict):
+        keys = o.keys()
+        keys.sort()
+        items = ['%s%s: %s' % (pad, _dumps(str(k)), _dumps(o[k], indent + 2))
+                 for k in keys]
+        return '{\n%s\n%s}' % (',\n'.join(items), ' ' * indent)
+    if isinstance(o, (list, tuple)):
+        return '[%s]' % ', '.join([_dumps(x, indent) for x in o])
+    if isinstance(o, str):
+        return '"%s"' % o.replace('\\', '\\\\').replace('"', '\\"')
+    if isinstance(o, float):
+        return repr(o)
+    return str(o)
+
+def _loads(s):
+    try:
+        import json
+    except ImportError:
+        try:
+            import simplejson as json
+        except ImportError:
+            json = None
+    if json is not None:
+        return json.loads(s)
+    # the subset written by _dumps() is valid Python
+    return eval(s, {'__builtins__' : {}}, {})
+
+def save(path, results):
+    "Write results and environment as JSON."
+    f = open(path, 'w')
+    try:
+        f.write(_dumps({'environment' : environment(),
+                        'results'     : results}) + '\n')
+    finally:
+        f.close()
+
+def load(path):
+    """Read results written by `save()`.
+
+    :rtype: `dict`
+    """
+    f = open(path)
+    try:
+        return _loads(f.read())['results']
+    finally:
+        f.close()
+
+def compare(results, baseline, threshold=THRESHOLD, out=sys.stdout):
+    """Compare best times of `results` with `baseline`.
+
+    :return: names of benchmarks slower than `threshold` times the baseline.
+    :rtype: `list`
+    """
+    slower = []
+    names = results.keys()
+    names.sort()
+    for name in names:
+        try:
+            base = baseline[name]['min']
+        except KeyError:
+            if out:
+                out.write('%-50s %12s\n' % (name, 'new'))
+            continue
+        ratio = results[name]['min'] / base
+        mark = ''
+        if ratio > threshold:
+            slower.append(name)
+            mark = 'SLOWER'
+        elif ratio < 1 / threshold:
+            mark = 'faster'
+        if out:
+            out.write('%-50s %12s %12s %7.2fx %s\n' % (name,
+                                        format_time(base),
+                                        format_time(results[name]['min']),
+                                        ratio, mark))
+    return slower
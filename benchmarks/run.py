@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# NAME:        run.py
+#
+# FACILITY:    SAM (Service Availability Monitoring)
+#
+# DESCRIPTION:
+#
+#         Run micro-benchmarks of gridmon package.
+#
+# AUTHORS:     SAM team, CERN
+#
+# CREATED:     Oct 16, 2026
+#
+# NOTES:
+#
+# MODIFIED:
+#
+##############################################################################
+
+"""
+Run micro-benchmarks of `gridmon` package, store results as JSON and
+compare them with a baseline.
+"""
+
+import os
+import sys
+import getopt
+
+sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import benchlib
+
+SUITES = ['bench_errmatch',
+          'bench_render',
+          'bench_perfdata',
+          'bench_metricoutput',
+          'bench_nagios']
+
+usage = """Usage: %s [-q|--quick] [-f|--filter <regexp>] [-o|--output <file>]
+    [-b|--baseline <file>] [--threshold <ratio>] [--repeat <N>]
+    [--min-time <sec>] [-l|--list]
+
+-q|--quick         Smaller sizes (errmatch: up to 1000 patterns and 1MB).
+-f|--filter <re>   Run benchmarks which names match the regular expression.
+-o|--output <file> Write results as JSON to the file.
+-b|--baseline <file> Compare results with the ones in the file. Exits with 1
+                   if a benchmark is slower than the threshold.
+--threshold <ratio> Slowdown reported as regression. (Default: %s)
+--repeat <N>       Number of timed runs; the best one counts. (Default: %i)
+--min-time <sec>   Minimum duration of a timed run. (Default: %s)
+-l|--list          List benchmarks.
+""" % (sys.argv[0], benchlib.THRESHOLD, benchlib.REPEAT, benchlib.MIN_TIME)
+
+def main(argv):
+    try:
+        opts, _ = getopt.getopt(argv[1:], 'qf:o:b:lh',
+                                ['quick', 'filter=', 'output=', 'baseline=',
+                                 'threshold=', 'repeat=', 'min-time=', 'list',
+                                 'help'])
+    except getopt.GetoptError, e:
+        sys.stderr.write('%s\n%s' % (str(e), usage))
+        return 2
+    quick = False
+    pattern = None
+    output = None
+    baseline = None
+    threshold = benchlib.THRESHOLD
+    repeat = benchlib.REPEAT
+    min_time = benchlib.MIN_TIME
+    listonly = False
+    try:
+        for o, v in opts:
+            if o in ('-q', '--quick'):
+                quick = True
+            elif o in ('-f', '--filter'):
+                pattern = v
+            elif o in ('-o', '--output'):
+                output = v
+            elif o in ('-b', '--baseline'):
+                baseline = v
+            elif o == '--threshold':
+                threshold = float(v)
+            elif o == '--repeat':
+                repeat = int(v)
+            elif o == '--min-time':
+                min_time = float(v)
+            elif o in ('-l', '--list'):
+                listonly = True
+            elif o in ('-h', '--help'):
+                sys.stdout.write(usage)
+                return 0
+    except ValueError, e:
+        sys.stderr.write('%s\n%s' % (str(e), usage))
+        return 2
+
+    benchmarks = []
+    for name in SUITES:
+        benchmarks.extend(__import__(name).benchmarks(quick))
+    if listonly:
+        for name, _ in benchmarks:
+            sys.stdout.write('%s\n' % name)
+        return 0
+
+    if baseline:
+        try:
+            base = benchlib.load(baseline)
+        except (IOError, ValueError, SyntaxError), e:
+            sys.stderr.write('Failed reading baseline %s. %s\n' % (baseline,
+                                                                   str(e)))
+            return 2
+
+    sys.stdout.write('%-50s %12s %12s %9s\n' % ('benchmark', 'min', 'median',
+                                               'calls'))
+    results = benchlib.run_benchmarks(benchmarks, pattern, min_time, repeat)
+    if output:
+        benchlib.save(output, results)
+    if baseline:
+        sys.stdout.write('\n%-50s %12s %12s %8s\n' % ('benchmark', 'baseline',
+                                                     'current', 'ratio'))
+        if benchlib.compare(results, base, threshold):
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -25,15 +25,20 @@
 
 """
 Provides `ErrorsMatching` class to work with gLite m/w CLI&API errors DB.
+
+`get_errors_matching()` - process-wide cache of `ErrorsMatching` objects.
 """
 
 __docformat__ = 'restructuredtext en'
 
 import ConfigParser
+import os
 import re
+import threading
 
 __all__ = ['ErrorsMatching',
-           'ErrErrorsMatchingDictIntegrity']
+           'ErrErrorsMatchingDictIntegrity',
+           'get_errors_matching']
 
 class ErrErrorsMatchingDictIntegrity(Exception):
     def __init__(self, expression, message):
@@ -125,6 +130,9 @@ class ErrorsMatching:
     _defaultstatus = 'CRITICAL'
     _errtopics = []
 
+    _maxgroups = 99
+    "maximum number of groups in a combined regular expression."
+
     def __init__(self, errdb, errtopics=[]):
         """Initialize `ErrorsMatching` object.
 
@@ -217,17 +225,82 @@ class ErrorsMatching:
         return True
 
     def _re_compile(self):
-        """Compile regular expressions."""
+        """Compile regular expressions.
 
-        for topic in self._errdict.keys():
-            for opt in self._errdict[topic].keys():
-                if not opt.endswith(self._statpattern):
-                    self._errdict[topic][opt] = \
-                        re.compile(".*("+self._errdict[topic][opt]+").*", re.I)
+        Matching is case insensitive. Instead of ``re.I``, which disables
+        the literal prefix search optimisations of `re`, patterns (except
+        regex syntax, see `_lower_re()`) and the matched strings are lower
+        cased.
+
+        Besides the per option regular expressions, builds combined ones
+        (see `_combine()`) for all options of the loaded topics. Topics are
+        taken in the order they were requested and options in alphabetical
+        order.
+        """
+        self._entries = []
+        topics = []
+        for t in self._errtopics:
+            if self._errdict.has_key(t) and not t in topics:
+                topics.append(t)
+        for topic in topics:
+            opts = [o for o in self._errdict[topic].keys()
+                        if not o.endswith(self._statpattern)]
+            opts.sort()
+            for opt in opts:
+                self._errdict[topic][opt] = \
+                    re.compile("("+_lower_re(self._errdict[topic][opt])+")")
+                self._entries.append((topic, opt))
+        self._matchers = self._combine(self._entries)
+
+    def _combine(self, entries):
+        """Combine regular expressions of the given options. Python's `re`
+        limits the number of groups in a pattern, so, several combined
+        expressions may be built. Each one comes as a pair:
+
+          - alternation of all the options' patterns without extra groups -
+            to find the leftmost match fast;
+          - alternation of the patterns as named groups - to find out which
+            option matched at the found position.
+
+        :param entries: list of (topic, option).
+        :return: list of (search regexp, identifying regexp,
+            [(group name, topic, option),..])
+        :rtype: `list`
+        """
+        matchers = []
+        plain = []
+        alts = []
+        names = []
+        ngroups = 0
+        for i in range(len(entries)):
+            topic, opt = entries[i]
+            rx = self._errdict[topic][opt]
+            if alts and ngroups + rx.groups + 1 > self._maxgroups:
+                matchers.append((re.compile('|'.join(plain)),
+                                 re.compile('|'.join(alts)), names))
+                plain = []
+                alts = []
+                names = []
+                ngroups = 0
+            name = 'e%i' % i
+            plain.append(rx.pattern[1:-1])
+            alts.append('(?P<%s>%s)' % (name, rx.pattern))
+            names.append((name, topic, opt))
+            ngroups += rx.groups + 1
+        if alts:
+            matchers.append((re.compile('|'.join(plain)),
+                             re.compile('|'.join(alts)), names))
+        return matchers
 
     def match(self, mstr, matchall=False):
         """Match regular expression against a given (multi-line) string
 
+        The string is scanned with the combined regular expressions. The
+        first match is the error found earliest in the string (on the same
+        position - the one of the topic requested first). With `matchall`
+        the scan is resumed from the position of the last match with the
+        already matched options left out, until no more options match.
+
         :param mstr: (multi-line) string to find a matching pattern in.
         :type mstr: `str`
         :param matchall: traverse all Errors DB? (default: `False` (return first match))
@@ -239,13 +312,126 @@ class ErrorsMatching:
            - otherwise, list of tuples ``[(topic, option, status),...]``
         :rtype: `list` of `tuple`
         """
+        s = mstr.replace('\n',' ').lower()
         ret = []
-        for topic in self._errdict.keys():
-            for opt in self._errdict[topic].keys():
-                if not opt.endswith(self._statpattern):
-                    if self._errdict[topic][opt].match(mstr.replace('\n',' ')):
-                        if not matchall:
-                            return [(topic, opt, self._errdict[topic][opt+self._statpattern])]
-                        else:
-                            ret.append((topic, opt, self._errdict[topic][opt+self._statpattern]))
+        reported = {}
+        # next not yet reported hit per combined expression; only the one
+        # which yielded the reported option needs to be searched again.
+        hits = [self._next_hit(s, 0, m, reported) for m in self._matchers]
+        while True:
+            first = None
+            for i in range(len(hits)):
+                if hits[i] and (first is None or hits[i][0] < hits[first][0]):
+                    first = i
+            if first is None:
+                break
+            start, topic, opt = hits[first]
+            ret.append((topic, opt, self._errdict[topic][opt+self._statpattern]))
+            if not matchall:
+                break
+            reported[(topic, opt)] = 1
+            hits[first] = self._next_hit(s, start, self._matchers[first],
+                                         reported)
         return ret
+
+    def _next_hit(self, s, pos, matcher, reported):
+        """Find leftmost match of options of one combined expression
+        starting from `pos` leaving out already reported options.
+
+        :param matcher: (search regexp, identifying regexp, names) as
+            built by `_combine()`.
+        :param reported: ``{(topic, option) : 1}``
+        :return: (position, topic, option) or `None`.
+        """
+        rxsearch, rxident, names = matcher
+        skip = False
+        for name, topic, opt in names:
+            if reported.has_key((topic, opt)):
+                skip = True
+                break
+        while True:
+            m = rxsearch.search(s, pos)
+            if not m:
+                return None
+            start = m.start()
+            if not skip:
+                m = rxident.match(s, start)
+                for name, topic, opt in names:
+                    if m.group(name) is not None:
+                        return start, topic, opt
+            for name, topic, opt in names:
+                if not reported.has_key((topic, opt)) and \
+                        self._errdict[topic][opt].match(s, start):
+                    return start, topic, opt
+            pos = start + 1
+
+def _lower_re(pattern):
+    """Lower case regular expression leaving regex syntax intact: escape
+    sequences (e.g. \\S) and headers of ``(?...)`` constructs - inline
+    flags, group names and references, comments - are copied as is."""
+    res = []
+    i = 0
+    n = len(pattern)
+    while i < n:
+        c = pattern[i]
+        if c == '\\':
+            res.append(pattern[i:i+2])
+            i += 2
+        elif c == '(' and pattern[i+1:i+2] == '?':
+            j = i + 2
+            if pattern[j:j+2] == 'P<':
+                j = pattern.find('>', j) + 1
+            elif pattern[j:j+2] == 'P=' or pattern[j:j+1] in ('#', '('):
+                j = pattern.find(')', j) + 1
+            else:
+                while j < n and pattern[j] in 'iLmsux':
+                    j += 1
+            if j <= i:
+                # unterminated; let re.compile() complain
+                j = n
+            res.append(pattern[i:j])
+            i = j
+        else:
+            res.append(c.lower())
+            i += 1
+    return ''.join(res)
+
+_cache = {}
+"""cached `ErrorsMatching` objects
+``{(errdb, (topic,..)) : (mtime, size, ErrorsMatching)}``"""
+_cache_lock = threading.Lock()
+
+def get_errors_matching(errdb, errtopics=[]):
+    """Return `ErrorsMatching` object for given Errors DB file and topics.
+
+    Errors DB is loaded and its regular expressions compiled only once per
+    process. The cached object is rebuilt if modification time or size of
+    the file changes. If the file can't be stat()'ed, a new object is built
+    and not cached.
+
+    :param errdb: name of Errors DB file.
+    :type errdb: `str`
+    :param errtopics: topics for which errors should be read and compiled.
+    :type errtopics: list of `str`
+
+    :rtype: `ErrorsMatching`
+    """
+    try:
+        path = os.path.abspath(errdb)
+        st = os.stat(path)
+    except (OSError, TypeError):
+        return ErrorsMatching(errdb, list(errtopics))
+    key = (path, tuple(errtopics))
+    _cache_lock.acquire()
+    try:
+        try:
+            mtime, size, em = _cache[key]
+            if mtime == st.st_mtime and size == st.st_size:
+                return em
+        except KeyError:
+            pass
+        em = ErrorsMatching(path, list(errtopics))
+        _cache[key] = (st.st_mtime, st.st_size, em)
+        return em
+    finally:
+        _cache_lock.release()
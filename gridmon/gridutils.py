@@ -29,21 +29,31 @@ Grid utility functions for `gridmon` package.
 import os
 import sys
 import re
+import time
+import zlib
 import commands
 
 from gridmon import utils as samutils
+from gridmon import ldif
+from gridmon import ldapclient
+from gridmon.threadpool import WorkerPool
+from gridmon.security.proxy import load_proxy, proxy_path, ErrProxy
 
 __all__ = ['gfal_ver_ge',
            'lcg_util_ver_ge',
            'cmp_version_ge',
            'bdii_query',
+           'set_bdii_cache',
+           'set_ldap_state',
            'LDAP_QE_EMPTYSET',
            'LDAP_QE_LDAP',
            'LDAP_QE_TIMEOUT',
            'LDAP_QE_OTHER',
            'norm_voname_shell',
            'get_testing_DN',
-           'get_voms_fqans']
+           'get_voms_fqans',
+           'get_proxy_path',
+           'get_proxy_identity']
 
 def cmp_version_ge(v, cmd, prefix):
     """Check if installed version is >= to a given one.
@@ -121,6 +131,9 @@ def get_lcg_util_gfal_ver():
 """
 BDII over LDAP:
 - query_bdii() - BDII query.
+- set_bdii_cache() - share successful query results between processes.
+- get_working_ldap() - select working LDAP endpoint.
+- set_ldap_state() - persist working and failed LDAP endpoints.
 """
 try:
     import ldap
@@ -128,6 +141,9 @@ try:
 except ImportError:
     LDAP_LIB = False
 LDAP_LIB = False
+# Without LDAP API use the built-in LDAP client (L{gridmon.ldapclient})
+# instead of forking ldapsearch (probes: --ldap-native).
+LDAP_NATIVE = False
 
 LDAP_TIMEOUT_NETWORK  = 20
 LDAP_TIMELIMIT_SEARCH = 20
@@ -142,12 +158,149 @@ LDAP_QE_LDAP     = 1
 LDAP_QE_TIMEOUT  = 2
 LDAP_QE_OTHER    = 7
 
+# On-disk cache of query_bdii() results (disabled if directory is not set)
+BDII_CACHE_TTL = 300
+__bdii_cache = {'dir' : None,
+                'ttl' : BDII_CACHE_TTL}
+
+def set_bdii_cache(directory, ttl=BDII_CACHE_TTL):
+    """Cache successful results of L{query_bdii()} in C{directory} for
+    C{ttl} seconds. Entries are written atomically, so that the cache can
+    be shared by concurrent processes of the user. Errors (including empty
+    results) are never cached. Entries are stored with
+    L{samutils.dump_data()}; files not owned by the user are ignored.
+
+    @param directory: cache directory (created with mode 0700 if needed);
+        C{None} disables the cache.
+    @type directory: L{str}
+    @param ttl: time to live of cache entries in seconds.
+    @type ttl: L{int}
+    """
+    __bdii_cache['dir'] = directory
+    __bdii_cache['ttl'] = ttl
+
+# Last working and recently failed LDAP endpoints as seen by
+# get_working_ldap(). Kept in memory and, if file is set, on disk.
+LDAP_BACKOFF = 300
+LDAP_PROBE_WORKERS = 10
+__ldap_state = {'file'    : None,
+                'backoff' : LDAP_BACKOFF,
+                'good'    : None,
+                'failed'  : {}}
+
+def set_ldap_state(path, backoff=LDAP_BACKOFF):
+    """Persist last working and recently failed LDAP endpoints in C{path},
+    so that L{get_working_ldap()} called by other processes of the user tries
+    the working endpoint first and skips failed ones for C{backoff} seconds.
+    The state is stored with L{samutils.dump_data()}; a file not owned by
+    the user is ignored.
+
+    @param path: state file; C{None} - keep state in memory only.
+    @type path: L{str}
+    @param backoff: seconds a failed endpoint is skipped for.
+    @type backoff: L{int}
+    """
+    __ldap_state['file'] = path
+    __ldap_state['backoff'] = backoff
+
+def __ldap_state_load():
+    path = __ldap_state['file']
+    if not path:
+        return
+    data = samutils.read_own_file(path)
+    if data is None:
+        return
+    try:
+        good, failed = samutils.load_data(data)
+    except (ValueError, TypeError):
+        return
+    if not (good is None or isinstance(good, str)) or \
+            not isinstance(failed, dict):
+        return
+    for k, v in failed.items():
+        if not (isinstance(k, str) and isinstance(v, tuple) and len(v) == 2):
+            return
+    __ldap_state['good'] = good
+    __ldap_state['failed'] = failed
+
+def __ldap_state_save():
+    now = time.time()
+    failed = __ldap_state['failed']
+    for k, v in failed.items():
+        if now - v[0] >= __ldap_state['backoff']:
+            del failed[k]
+    path = __ldap_state['file']
+    if not path:
+        return
+    tmp = '%s.%i' % (path, os.getpid())
+    try:
+        fd = os.open(tmp, os.O_WRONLY|os.O_CREAT|os.O_TRUNC, 0600)
+        os.write(fd, samutils.dump_data((__ldap_state['good'], failed)))
+        os.close(fd)
+        os.rename(tmp, path)
+    except (OSError, IOError):
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+
+def __bdii_cache_file(key):
+    k = repr(key)
+    return os.path.join(__bdii_cache['dir'], 'bdii.%08x%08x' % \
+                        (zlib.crc32(k) & 0xffffffffL,
+                         zlib.adler32(k) & 0xffffffffL))
+
+def __bdii_cache_get(key):
+    "Cached entries for C{key} or C{None}."
+    path = __bdii_cache_file(key)
+    try:
+        if time.time() - os.stat(path).st_mtime >= __bdii_cache['ttl']:
+            return None
+    except OSError:
+        return None
+    data = samutils.read_own_file(path)
+    if data is None:
+        return None
+    try:
+        k, entries = samutils.load_data(data)
+    except (ValueError, TypeError):
+        return None
+    if k != key or not isinstance(entries, list):
+        return None
+    return entries
+
+def __bdii_cache_put(key, entries):
+    "Store C{entries}. Write to a temporary file and rename into place."
+    path = __bdii_cache_file(key)
+    tmp = '%s.%i' % (path, os.getpid())
+    try:
+        data = samutils.dump_data((key, entries))
+    except ValueError:
+        # not plain data
+        return
+    try:
+        if not os.path.isdir(__bdii_cache['dir']):
+            os.makedirs(__bdii_cache['dir'], 0700)
+        if os.stat(__bdii_cache['dir']).st_uid != os.getuid():
+            return
+        fd = os.open(tmp, os.O_WRONLY|os.O_CREAT|os.O_TRUNC, 0600)
+        os.write(fd, data)
+        os.close(fd)
+        os.rename(tmp, path)
+    except (OSError, IOError):
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+
 def query_bdii(ldap_filter, ldap_attrlist, ldap_url='', ldap_base='o=grid',
                ldap_timelimit=LDAP_TIMELIMIT_SEARCH,
-               net_timeout=LDAP_TIMEOUT_NETWORK):
+               net_timeout=LDAP_TIMEOUT_NETWORK, lazy=False):
     """Query BDII (LDAP based).
 
-    Depending on availability uses either LDAP API or CLI.
+    Depending on availability uses either LDAP API, built-in LDAP client
+    (see L{LDAP_NATIVE}) or CLI. If enabled with L{set_bdii_cache()},
+    successful results are shared through on-disk cache.
 
     @param ldap_filter: non-empty filter.
     @type ldap_filter: L{str}
@@ -160,6 +313,11 @@ def query_bdii(ldap_filter, ldap_attrlist, ldap_url='', ldap_base='o=grid',
     @type ldap_timelimit: L{int}
     @param net_timeout: connection timeout (default: L{LDAP_TIMEOUT_NETWORK}).
     @type net_timeout: L{int}
+    @param lazy: on success return an iterator over entries instead of a
+      list. With CLI entries are parsed while C{ldapsearch} runs and the
+      iterator raises L{gridmon.ldif.ErrLDIF} if it fails in the middle.
+      Not stored in the cache.
+    @type lazy: L{bool}
 
     @return:
       - on success:
@@ -186,6 +344,16 @@ def query_bdii(ldap_filter, ldap_attrlist, ldap_url='', ldap_base='o=grid',
 
     ldaps = ldap_url and ldap_url.split(',') or \
                               samutils.get_env('LCG_GFAL_INFOSYS').split(',')
+
+    key = None
+    if __bdii_cache['dir']:
+        key = (','.join(ldaps), ldap_base, ldap_filter, ldap_attrlist)
+        entries = __bdii_cache_get(key)
+        if entries is not None:
+            if lazy:
+                return 1, iter(entries)
+            return 1, entries
+
     try:
         ldap_url = get_working_ldap(ldaps) # IP address
     except (TypeError, ValueError, LookupError), e:
@@ -193,14 +361,24 @@ def query_bdii(ldap_filter, ldap_attrlist, ldap_url='', ldap_base='o=grid',
                    'Failed to get working BDII from [%s].' % ','.join(ldaps), str(e))
     try:
         if LDAP_LIB:
-            return __ldap_API(ldap_filter, ldap_attrlist, ldap_url,
+            res = __ldap_API(ldap_filter, ldap_attrlist, ldap_url,
                                  ldap_base, ldap_timelimit, net_timeout)
+            if lazy and res[0]:
+                res = (1, iter(res[1]))
+        elif LDAP_NATIVE:
+            res = __ldap_native(ldap_filter, ldap_attrlist, ldap_url,
+                                ldap_base, ldap_timelimit, net_timeout)
+            if lazy and res[0]:
+                res = (1, iter(res[1]))
         else:
-            return __ldap_CLI(ldap_filter, ldap_attrlist, ldap_url,
-                                 ldap_base, ldap_timelimit, net_timeout)
+            res = __ldap_CLI(ldap_filter, ldap_attrlist, ldap_url,
+                                 ldap_base, ldap_timelimit, net_timeout, lazy)
     except Exception, e:
         return 0, (LDAP_QE_OTHER, 'Exception while querying BDII [%s]' % ldap_url,
                    str(e))
+    if key and res[0] and not lazy:
+        __bdii_cache_put(key, res[1])
+    return res
 
 def __ldap_API(ldap_filter, ldap_attrlist, ldap_url, ldap_base, ldap_timelimit,
                                                                  net_timetout):
@@ -245,9 +423,37 @@ def __ldap_API(ldap_filter, ldap_attrlist, ldap_url, ldap_base, ldap_timelimit,
                                                ldap_filter, ldap_base)
     return (1, entries)
 
+def __ldap_native(ldap_filter, ldap_attrlist, ldap_url, ldap_base,
+                  ldap_timelimit, net_timeout):
+    """Query LDAP using built-in client. Connection to the endpoint is kept
+    for subsequent queries.
+
+    For signature see L{query_bdii()}
+    """
+    try:
+        l = ldapclient.get_connection(to_full_ldap_url(ldap_url), net_timeout)
+        l.timeout = net_timeout
+        entries = l.search(ldap_base, ldap_filter, ldap_attrlist,
+                           timelimit=ldap_timelimit)
+    except ldapclient.ErrLDAP, e:
+        if e.code in (ldapclient.TIME_LIMIT_EXCEEDED, ldapclient.TIMEOUT):
+            stsmsg = detmsg = 'LDAP search timed out after %i sec. %s' % \
+                (ldap_timelimit, samutils.ldap_url2hostname_ip(ldap_url))
+            return (0, (LDAP_QE_TIMEOUT, stsmsg, detmsg))
+        stsmsg = detmsg = 'LDAPError: %s %s' % (
+                                samutils.ldap_url2hostname_ip(ldap_url),
+                                e.desc)
+        return (0, (LDAP_QE_LDAP, stsmsg, detmsg))
+
+    if len(entries) == 0:
+        return __return_query_failed_emtpy_set(ldap_url, ldap_attrlist,
+                                               ldap_filter, ldap_base)
+    return (1, entries)
+
 def __ldap_CLI(ldap_filter, ldap_attrlist, ldap_url, ldap_base, ldap_timelimit,
-                                                                 net_timetout):
-    """Query LDAP using CLI.
+                                                      net_timetout, lazy=False):
+    """Query LDAP using CLI. Output of C{ldapsearch} is parsed as it arrives
+    with L{gridmon.ldif}.
 
     For signature see L{query_bdii()}
     """
@@ -266,53 +472,35 @@ def __ldap_CLI(ldap_filter, ldap_attrlist, ldap_url, ldap_base, ldap_timelimit,
             (ldap_timelimit, bdii, ldap_base, ldap_filter,
              ' '.join([x for x in ldap_attrlist]))
 
-    res = ''
+    search = None
     try:
-        rc,res = commands.getstatusoutput(cmd)
+        search = ldif.LDIFCommand(cmd)
+        if not search.prime():
+            return __return_query_failed_emtpy_set(ldap_url, ldap_attrlist,
+                                                   ldap_filter, ldap_base)
+        if lazy:
+            return (1, search)
+        return (1, list(search))
     except ErrLDAPTimeout:
+        if search:
+            search.close()
         stsmsg = detmsg = 'LDAP search timed out after %i sec. %s' % \
                 (ldap_timelimit, bdii)
         return (0, (LDAP_QE_TIMEOUT, stsmsg, detmsg))
+    except ldif.ErrLDIF, e:
+        if search.returncode:
+            stsmsg = '%s %s %i' % ((search.errors or search.output).strip(),
+                                   bdii, search.returncode)
+        else:
+            stsmsg = '%s %s' % (str(e), bdii)
+        detmsg = '%s\n%s' % (cmd, stsmsg)
+        return (0, (LDAP_QE_LDAP, stsmsg, detmsg))
     except StandardError,e:
+        if search:
+            search.close()
         stsmsg = '%s %s' % (str(e).strip(), bdii)
         detmsg = '%s\n%s' % (cmd, stsmsg)
         return (0, (LDAP_QE_LDAP, stsmsg, detmsg))
-    else:
-        rc = os.WEXITSTATUS(rc)
-        if rc != 0:
-            stsmsg = '%s %s %i' % (res, bdii, rc)
-            detmsg = '%s\n%s' % (cmd, stsmsg)
-            return (0, (LDAP_QE_LDAP, stsmsg, detmsg))
-
-    if res:
-        # remove line foldings made by ldapsearch
-        res = res.replace('\n ','').strip()
-        entries = []
-        res = res.split('dn: ')
-        # loop through values in "dn:"
-        for dn in res:
-            if dn:
-                dl = dn.splitlines()
-                # remove empty lines
-                for i,v in enumerate(dl):
-                    if not v:
-                        del dl[i]
-                # make dict key/value pairs out
-                # of Glue "Attribute: Value" pairs
-                d = {}
-                for x in dl[1:]:
-                    t = x.split(':', 1)
-                    t[0] = t[0].strip()
-                    t[1] = t[1].strip()
-                    if d.has_key(t[0]):
-                        d[t[0]].append(t[1])
-                    else:
-                        d[t[0]] = [t[1]]
-                entries.append((dl[0], d))
-        return (1, (entries))
-    else:
-        return __return_query_failed_emtpy_set(ldap_url, ldap_attrlist,
-                                               ldap_filter, ldap_base)
 
 def __return_query_failed_emtpy_set(ldap_url, ldap_attrlist, ldap_filter, ldap_base):
     """Formatted output on empty set returned by a query."""
@@ -327,7 +515,11 @@ def get_working_ldap(ldaps, net_timeout=LDAP_TIMEOUT_NETWORK):
     """Test given list of LDAP servers and return a first working one as IP
     address.
 
-    Depending on availability uses either LDAP API or CLI.
+    Depending on availability uses LDAP API, built-in client or CLI. The
+    endpoint that worked last time is tried first. If it fails, IPs of all
+    endpoints are tried concurrently and the first one to respond is
+    returned. Endpoints failed within the backoff window (see
+    L{set_ldap_state()}) are skipped, unless all of them failed.
 
     @param  ldaps: list of LDAP endpoints (ldap://<hostname>:[<port>]).
     @type ldaps: L{list}
@@ -360,32 +552,118 @@ def get_working_ldap(ldaps, net_timeout=LDAP_TIMEOUT_NETWORK):
             raise ValueError('List of empty LDAP endpoints given (%s()).' % \
                              sys._getframe(0).f_code.co_name)
     failed_ldaps = {}
-    for ldap_url in ldaps:
-        proto, hostname, port = samutils.parse_uri3(ldap_url)
-        try:
-            ips = samutils.dns_lookup_forward(hostname)
-        except IOError, e:
+    candidates = []
+    urls = [x for x in ldaps if x]
+    endpoints = [samutils.parse_uri3(x) for x in urls]
+    # resolve all hostnames concurrently
+    resolved = samutils.dns_lookup_forward_many([x[1] for x in endpoints])
+    for ldap_url, (proto, hostname, port) in zip(urls, endpoints):
+        ips = resolved[hostname]
+        if isinstance(ips, ValueError):
+            raise ips
+        if isinstance(ips, IOError):
             # Forward DNS resolution failed. Continue with the next host.
-            failed_ldaps[ldap_url] = str(e)
+            failed_ldaps[ldap_url] = str(ips)
             continue
-        else:
-            for ip in ips:
-                ldap_url_ip = '%s%s:%s' %(proto or '', ip, port)
-                if LDAP_LIB:
-                    rc, error = __ldap_bind_API(ldap_url_ip, net_timeout)
-                    if rc:
-                        return ldap_url_ip
-                else:
-                    rc, error = __ldap_bind_CLI(ldap_url_ip, net_timeout)
-                    if rc:
-                        return ldap_url_ip
-                host_ip = samutils.ldap_url2hostname_ip(ldap_url_ip)
-                failed_ldaps[host_ip] = error
+        for ip in ips:
+            candidates.append('%s%s:%s' %(proto or '', ip, port))
+
+    __ldap_state_load()
+    now = time.time()
+    good = __ldap_state['good']
+    failed = __ldap_state['failed']
+    backoff = __ldap_state['backoff']
+
+    # the last working endpoint alone (unless it failed recently), then all
+    # others (but the ones that failed recently) concurrently; if all failed
+    # recently - all of them
+    first = []
+    if good in candidates and \
+            not (good in failed and now - failed[good][0] < backoff):
+        first = [good]
+        candidates.remove(good)
+    rest = []
+    skipped = []
+    for c in candidates:
+        try:
+            if now - failed[c][0] < backoff:
+                skipped.append(c)
+                continue
+        except KeyError:
+            pass
+        rest.append(c)
+    if not rest:
+        rest = skipped
+        skipped = []
+
+    working = None
+    for batch in [first, rest]:
+        if not batch:
+            continue
+        working, failures = __ldap_bind_first(batch, net_timeout)
+        for url, error in failures:
+            failed[url] = (time.time(), error)
+            if url == __ldap_state['good']:
+                __ldap_state['good'] = None
+            failed_ldaps[samutils.ldap_url2hostname_ip(url)] = error
+        if working:
+            break
+    for c in skipped:
+        failed_ldaps[samutils.ldap_url2hostname_ip(c)] = \
+            'skipped; failed %i sec ago: %s' % (now - failed[c][0], failed[c][1])
+
+    if working:
+        __ldap_state['good'] = working
+        try:
+            del failed[working]
+        except KeyError:
+            pass
+    __ldap_state_save()
+    if working:
+        return working
+
     msg = ''
     for k,v in failed_ldaps.items():
         msg = '%s* %s: %s' % (msg and msg+'\n' or '', k, v)
     raise LookupError(msg)
 
+def __ldap_bind(url, net_timeout):
+    if LDAP_LIB:
+        return __ldap_bind_API(url, net_timeout)
+    elif LDAP_NATIVE:
+        return __ldap_bind_native(url, net_timeout)
+    else:
+        return __ldap_bind_CLI(url, net_timeout)
+
+def __ldap_bind_first(urls, net_timeout):
+    """Bind to C{urls} concurrently till the first one succeeds.
+
+    @return: (first working URL or C{None}, list of (URL, error) of failed
+        ones)
+    @rtype: L{tuple}
+    """
+    failures = []
+    if len(urls) == 1:
+        rc, error = __ldap_bind(urls[0], net_timeout)
+        if rc:
+            return urls[0], failures
+        return None, [(urls[0], error)]
+    pool = WorkerPool(min(len(urls), LDAP_PROBE_WORKERS))
+    try:
+        for url in urls:
+            pool.submit(url, __ldap_bind, (url, net_timeout))
+        while pool.pending():
+            url, res, exc = pool.get_result()
+            if exc:
+                failures.append((url, str(exc[1])))
+            elif res[0]:
+                return url, failures
+            else:
+                failures.append((url, res[1]))
+    finally:
+        pool.shutdown()
+    return None, failures
+
 def __ldap_bind_API(url, net_timeout, who='', cred=''):
     """Bind to LDAP using API.
 
@@ -408,6 +686,28 @@ def __ldap_bind_API(url, net_timeout, who='', cred=''):
         return 0, 'LDAPError: %s' % e[0]['desc']
     return 1, ''
 
+def __ldap_bind_native(url, net_timeout):
+    """Bind to LDAP using built-in client. The connection is kept for
+    subsequent queries.
+
+    @param url: LDAP URI (ldap://<hostname>:[<port>]).
+    @type url: L{str}
+    @param net_timeout: network timeout
+    @type net_timeout: L{int}
+
+    @return:
+      - on success: C{(1, '')}
+      - on failure: C{(0, 'error message')}
+    @rtype: L{tuple}
+    """
+    try:
+        l = ldapclient.get_connection(to_full_ldap_url(url), net_timeout)
+        l.timeout = net_timeout
+        l.bind()
+    except ldapclient.ErrLDAP, e:
+        return 0, 'LDAPError: %s' % e.desc
+    return 1, ''
+
 def __ldap_bind_CLI(url, net_timeout):
     """Bind to LDAP using CLI.
 
@@ -454,22 +754,43 @@ def to_full_bdii_url(url, port='2170'):
         hp[1] = port
     return '%s:%s' % (hp[0], hp[1])
 
-def check_x509_user_proxy():
+def check_x509_user_proxy(min_time_left=None):
     """Check if C{X509_USER_PROXY} is defined and we can open the file.
     If one of the conditions is not satisfied, exit with 3 (Nagios UNKNOWN)
     and print Nagios compliant summary and details message to stdout.
 
+    @param min_time_left: if given, also decode the proxy and require it
+        to be valid for at least that many seconds.
+    @type min_time_left: L{int}
+
     @return: L{True} if C{X509_USER_PROXY} file can be opened or exit programm.
     @rtype: L{bool}
     """
     try:
         os.stat(os.environ['X509_USER_PROXY'])
         open(os.environ['X509_USER_PROXY']).close()
-        return True
     except (OSError, IOError), e:
         sys.stdout.write("UNKNOWN: certificate file error: %s\n"% e)
         sys.stdout.write("UNKNOWN: certificate file error: %s\n"% e)
         sys.exit(3)
+    if min_time_left is None:
+        return True
+    try:
+        left = load_proxy(os.environ['X509_USER_PROXY']).time_left()
+    except ErrProxy, e:
+        sys.stdout.write("UNKNOWN: certificate file error: %s\n"% e)
+        sys.stdout.write("UNKNOWN: certificate file error: %s\n"% e)
+        sys.exit(3)
+    if left < min_time_left:
+        if left < 0:
+            msg = "proxy expired %i sec ago" % -left
+        else:
+            msg = "proxy is valid for %i sec only" % left
+        sys.stdout.write("UNKNOWN: %s\n" % msg)
+        sys.stdout.write("UNKNOWN: %s (required: %i sec)\n" % \
+                             (msg, min_time_left))
+        sys.exit(3)
+    return True
 
 
 ########################################
@@ -488,22 +809,105 @@ def norm_voname_shell(vo):
         von = von.replace(c,'_')
     return von
 
-def get_testing_DN():
-    'DN of testing proxy.'
-    rc, o = commands.getstatusoutput('voms-proxy-info -subject')
+def __DN(rc, o):
     if rc == 0:
         return o
     else:
         return "couldn't determine DN (%s)" % o
 
+def __fqans(rc, o):
+    if rc == 0:
+        return o.strip('\n').split('\n')
+    else:
+        return ["couldn't determine VOMS FQANs (%s)" % o]
+
+def get_testing_DN():
+    'DN of testing proxy. Read with L{gridmon.security.proxy}.'
+    try:
+        return load_proxy().subject
+    except ErrProxy, e:
+        return __DN(1, str(e))
+
 def get_voms_fqans():
-    """List of VOMS FQANs.
+    """List of VOMS FQANs. Read with L{gridmon.security.proxy}.
 
     @return: VOMS FQANs.
     @rtype: L{list} of L{str}
     """
-    rc, o = commands.getstatusoutput('voms-proxy-info -fqan')
-    if rc == 0:
-        return o.strip('\n').split('\n')
-    else:
-        return ["couldn't determine VOMS FQANs (%s)" % o]
+    try:
+        return __proxy_fqans(load_proxy())
+    except ErrProxy, e:
+        return __fqans(1, str(e))
+
+def __proxy_fqans(p):
+    "FQANs of decoded proxy C{p}; a note if it has no VOMS attributes."
+    if p.fqans:
+        return p.fqans
+    return __fqans(1, 'VOMS extension not found in %s' % p.path)
+
+def get_proxy_path():
+    """Path to user proxy: C{X509_USER_PROXY} or C{/tmp/x509up_u<uid>}.
+
+    @rtype: L{str}
+    """
+    return proxy_path()
+
+def __proxy_cache_key(path):
+    "Identifies a proxy file; changes when the proxy is renewed."
+    st = os.stat(path)
+    return '%s:%i:%i:%i' % (os.path.abspath(path), st.st_ino,
+                            int(st.st_mtime), st.st_size)
+
+def get_proxy_identity(cachedir=None):
+    """DN and VOMS FQANs of the testing proxy as given by C{get_testing_DN()}
+    and C{get_voms_fqans()}.
+
+    The proxy is decoded in-process. If that fails, C{voms-proxy-info} is
+    run. If C{cachedir} is given, identity obtained from C{voms-proxy-info}
+    is cached there in a file shared by all processes of the user. The cache
+    is keyed by path, inode, modification time and size of the proxy file,
+    so it is invalidated when the proxy is renewed. Failed lookups are not
+    cached.
+
+    @param cachedir: directory for the cache file; must exist.
+    @type cachedir: L{str}
+
+    @return: (DN, list of VOMS FQANs)
+    @rtype: L{tuple}
+    """
+    try:
+        p = load_proxy()
+        return p.subject, __proxy_fqans(p)
+    except ErrProxy:
+        pass
+
+    key = cachefile = None
+    if cachedir:
+        try:
+            key = __proxy_cache_key(get_proxy_path())
+            cachefile = os.path.join(cachedir,
+                                     '.proxy-identity.%i' % os.getuid())
+            lines = open(cachefile).read().split('\n')
+            if lines[0] == key and len(lines) > 2:
+                return lines[1], lines[2:]
+        except (OSError, IOError):
+            pass
+
+    rcdn, dn = commands.getstatusoutput('voms-proxy-info -subject')
+    rcfq, fqans = commands.getstatusoutput('voms-proxy-info -fqan')
+
+    if key and cachefile and rcdn == 0 and rcfq == 0:
+        # write and rename - readers see either old or new cache
+        tmp = '%s.%i' % (cachefile, os.getpid())
+        try:
+            fd = os.open(tmp, os.O_WRONLY|os.O_CREAT|os.O_TRUNC, 0600)
+            os.write(fd, '\n'.join([key, dn] + __fqans(rcfq, fqans)))
+            os.close(fd)
+            os.rename(tmp, cachefile)
+        except (OSError, IOError):
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+
+    return __DN(rcdn, dn), __fqans(rcfq, fqans)
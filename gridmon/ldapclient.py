@@ -0,0 +1,524 @@
+##############################################################################
+#
+# NAME:        ldapclient.py
+#
+# FACILITY:    SAM (Service Availability Monitoring)
+#
+# COPYRIGHT:
+#         Copyright (c) 2009, Members of the EGEE Collaboration.
+#         http://www.eu-egee.org/partners/
+#         Licensed under the Apache License, Version 2.0.
+#         http://www.apache.org/licenses/LICENSE-2.0
+#         This software is provided "as is", without warranties
+#         or conditions of any kind, either express or implied.
+#
+# DESCRIPTION:
+#
+#         Minimal LDAPv3 client: simple bind and search.
+#
+# AUTHORS:     SAM team, CERN
+#
+# CREATED:     16-Oct-2026
+#
+##############################################################################
+
+"""
+Minimal LDAPv3 client: simple bind and search.
+
+Implements the subset of LDAPv3 (RFC 4511) needed to query BDIIs: BER
+encoding of messages, simple (anonymous) bind, search with time and size
+limits and string filters (RFC 4515; extensible match is not supported),
+unbind. Search results are returned as ``(dn, {attribute: [values]})``
+tuples - as by ``python-ldap``.
+
+`get_connection()` returns `LDAPConnection` kept per endpoint for the life
+of the process; a broken kept connection is re-established once.
+"""
+
+__docformat__ = 'restructuredtext en'
+
+import errno
+import socket
+import threading
+
+__all__ = ['LDAPConnection',
+           'ErrLDAP',
+           'get_connection',
+           'parse_url',
+           'SCOPE_BASE',
+           'SCOPE_ONELEVEL',
+           'SCOPE_SUBTREE',
+           'SUCCESS',
+           'TIME_LIMIT_EXCEEDED',
+           'SIZE_LIMIT_EXCEEDED',
+           'NO_SUCH_OBJECT',
+           'SERVER_DOWN',
+           'TIMEOUT']
+
+LDAP_PORT = 389
+
+SCOPE_BASE = 0
+SCOPE_ONELEVEL = 1
+SCOPE_SUBTREE = 2
+
+# result codes
+SUCCESS = 0
+TIME_LIMIT_EXCEEDED = 3
+SIZE_LIMIT_EXCEEDED = 4
+NO_SUCH_OBJECT = 32
+# client side errors (as in python-ldap)
+SERVER_DOWN = -1
+TIMEOUT = -5
+
+_RESULTS = {0  : 'Success',
+            1  : 'Operations error',
+            2  : 'Protocol error',
+            3  : 'Time limit exceeded',
+            4  : 'Size limit exceeded',
+            7  : 'Authentication method not supported',
+            11 : 'Administrative limit exceeded',
+            32 : 'No such object',
+            34 : 'Invalid DN syntax',
+            48 : 'Inappropriate authentication',
+            49 : 'Invalid credentials',
+            50 : 'Insufficient access',
+            51 : 'Server is busy',
+            52 : 'Server is unavailable',
+            53 : 'Server is unwilling to perform',
+            80 : 'Other (e.g., implementation specific) error',
+            SERVER_DOWN : "Can't contact LDAP server",
+            TIMEOUT     : 'Timed out'}
+
+# BER tags
+_BOOLEAN = 0x01
+_INTEGER = 0x02
+_OCTET_STRING = 0x04
+_ENUMERATED = 0x0a
+_SEQUENCE = 0x30
+_SET = 0x31
+
+# protocol operations
+_BIND_REQUEST = 0x60
+_BIND_RESPONSE = 0x61
+_UNBIND_REQUEST = 0x42
+_SEARCH_REQUEST = 0x63
+_SEARCH_RESULT_ENTRY = 0x64
+_SEARCH_RESULT_DONE = 0x65
+_SEARCH_RESULT_REFERENCE = 0x73
+
+class ErrLDAP(StandardError):
+    """LDAP operation failed.
+
+    :ivar code: LDAP result code or client side error (`SERVER_DOWN`,
+        `TIMEOUT`).
+    :ivar desc: description of the error.
+    :ivar entries: entries received before the error (searches).
+    """
+    def __init__(self, code, desc='', entries=None):
+        self.code = code
+        if not desc:
+            desc = _RESULTS.get(code, 'LDAP error %s' % code)
+        self.desc = desc
+        self.entries = entries or []
+        StandardError.__init__(self, desc)
+
+# BER encoding
+
+def _len(n):
+    if n < 0x80:
+        return chr(n)
+    s = ''
+    while n:
+        s = chr(n & 0xff) + s
+        n = n >> 8
+    return chr(0x80 | len(s)) + s
+
+def _tlv(tag, value):
+    return chr(tag) + _len(len(value)) + value
+
+def _int(n, tag=_INTEGER):
+    s = ''
+    while True:
+        s = chr(n & 0xff) + s
+        n = n >> 8
+        if (n == 0 and not ord(s[0]) & 0x80) or \
+           (n == -1 and ord(s[0]) & 0x80):
+            break
+    return _tlv(tag, s)
+
+def _seq(items, tag=_SEQUENCE):
+    return _tlv(tag, ''.join(items))
+
+# BER decoding
+
+def _header(data, pos):
+    """Decode tag and length at `pos`.
+
+    :return: (tag, start of value, end of value) or `None` if `data` is
+        too short.
+    """
+    if len(data) < pos + 2:
+        return None
+    tag = ord(data[pos])
+    l = ord(data[pos+1])
+    pos += 2
+    if l & 0x80:
+        n = l & 0x7f
+        if n == 0 or n > 4:
+            raise ErrLDAP(2, 'Unsupported BER length encoding.')
+        if len(data) < pos + n:
+            return None
+        l = 0
+        for c in data[pos:pos+n]:
+            l = (l << 8) | ord(c)
+        pos += n
+    return tag, pos, pos + l
+
+def _items(data):
+    "List of (tag, value) of elements encoded in `data`."
+    res = []
+    pos = 0
+    while pos < len(data):
+        h = _header(data, pos)
+        if h is None or h[2] > len(data):
+            raise ErrLDAP(2, 'Truncated BER data.')
+        res.append((h[0], data[h[1]:h[2]]))
+        pos = h[2]
+    return res
+
+def _int_value(v):
+    n = 0
+    for c in v:
+        n = (n << 8) | ord(c)
+    if v and ord(v[0]) & 0x80:
+        n -= 1 << (8 * len(v))
+    return n
+
+# Filters (RFC 4515)
+
+def _unescape(s):
+    if not '\\' in s:
+        return s
+    res = []
+    i = 0
+    while i < len(s):
+        if s[i] == '\\':
+            try:
+                res.append(chr(int(s[i+1:i+3], 16)))
+            except ValueError:
+                raise ErrLDAP(87, 'Bad filter escape in %s.' % s)
+            i += 3
+        else:
+            res.append(s[i])
+            i += 1
+    return ''.join(res)
+
+def _filter_item(s):
+    "Encode filter item (without parentheses)."
+    i = s.find('=')
+    if i <= 0:
+        raise ErrLDAP(87, 'Bad filter item %s.' % s)
+    value = s[i+1:]
+    op = s[i-1]
+    if op in '~<>':
+        attr = s[:i-1]
+        tag = {'~' : 0xa8, '>' : 0xa5, '<' : 0xa6}[op]
+        return _seq([_tlv(_OCTET_STRING, attr),
+                     _tlv(_OCTET_STRING, _unescape(value))], tag)
+    if op == ':':
+        raise ErrLDAP(87, 'Extensible match filters are not supported.')
+    attr = s[:i]
+    if value == '*':
+        return _tlv(0x87, attr)
+    if not '*' in value:
+        return _seq([_tlv(_OCTET_STRING, attr),
+                     _tlv(_OCTET_STRING, _unescape(value))], 0xa3)
+    parts = value.split('*')
+    subs = []
+    if parts[0]:
+        subs.append(_tlv(0x80, _unescape(parts[0])))
+    for p in parts[1:-1]:
+        if p:
+            subs.append(_tlv(0x81, _unescape(p)))
+    if parts[-1]:
+        subs.append(_tlv(0x82, _unescape(parts[-1])))
+    return _seq([_tlv(_OCTET_STRING, attr), _seq(subs)], 0xa4)
+
+def _filter(s, pos):
+    """Encode filter starting with '(' at `pos`.
+
+    :return: (encoded filter, position after closing parenthesis)
+    """
+    if s[pos:pos+1] != '(':
+        raise ErrLDAP(87, 'Bad filter %s.' % s)
+    c = s[pos+1:pos+2]
+    if c in ('&', '|', '!'):
+        items = []
+        pos += 2
+        while s[pos:pos+1] == '(':
+            f, pos = _filter(s, pos)
+            items.append(f)
+        if s[pos:pos+1] != ')' or (c == '!' and len(items) != 1):
+            raise ErrLDAP(87, 'Bad filter %s.' % s)
+        tag = {'&' : 0xa0, '|' : 0xa1, '!' : 0xa2}[c]
+        return _seq(items, tag), pos + 1
+    end = s.find(')', pos)
+    if end < 0:
+        raise ErrLDAP(87, 'Bad filter %s.' % s)
+    return _filter_item(s[pos+1:end]), end + 1
+
+def encode_filter(s):
+    """BER encoding of string filter. Parentheses around a single item
+    may be omitted.
+
+    :raises `ErrLDAP`: on malformed filter.
+    """
+    s = s.strip()
+    if not s.startswith('('):
+        s = '(%s)' % s
+    f, pos = _filter(s, 0)
+    if pos != len(s):
+        raise ErrLDAP(87, 'Bad filter %s.' % s)
+    return f
+
+def parse_url(url):
+    """Host and port of ``ldap://host[:port]`` URL.
+
+    :rtype: `tuple`
+    """
+    if url.startswith('ldap://'):
+        url = url[len('ldap://'):]
+    url = url.split('/', 1)[0]
+    i = url.rfind(':')
+    if i < 0:
+        return url, LDAP_PORT
+    return url[:i], int(url[i+1:])
+
+class LDAPConnection(object):
+    """Connection to LDAP server. Connected (and bound anonymously) on
+    first use. Operations are serialised with a lock.
+    """
+    def __init__(self, host, port=LDAP_PORT, timeout=20):
+        """Initialise `LDAPConnection`.
+
+        :param host: LDAP server.
+        :param port: LDAP port.
+        :param timeout: network timeout in seconds.
+        """
+        self.host = host
+        self.port = int(port)
+        self.timeout = timeout
+        self.__sock = None
+        self.__buf = ''
+        self.__msgid = 0
+        self.__bound = None
+        "credentials of the last successful bind"
+        self.__lock = threading.Lock()
+
+    def __connect(self):
+        self.close()
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect((self.host, self.port))
+        except socket.timeout:
+            raise ErrLDAP(TIMEOUT, 'Timed out connecting to %s:%i.' % \
+                          (self.host, self.port))
+        except socket.error, e:
+            raise ErrLDAP(SERVER_DOWN, "Can't contact LDAP server %s:%i. %s" % \
+                          (self.host, self.port, str(e)))
+        self.__sock = sock
+        self.__buf = ''
+
+    def close(self):
+        "Close the connection (without unbind)."
+        if self.__sock is not None:
+            try:
+                self.__sock.close()
+            except socket.error:
+                pass
+        self.__sock = None
+        self.__bound = None
+
+    def __send(self, op):
+        self.__msgid += 1
+        msg = _seq([_int(self.__msgid), op])
+        try:
+            self.__sock.sendall(msg)
+        except socket.error, e:
+            self.close()
+            raise ErrLDAP(SERVER_DOWN, str(e))
+        return self.__msgid
+
+    def __recv(self, timeout):
+        """Read one LDAP message.
+
+        :return: (message ID, operation tag, operation value)
+        """
+        self.__sock.settimeout(timeout)
+        while True:
+            h = _header(self.__buf, 0)
+            if h is not None and h[2] <= len(self.__buf):
+                break
+            try:
+                d = self.__sock.recv(65536)
+            except socket.timeout:
+                self.close()
+                raise ErrLDAP(TIMEOUT)
+            except socket.error, e:
+                if e[0] == errno.EINTR:
+                    continue
+                self.close()
+                raise ErrLDAP(SERVER_DOWN, str(e))
+            if not d:
+                self.close()
+                raise ErrLDAP(SERVER_DOWN, 'Connection closed by %s:%i.' % \
+                              (self.host, self.port))
+            self.__buf += d
+        tag, s, e = h
+        msg = self.__buf[s:e]
+        self.__buf = self.__buf[e:]
+        items = _items(msg)
+        if tag != _SEQUENCE or len(items) < 2 or items[0][0] != _INTEGER:
+            self.close()
+            raise ErrLDAP(2, 'Malformed LDAP message.')
+        return _int_value(items[0][1]), items[1][0], items[1][1]
+
+    def __result(self, value):
+        "Raise `ErrLDAP` if LDAPResult in `value` isn't success."
+        items = _items(value)
+        code = _int_value(items[0][1])
+        if code != SUCCESS:
+            desc = _RESULTS.get(code, 'LDAP error %i' % code)
+            if len(items) > 2 and items[2][1]:
+                desc = '%s: %s' % (desc, items[2][1])
+            return code, desc
+        return SUCCESS, ''
+
+    def __bind(self, who, cred):
+        if self.__sock is None:
+            self.__connect()
+        msgid = self.__send(_seq([_int(3), _tlv(_OCTET_STRING, who),
+                                  _tlv(0x80, cred)], _BIND_REQUEST))
+        while True:
+            mid, tag, value = self.__recv(self.timeout)
+            if mid == msgid and tag == _BIND_RESPONSE:
+                break
+        code, desc = self.__result(value)
+        if code != SUCCESS:
+            raise ErrLDAP(code, desc)
+        self.__bound = (who, cred)
+
+    def bind(self, who='', cred=''):
+        """Simple bind (anonymous by default). Connects if needed.
+
+        :raises `ErrLDAP`: on failure.
+        """
+        self.__lock.acquire()
+        try:
+            self.__bind(who, cred)
+        finally:
+            self.__lock.release()
+
+    def __search(self, base, filter, attrs, scope, timelimit, sizelimit):
+        if self.__bound is None:
+            self.__bind('', '')
+        req = _seq([_tlv(_OCTET_STRING, base),
+                    _int(scope, _ENUMERATED),
+                    _int(0, _ENUMERATED),
+                    _int(sizelimit),
+                    _int(timelimit),
+                    _tlv(_BOOLEAN, '\x00'),
+                    encode_filter(filter),
+                    _seq([_tlv(_OCTET_STRING, a) for a in attrs])],
+                   _SEARCH_REQUEST)
+        msgid = self.__send(req)
+        wait = None
+        if timelimit:
+            wait = timelimit + self.timeout
+        entries = []
+        while True:
+            mid, tag, value = self.__recv(wait)
+            if mid != msgid:
+                continue
+            if tag == _SEARCH_RESULT_ENTRY:
+                items = _items(value)
+                attributes = {}
+                for _, a in _items(items[1][1]):
+                    t, vals = _items(a)
+                    attributes[t[1]] = [v for _, v in _items(vals[1])]
+                entries.append((items[0][1], attributes))
+            elif tag == _SEARCH_RESULT_DONE:
+                code, desc = self.__result(value)
+                if code != SUCCESS:
+                    raise ErrLDAP(code, desc, entries)
+                return entries
+            # references are ignored
+
+    def search(self, base, filter, attrs=None, scope=SCOPE_SUBTREE,
+               timelimit=0, sizelimit=0):
+        """Search. Binds anonymously if not bound. A broken kept connection
+        is re-established once.
+
+        :param base: search base.
+        :param filter: string filter.
+        :param attrs: attributes to return (default: all).
+        :param scope: `SCOPE_BASE`, `SCOPE_ONELEVEL` or `SCOPE_SUBTREE`.
+        :param timelimit: server side time limit in seconds (0 - none).
+        :param sizelimit: maximum number of entries (0 - no limit).
+
+        :return: list of ``(dn, {attribute: [values]})``.
+        :rtype: `list`
+        :raises `ErrLDAP`: on failure; entries received before a
+            time or size limit was exceeded are in its `entries`.
+        """
+        if attrs is None:
+            attrs = []
+        self.__lock.acquire()
+        try:
+            kept = self.__sock is not None
+            try:
+                return self.__search(base, filter, attrs, scope,
+                                     timelimit, sizelimit)
+            except ErrLDAP, e:
+                if not kept or e.code != SERVER_DOWN:
+                    raise
+            return self.__search(base, filter, attrs, scope,
+                                 timelimit, sizelimit)
+        finally:
+            self.__lock.release()
+
+    def unbind(self):
+        "Unbind and close the connection."
+        self.__lock.acquire()
+        try:
+            if self.__sock is not None:
+                try:
+                    self.__send(_tlv(_UNBIND_REQUEST, ''))
+                except ErrLDAP:
+                    pass
+            self.close()
+        finally:
+            self.__lock.release()
+
+_connections = {}
+_connections_lock = threading.Lock()
+
+def get_connection(url, timeout=20):
+    """`LDAPConnection` to ``ldap://host[:port]`` kept for the life of the
+    process.
+
+    :param timeout: network timeout for a new connection.
+    :rtype: `LDAPConnection`
+    """
+    host, port = parse_url(url)
+    _connections_lock.acquire()
+    try:
+        try:
+            return _connections[(host, port)]
+        except KeyError:
+            c = _connections[(host, port)] = LDAPConnection(host, port,
+                                                            timeout)
+            return c
+    finally:
+        _connections_lock.release()
@@ -0,0 +1,286 @@
+##############################################################################
+#
+# NAME:        ldif.py
+#
+# FACILITY:    SAM (Service Availability Monitoring)
+#
+# COPYRIGHT:
+#         Copyright (c) 2009, Members of the EGEE Collaboration.
+#         http://www.eu-egee.org/partners/
+#         Licensed under the Apache License, Version 2.0.
+#         http://www.apache.org/licenses/LICENSE-2.0
+#         This software is provided "as is", without warranties
+#         or conditions of any kind, either express or implied.
+#
+# DESCRIPTION:
+#
+#         Incremental LDIF parser.
+#
+# AUTHORS:     SAM team, CERN
+#
+# CREATED:     16-Oct-2026
+#
+##############################################################################
+
+"""
+Incremental LDIF parser.
+
+`LDIFParser` is fed with data as it arrives and produces entries as
+``(dn, {attribute: [values]})`` tuples. Folded lines, comments and base64
+encoded (``attr:: value``) values are handled; ``attr:< URL`` values are
+returned as URLs.
+
+`parse()` - generator of entries read from a file-like object.
+
+`LDIFCommand` - run a command (e.g. ``ldapsearch``) and iterate over the
+entries it outputs while it runs.
+"""
+
+__docformat__ = 'restructuredtext en'
+
+import os
+import re
+import base64
+import binascii
+
+from gridmon.process.engine import ProcessEngine, OutputCapture
+
+__all__ = ['LDIFParser',
+           'LDIFCommand',
+           'ErrLDIF',
+           'parse']
+
+CHUNK_SIZE = 65536
+
+_re_base64 = re.compile('^[A-Za-z0-9+/]*=*$')
+
+class ErrLDIF(Exception):
+    "Malformed LDIF or failed LDIF producing command."
+
+class LDIFParser(object):
+    """Incremental LDIF parser.
+
+    Completed entries are collected till taken with `take()`.
+    """
+    def __init__(self):
+        self.__partial = ''
+        "incomplete physical line"
+        self.__line = None
+        "parts of current (possibly folded) logical line"
+        self.__entry = None
+        "entry being parsed - (dn, attributes)"
+        self.__entries = []
+        "completed entries"
+
+    def feed(self, data):
+        """Parse a chunk of data.
+
+        :raises `ErrLDIF`: on malformed data.
+        """
+        if self.__partial:
+            data = self.__partial + data
+        lines = data.split('\n')
+        self.__partial = lines.pop()
+        for l in lines:
+            self.__physical(l)
+
+    def feed_line(self, line):
+        """Parse a complete line (with or without trailing new line).
+
+        :raises `ErrLDIF`: on malformed data.
+        """
+        if self.__partial:
+            line = self.__partial + line
+            self.__partial = ''
+        self.__physical(line.rstrip('\n'))
+
+    def close(self):
+        """Signal end of data. Completes the last entry.
+
+        :raises `ErrLDIF`: on malformed data.
+        """
+        if self.__partial:
+            self.__physical(self.__partial)
+            self.__partial = ''
+        self.__physical('')
+
+    def take(self):
+        """Return and forget completed entries.
+
+        :rtype: `list`
+        """
+        entries = self.__entries
+        self.__entries = []
+        return entries
+
+    def __physical(self, line):
+        if line.endswith('\r'):
+            line = line[:-1]
+        if line.startswith(' '):
+            if self.__line is None:
+                raise ErrLDIF('Continuation line without a line to continue.')
+            self.__line.append(line[1:])
+            return
+        if self.__line is not None:
+            self.__logical(''.join(self.__line))
+            self.__line = None
+        if line:
+            self.__line = [line]
+        elif self.__entry is not None:
+            self.__entries.append(self.__entry)
+            self.__entry = None
+
+    def __logical(self, line):
+        if line.startswith('#'):
+            return
+        i = line.find(':')
+        if i <= 0:
+            raise ErrLDIF('Malformed LDIF line: %s' % line[:80])
+        attr = line[:i]
+        value = line[i+1:]
+        if value.startswith(':'):
+            value = value[1:].strip()
+            if not _re_base64.match(value):
+                raise ErrLDIF('Malformed base64 value of %s.' % attr)
+            try:
+                value = base64.decodestring(value)
+            except binascii.Error:
+                raise ErrLDIF('Malformed base64 value of %s.' % attr)
+        elif value.startswith('<'):
+            value = value[1:].lstrip(' ')
+        else:
+            value = value.lstrip(' ')
+        if attr.lower() == 'dn':
+            if self.__entry is not None:
+                self.__entries.append(self.__entry)
+            self.__entry = (value, {})
+        elif self.__entry is None:
+            if attr.lower() != 'version':
+                raise ErrLDIF('Attribute %s outside of entry.' % attr)
+        else:
+            try:
+                self.__entry[1][attr].append(value)
+            except KeyError:
+                self.__entry[1][attr] = [value]
+
+def parse(f, chunk_size=CHUNK_SIZE):
+    """Generate entries from LDIF read from file-like object `f`.
+
+    :raises `ErrLDIF`: on malformed data.
+    """
+    p = LDIFParser()
+    while True:
+        data = f.read(chunk_size)
+        if not data:
+            break
+        p.feed(data)
+        for e in p.take():
+            yield e
+    p.close()
+    for e in p.take():
+        yield e
+
+class LDIFCommand(object):
+    """Run a command and iterate over LDIF entries on its stdout as they
+    arrive.
+
+    Iteration raises `ErrLDIF` if the output is malformed or the command
+    exits with non-zero code. Beginning and end of stdout and stderr (see
+    `OutputCapture`) are kept for error messages in `output` and `errors`.
+
+    :ivar returncode: exit code of the command, `None` while it runs.
+    """
+    def __init__(self, cmd, timeout=None, keep=4096):
+        """Start `cmd`.
+
+        :param cmd: command (see `gridmon.process.engine.Child`).
+        :param timeout: kill the command after that many seconds.
+        :param keep: bytes of output kept from its beginning and end.
+        """
+        self.__parser = LDIFParser()
+        self.__entries = []
+        self.__error = None
+        self.__keep = keep
+        self.__capture = OutputCapture(keep, keep)
+        self.__stderr = os.tmpfile()
+        self.__engine = ProcessEngine()
+        self.__child = self.__engine.spawn(cmd, use_pty=False,
+                                           timeout=timeout,
+                                           on_line=self.__on_line,
+                                           capture=self.__capture,
+                                           stderr=self.__stderr.fileno())
+        self.returncode = None
+
+    def __on_line(self, child, line):
+        if self.__error is not None:
+            return
+        try:
+            self.__parser.feed_line(line)
+        except ErrLDIF, e:
+            self.__error = e
+            return
+        self.__entries.extend(self.__parser.take())
+
+    def __get_output(self):
+        return self.__capture.getvalue()
+    output = property(__get_output, None, None,
+                      "Captured stdout of the command.")
+
+    def __get_errors(self):
+        capture = OutputCapture(self.__keep, self.__keep)
+        self.__stderr.seek(0)
+        while True:
+            data = self.__stderr.read(CHUNK_SIZE)
+            if not data:
+                break
+            capture.write(data)
+        return capture.getvalue()
+    errors = property(__get_errors, None, None,
+                      "Captured stderr of the command.")
+
+    def __iter__(self):
+        return self
+
+    def prime(self):
+        """Run the command till an entry is available or it exits.
+
+        :return: `True` if an entry is available.
+        :raises `ErrLDIF`: on malformed output or failure of the command.
+        """
+        while not self.__entries and self.returncode is None:
+            if not self.__engine.step():
+                self.__finish()
+        return len(self.__entries) > 0
+
+    def __finish(self):
+        self.returncode = self.__child.returncode
+        if self.__error is None:
+            try:
+                self.__parser.close()
+                self.__entries.extend(self.__parser.take())
+            except ErrLDIF, e:
+                self.__error = e
+        if self.returncode != 0:
+            raise ErrLDIF(('Command exited with %s. %s' % (self.returncode,
+                                                self.errors.strip())).strip())
+        if self.__error is not None:
+            raise self.__error
+
+    def next(self):
+        "Next entry - ``(dn, {attribute: [values]})``."
+        if not self.prime():
+            raise StopIteration
+        return self.__entries.pop(0)
+
+    def close(self):
+        "Kill the command if it still runs."
+        if self.returncode is None:
+            self.__child.kill()
+            self.__engine.run()
+            self.returncode = self.__child.returncode
+
+    def __del__(self):
+        try:
+            self.close()
+        except:
+            pass
@@ -25,27 +25,143 @@
 
 """
 Base and thread-safe singleton container classes to handle metric output.
+
+Details data are kept in `DetailsBuffer` - a list of chunks with constant
+time append and prepend, joined only when requested. Optionally, once the
+data grow over a size limit, they are spilled to a temporary file.
 """
 
 __docformat__ = 'restructuredtext en'
 
 import sys
+import thread
+import tempfile
 import singleton
 
 VERBOSITY_MIN=0
 VERBOSITY_MAX=3
 
-__all__ = ['MetricOutputHandler',
+__all__ = ['DetailsBuffer',
+           'MetricOutputHandler',
            'MetricOutputHandlerSingleton',
            'OutputHandlerSingleton',
            'VERBOSITY_MIN',
            'VERBOSITY_MAX']
 
+class DetailsBuffer(object):
+    """Buffer of details data with constant time append and prepend.
+
+    Appended chunks are kept in order, prepended ones - in reverse order.
+    Chunks are joined by `getvalue()`. If `max_size` is set, the data
+    exceeding it are moved to an anonymous temporary file in `directory`
+    and further appended chunks are written to the file.
+    """
+    def __init__(self, max_size=None, directory=None):
+        """Initialise `DetailsBuffer`.
+
+        :param max_size: bytes kept in memory before spilling to a file
+            (default: `None` - no limit).
+        :type max_size: `int`
+        :param directory: directory for the spill file (default: system's
+            temporary directory).
+        :type directory: `str`
+        """
+        self.max_size = max_size
+        self.directory = directory
+        self.__head = []
+        "prepended chunks in reverse order"
+        self.__tail = []
+        "appended chunks"
+        self.__size = 0
+        "bytes in memory"
+        self.__file = None
+        "spill file; when set, appended chunks go there"
+        self.__fsize = 0
+        "bytes in spill file"
+
+    def __len__(self):
+        return self.__size + self.__fsize
+
+    def append(self, s):
+        "Append string `s`."
+        if not s:
+            return
+        if self.__file is not None:
+            self.__file.write(s)
+            self.__fsize += len(s)
+            return
+        self.__tail.append(s)
+        self.__size += len(s)
+        if self.max_size is not None and self.__size > self.max_size:
+            self.__spill()
+
+    def prepend(self, s):
+        "Prepend string `s`."
+        if not s:
+            return
+        self.__head.append(s)
+        self.__size += len(s)
+
+    def __spill(self):
+        """Move appended data to the spill file. Prepended data stay in
+        memory. Does nothing if the file can't be created."""
+        try:
+            if self.directory:
+                f = tempfile.TemporaryFile(prefix='detdata.',
+                                           dir=self.directory)
+            else:
+                f = tempfile.TemporaryFile(prefix='detdata.')
+        except (OSError, IOError):
+            self.max_size = None
+            return
+        data = ''.join(self.__tail)
+        f.write(data)
+        self.__tail = []
+        self.__size -= len(data)
+        self.__fsize = len(data)
+        self.__file = f
+
+    def getvalue(self):
+        """Return buffered data as one string.
+
+        :rtype: `str`
+        """
+        if self.__head:
+            self.__head.reverse()
+            head = ''.join(self.__head)
+            self.__head = [head]
+        else:
+            head = ''
+        if self.__file is not None:
+            self.__file.flush()
+            self.__file.seek(0)
+            data = self.__file.read()
+            self.__file.seek(0, 2)
+            return head + data
+        if len(self.__tail) > 1:
+            self.__tail = [''.join(self.__tail)]
+        if self.__tail:
+            return head + self.__tail[0]
+        return head
+
+    def clear(self):
+        "Drop all data and the spill file."
+        self.__head = []
+        self.__tail = []
+        self.__size = 0
+        if self.__file is not None:
+            try:
+                self.__file.close()
+            except (OSError, IOError):
+                pass
+        self.__file = None
+        self.__fsize = 0
+
 class TestOutputContainer(object):
     """Container class to hold and manipulate tests' output.
 
-    :ivar __detdata: details data (multi-line `str`)
-    :type __detdata: `str`
+    :ivar __detdata: details data
+    :type __detdata: `DetailsBuffer`
 
     :ivar __summary: summary data (single-line `str`)
     :type __summary: `str`
@@ -56,15 +172,20 @@ class TestOutputContainer(object):
     :ivar __out: output stream (`file`-like object)
     :type __out: `file`
     """
-    def __init__(self, stream=False):
+    def __init__(self, stream=False, max_size=None, directory=None):
         """Initialise `TestOutputContainer`.
 
         :param stream: send output directly to a `file`-like object?
             (default: `False`)
         :type stream: `bool`
+        :param max_size: bytes of details data kept in memory; the rest is
+            spilled to a file (default: `None` - no limit).
+        :type max_size: `int`
+        :param directory: directory for the spill file.
+        :type directory: `str`
         """
-        self.__detdata = ''
-        "details data (multi-line `str`)"
+        self.__detdata = DetailsBuffer(max_size, directory)
+        "details data (`DetailsBuffer`)"
         self.__summary = ''
         "summary data (single-line `str`)"
         self.__to_stream = stream
@@ -90,12 +211,23 @@ class TestOutputContainer(object):
     def set_stream(self, stream=True):
         self.__to_stream = stream
 
+    def get_stream(self):
+        "Is output sent directly to `file`-like object?"
+        return self.__to_stream
+
     def get_detdata(self):
-        if self.__detdata:
-            return self.__detdata
+        if len(self.__detdata):
+            return self.__detdata.getvalue()
         else:
             return self.__summary
 
+    def set_spill(self, max_size, directory=None):
+        """Set size limit of details data kept in memory and directory for
+        the spill file. Applies to data added afterwards.
+        """
+        self.__detdata.max_size = max_size
+        self.__detdata.directory = directory
+
     def get_summary(self):
         return self.__summary
 
@@ -106,16 +238,14 @@ class TestOutputContainer(object):
             self.__out.write(dd)
 
     def __append_detdata(self, dd, cr):
+        self.__detdata.append(dd)
         if cr:
-            self.__detdata += dd+'\n'
-        else:
-            self.__detdata += dd
+            self.__detdata.append('\n')
 
     def __prepend_data(self, dd, cr):
         if cr:
-            self.__detdata = '%s\n%s' % (dd, self.__detdata)
-        else:
-            self.__detdata = '%s%s' % (dd, self.__detdata)
+            self.__detdata.prepend('\n')
+        self.__detdata.prepend(dd)
 
     def __set_summary(self, s):
         self.__summary = s
@@ -124,7 +254,7 @@ class TestOutputContainer(object):
         self.__summary = ''
 
     def clear_details(self):
-        self.__detdata = ''
+        self.__detdata.clear()
 
     def clear_summary_details(self):
         self.clear_summary()
@@ -132,6 +262,10 @@ class TestOutputContainer(object):
 
 class MetricOutputHandler(TestOutputContainer):
     """Class to handle metric output details and summary data.
+
+    Threads running metrics concurrently can get their own output containers
+    with `attach_thread()`. Output produced by a thread without a container
+    goes to the common one.
     """
     def __init__(self, v=VERBOSITY_MIN, stream=False):
         """Initialise `MetricOutputHandler`.
@@ -145,6 +279,92 @@ class MetricOutputHandler(TestOutputContainer):
 
         self.verbosity = v
         "verbosity level - `int`"
+        self.__containers = {}
+        "per-thread output containers - `dict` (thread id: container)"
+        self.__spill = (None, None)
+        "size limit and spill directory of details data - `tuple`"
+
+    def attach_thread(self):
+        """Give the calling thread its own output container.
+        """
+        max_size, directory = self.__spill
+        self.__containers[thread.get_ident()] = \
+                            TestOutputContainer(stream=self.get_stream(),
+                                                max_size=max_size,
+                                                directory=directory)
+
+    def detach_thread(self):
+        """Drop output container of the calling thread.
+        """
+        try:
+            del self.__containers[thread.get_ident()]
+        except KeyError:
+            pass
+
+    def __container(self):
+        if self.__containers:
+            try:
+                return self.__containers[thread.get_ident()]
+            except KeyError:
+                pass
+        return None
+
+    def handle_detdata(self, dd, cr=True, prep=False):
+        c = self.__container()
+        if c:
+            c.handle_detdata(dd, cr=cr, prep=prep)
+        else:
+            TestOutputContainer.handle_detdata(self, dd, cr=cr, prep=prep)
+
+    def handle_summary(self, s):
+        c = self.__container()
+        if c:
+            c.handle_summary(s)
+        else:
+            TestOutputContainer.handle_summary(self, s)
+
+    def get_detdata(self):
+        c = self.__container()
+        if c:
+            return c.get_detdata()
+        return TestOutputContainer.get_detdata(self)
+
+    def get_summary(self):
+        c = self.__container()
+        if c:
+            return c.get_summary()
+        return TestOutputContainer.get_summary(self)
+
+    def clear_summary(self):
+        c = self.__container()
+        if c:
+            c.clear_summary()
+        else:
+            TestOutputContainer.clear_summary(self)
+
+    def clear_details(self):
+        c = self.__container()
+        if c:
+            c.clear_details()
+        else:
+            TestOutputContainer.clear_details(self)
+
+    def set_spill(self, max_size, directory=None):
+        """Limit size of details data kept in memory by the calling
+        thread's container (or the common one); the rest is spilled to a
+        file in `directory`. Containers of threads attached afterwards get
+        the same settings.
+
+        :Parameters:
+          - `max_size` (`int`) - bytes kept in memory (`None` - no limit)
+          - `directory` (`str`) - directory for the spill file
+        """
+        self.__spill = (max_size, directory)
+        c = self.__container()
+        if c:
+            c.set_spill(max_size, directory)
+        else:
+            TestOutputContainer.set_spill(self, max_size, directory)
 
     def prints(self, s):
         """Set summary. Doesn't append but overwrites previously set data.
@@ -26,14 +26,20 @@
 - Nagios passive checks publisher. Supports publication via
   NSCA and Nagios command file. It is configured from ``/etc/nagios-submit.conf``.
   `publishPassiveResult()` function should be used.
+- `PassiveResultPublisher` - buffered publisher for publishing many results
+  with the configuration resolved once.
 """
 
 __docformat__ = 'restructuredtext en'
 
 import os
+import re
+import sys
 import time
+import threading
 
 from gridmon.utils import run_cmd_data
+from gridmon.process import signaling
 from gridmon.config import ConfigParserFlat, ErrConfigParserFlatNoOpt, ErrConfigParserFlat
 
 
@@ -45,6 +51,13 @@ NAGIOSCMD   = '/var/nagios/rw/nagios.cmd'
 NSCA_BIN    = '/usr/sbin/send_nsca'
 NSCA_CONFIG = '/etc/nagios/send_nsca.cfg'
 NSCA_PORT   = '5667'
+NSCA_BATCH  = 100
+"number of results sent with one invocation of NSCA client."
+NSCA_CLIENT = 'send_nsca'
+"NSCA client to use: send_nsca or native (`gridmon.nagios.nsca`)."
+
+ETB = '\x17'
+"NSCA client's separator of results fed on stdin."
 
 DELIM = ';'
 "delimiter between command parts for results inteded for Nagios command file."
@@ -52,7 +65,11 @@ DELIM = ';'
 __all__ = ['ErrNagiosLib',
            'publishPassiveResult',
            'publishPassiveResultNSCA',
-           'publishPassiveResultNAGCMD']
+           'publishPassiveResultNSCANative',
+           'publishPassiveResultNAGCMD',
+           'readPassiveResultConfig',
+           'publishPassiveResultConfigured',
+           'PassiveResultPublisher']
 
 class ErrNagiosLib(StandardError):
     "Nagios library exception."
@@ -64,7 +81,9 @@ def __getPassiveResultString(attrs, delim=';'):
     """Produce formated results strings ready to be fed to Nagios.
 
     :param attrs: list of dictionaries with keys:
-            ``host, service, status, summary, details``
+            ``host, service, status, summary, details`` or
+            ``host, service, status, output``, where ``output`` is plugin
+            output already encoded with `gridmon.utils.encode_output()`
     :type attrs: `list`
     :param delim: delimiter for the fields in the results
 
@@ -76,22 +95,49 @@ def __getPassiveResultString(attrs, delim=';'):
     """
 
     res = []
+    ln = '%s<d>%s<d>%s<d>%s'.replace('<d>',delim)
     for a in attrs:
-        ln = '%s<d>%s<d>%s<d>%s'.replace('<d>',delim)
         try:
+            try:
+                output = a['output']
+            except KeyError:
+                output = a['summary']+'\\n' +\
+                            a['details'].replace('\n','\\n')
             res.append(ln % (a['host'],
                        a['service'],
                        a['status'],
-                       a['summary']+'\\n' +\
-                       a['details'].replace('\n','\\n')))
+                       output))
         except KeyError, e:
             raise ErrNagiosLib, \
                 'Missing attribute: %s'%str(e)
     return res
+# not to be mangled when called from within classes
+_getPassiveResultString = __getPassiveResultString
+
+def __runNSCA(cmd, reslist):
+    """Feed ETB separated results to NSCA client.
 
-def publishPassiveResultNSCA(bin, conf, host, port, reslist, delim=';'):
+    :raises `StandardError`: on failure of the client or if it reported
+        less results sent than given; then its `sent` attribute is the
+        number of results (from the beginning of `reslist`) sent.
+    """
+    out = run_cmd_data(cmd, ETB.join(reslist)+ETB)
+    m = re.search('(\d+) data packet', out)
+    if m and int(m.group(1)) < len(reslist):
+        e = StandardError(out.strip())
+        e.sent = int(m.group(1))
+        raise e
+
+def publishPassiveResultNSCA(bin, conf, host, port, reslist, delim=';',
+                             batch=NSCA_BATCH):
     """Form and run NSCA command to publish passive results.
 
+    Results are sent in batches of `batch` results per invocation of the
+    NSCA client. If a batch fails after the client reported part of it
+    sent ("N data packet(s) sent"), the rest is re-sent one by one to find
+    out the failed ones. Otherwise (e.g. server not reachable) all results
+    of the batch are failed.
+
     :Parameters:
       - `bin`  NSCA binary (full path)
       - `conf` NSCA configuration file
@@ -101,8 +147,13 @@ def publishPassiveResultNSCA(bin, conf, host, port, reslist, delim=';'):
         dictionaries. In case of dictionaries `__getPassiveResultString()` is
         used to flatten the `dict` to get proper the result representing string.
       - `delim` delimiter for the fields in the results string
+      - `batch` (`int`) maximum number of results sent at once
+        (<= 1 - one by one)
 
-    :raises `ErrNagiosLib`: on a problem invoking NSCA client.
+    :raises `ErrNagiosLib`: on a problem invoking NSCA client. The message
+        lists host and service of each result failed to be sent; its
+        `unsent` attribute holds their strings.
+    :raises `signaling.TimeoutError`: if timed out while sending.
     """
 
     if isinstance(reslist[0], dict):
@@ -110,12 +161,79 @@ def publishPassiveResultNSCA(bin, conf, host, port, reslist, delim=';'):
 
     cmd = '%s -c %s -H %s -p %s -d "%s"' % (bin,
                         conf, host, port, delim)
-    for r in reslist:
+    batch = max(int(batch), 1)
+    failed = []
+    for i in range(0, len(reslist), batch):
+        chunk = reslist[i:i+batch]
         try:
-            run_cmd_data(cmd, r+'\n')
+            __runNSCA(cmd, chunk)
+        except signaling.TimeoutError:
+            raise
         except Exception, e:
-            raise ErrNagiosLib, \
-                'Problem invoking NSCA client. %s' % str(e)
+            # the client reported part of the results sent - re-send the
+            # rest one by one; otherwise the whole batch failed
+            if not hasattr(e, 'sent'):
+                for r in chunk:
+                    failed.append((r, str(e)))
+                continue
+            chunk = chunk[e.sent:]
+            if len(chunk) == 1:
+                failed.append((chunk[0], str(e)))
+                continue
+            for r in chunk:
+                try:
+                    __runNSCA(cmd, [r])
+                except signaling.TimeoutError:
+                    raise
+                except Exception, e:
+                    failed.append((r, str(e)))
+    if failed:
+        e = ErrNagiosLib(
+            'Problem invoking NSCA client. Failed %i of %i results. %s' % \
+                (len(failed), len(reslist),
+                 ' '.join(['[%s] %s' % (delim.join(r.split(delim)[:2]),
+                                        e.strip()) for r, e in failed])))
+        e.unsent = [r for r, _ in failed]
+        raise e
+
+def publishPassiveResultNSCANative(host, port, reslist, conf=NSCA_CONFIG,
+                                   delim=';'):
+    """Publish passive results with in-process NSCA client
+    (`gridmon.nagios.nsca`). Connection to the NSCA server is kept open
+    for subsequent calls.
+
+    :Parameters:
+      - `host` NSCA server
+      - `port` (`str`) NSCA port
+      - `reslist` (`list`) list of results. Elements can be strings or
+        dictionaries. Strings are split into host, service, status and output
+        on `delim`.
+      - `conf` send_nsca configuration file to read password and
+        encryption method from
+      - `delim` delimiter for the fields in the results string
+
+    :raises `ErrNagiosLib`: on a problem sending the results. Its `unsent`
+        attribute holds strings of the results not sent.
+    """
+    from gridmon.nagios import nsca
+
+    if isinstance(reslist[0], dict):
+        reslist = __getPassiveResultString(reslist, delim=delim)
+
+    results = []
+    for r in reslist:
+        f = r.split(delim, 3)
+        try:
+            results.append((f[0], f[1], int(f[2]), f[3]))
+        except (IndexError, ValueError):
+            raise ErrNagiosLib, 'Malformed result: %s' % r
+    try:
+        password, encryption = nsca.read_send_nsca_config(conf)
+        nsca.get_client(host, port, encryption, password).send_many(results)
+    except nsca.ErrNSCA, e:
+        err = ErrNagiosLib('Problem sending results to NSCA. %s' % str(e))
+        err.unsent = reslist[getattr(e, 'sent', 0):]
+        raise err
 
 def publishPassiveResultNAGCMD(nagcmd, reslist):
     """Publish passive results to Nagios command file.
@@ -146,6 +264,88 @@ def publishPassiveResultNAGCMD(nagcmd, reslist):
         fn.flush()
     fn.close()
 
+def readPassiveResultConfig(modefile=PASSIVE_MODE_FILE):
+    """Read passive checks publication method and its parameters from
+    configuration file.
+
+    :param modefile: configuration file that defines passive checks
+        publication mode
+
+    :return: dictionary with ``method`` key (``nagioscmd`` or ``nsca``) and
+        parameters of the method: ``nagcmd`` or ``nsca_host``, ``nsca_port``,
+        ``nsca_bin``, ``nsca_conf``, ``nsca_batch``, ``nsca_client``.
+    :rtype: `dict`
+
+    :raises `ErrNagiosLib`:
+      - on failure opening or parsing configuration file
+      - on unknown passive checks publication mechanism specified
+    """
+    nc = ConfigParserFlat()
+    try:
+        nc.read(modefile)
+    except IOError, e:
+        raise ErrNagiosLib, \
+            'Failed opening configuration file %s. %s' % (modefile, str(e))
+
+    def get(key, default):
+        try:
+            return nc.get(key)
+        except ErrConfigParserFlatNoOpt:
+            return default
+
+    try:
+        method = get('SUBMIT_METHOD', SUBMIT_METHOD)
+        if method == 'nagioscmd':
+            return {'method' : method,
+                    'nagcmd' : get('NAGIOSCMD', NAGIOSCMD)}
+        elif method == 'nsca':
+            conf = {'method'      : method,
+                    'nsca_host'   : nc.get('NSCA_HOST'),
+                    'nsca_bin'    : get('NSCA_BIN', NSCA_BIN),
+                    'nsca_conf'   : get('NSCA_CONFIG', NSCA_CONFIG),
+                    'nsca_port'   : get('NSCA_PORT', NSCA_PORT),
+                    'nsca_client' : get('NSCA_CLIENT', NSCA_CLIENT)}
+            try:
+                conf['nsca_batch'] = int(get('NSCA_BATCH', NSCA_BATCH))
+            except ValueError:
+                raise ErrNagiosLib, \
+                    'NSCA_BATCH in %s must be an integer.' % modefile
+            return conf
+        else:
+            raise ErrNagiosLib, 'Unknown mechanism defined in %s: %s. %s' % \
+                    (modefile, method, ' Valid options are: nsca, nagioscmd.')
+    except (ErrConfigParserFlat, ErrConfigParserFlatNoOpt), e:
+        raise ErrNagiosLib, \
+                'Problem parsing configuration file. %s ' % str(e)
+
+def publishPassiveResultConfigured(conf, reslist):
+    """Publish passive results with the method and parameters given in
+    `conf` (as returned by `readPassiveResultConfig()`).
+
+    :Parameters:
+      - `conf` (`dict`) publication method and its parameters
+      - `reslist` (`list`) list of results (strings or dictionaries)
+
+    :raises `ErrNagiosLib`: on failure to publish the results.
+    """
+    if not reslist:
+        return
+    if conf['method'] == 'nagioscmd':
+        publishPassiveResultNAGCMD(conf['nagcmd'], reslist)
+    elif conf['method'] == 'nsca':
+        if conf.get('nsca_client', NSCA_CLIENT) == 'native':
+            publishPassiveResultNSCANative(conf['nsca_host'],
+                                           conf['nsca_port'], reslist,
+                                           conf=conf['nsca_conf'],
+                                           delim=DELIM)
+        else:
+            publishPassiveResultNSCA(conf['nsca_bin'], conf['nsca_conf'],
+                                     conf['nsca_host'], conf['nsca_port'],
+                                     reslist, delim=DELIM,
+                                     batch=conf.get('nsca_batch', NSCA_BATCH))
+    else:
+        raise ErrNagiosLib, 'Unknown mechanism: %s.' % conf['method']
+
 def publishPassiveResult(attrs, modefile=PASSIVE_MODE_FILE):
     """Publish passive test results to Nagios: NSCA or Nagios
     command file are possible. Method and parameters are taken
@@ -171,43 +371,84 @@ def publishPassiveResult(attrs, modefile=PASSIVE_MODE_FILE):
 
     reslist = __getPassiveResultString(attrs, delim=DELIM)
 
-    nc = ConfigParserFlat()
-    try:
-        nc.read(modefile)
-    except IOError, e:
-        raise ErrNagiosLib, \
-            'Failed opening configuration file %s. %s' % (modefile, str(e))
+    publishPassiveResultConfigured(readPassiveResultConfig(modefile), reslist)
 
-    try:
+class PassiveResultPublisher(object):
+    """Buffered publisher of passive checks results.
+
+    Results are queued and published in batches: when `max_results` are
+    queued or the oldest queued result is `max_age` seconds old (checked on
+    `publish()`), and on explicit `flush()`.
+    """
+    def __init__(self, conf, max_results=50, max_age=10):
+        """Initialise `PassiveResultPublisher`.
+
+        :param conf: publication method and its parameters as returned by
+            `readPassiveResultConfig()`.
+        :type conf: `dict`
+        :param max_results: number of queued results triggering a flush
+            (<= 1 - publish immediately).
+        :param max_age: seconds after which queued results are flushed.
+        """
+        self.conf = conf
+        self.max_results = max_results
+        self.max_age = max_age
+        self.__queue = []
+        self.__since = None
+        self.__lock = threading.Lock()
+
+    def publish(self, attrs):
+        """Queue results. Flushes the queue if a threshold is reached.
+
+        :param attrs: list of dictionaries with keys:
+            ``host, service, status, summary, details`` or
+            ``host, service, status, output`` (see `__getPassiveResultString()`)
+        :type attrs: `list`
+
+        :raises `ErrNagiosLib`: on missing attributes or failure to flush.
+        """
+        reslist = _getPassiveResultString(attrs, delim=DELIM)
+        self.__lock.acquire()
         try:
-            method = nc.get('SUBMIT_METHOD')
-        except ErrConfigParserFlatNoOpt:
-            method = SUBMIT_METHOD
-        if method == 'nagioscmd':
-            try:
-                nagcmd = nc.get('NAGIOSCMD')
-            except ErrConfigParserFlatNoOpt:
-                nagcmd = NAGIOSCMD
-            publishPassiveResultNAGCMD(nagcmd, reslist)
-        elif method == 'nsca':
-            nsca_host = nc.get('NSCA_HOST')
-            try:
-                nsca_bin  = nc.get('NSCA_BIN')
-            except ErrConfigParserFlatNoOpt:
-                nsca_bin = NSCA_BIN
-            try:
-                nsca_conf = nc.get('NSCA_CONFIG')
-            except ErrConfigParserFlatNoOpt:
-                nsca_conf = NSCA_CONFIG
+            if not self.__queue:
+                self.__since = time.time()
+            self.__queue.extend(reslist)
+            flush = len(self.__queue) >= self.max_results or \
+                        time.time() - self.__since >= self.max_age
+        finally:
+            self.__lock.release()
+        if flush:
+            self.flush()
+
+    def pending(self):
+        "Number of queued results."
+        return len(self.__queue)
+
+    def flush(self):
+        """Publish all queued results.
+
+        :raises `ErrNagiosLib`: on failure to publish the results. Results
+            not sent (all of them if it isn't known which ones) are put back
+            in front of the queue; same on any other exception (e.g. timeout).
+        """
+        self.__lock.acquire()
+        try:
+            reslist = self.__queue
+            self.__queue = []
+            self.__since = None
+        finally:
+            self.__lock.release()
+        if not reslist:
+            return
+        try:
+            publishPassiveResultConfigured(self.conf, reslist)
+        except:
+            unsent = getattr(sys.exc_info()[1], 'unsent', reslist)
+            self.__lock.acquire()
             try:
-                nsca_port = nc.get('NSCA_PORT')
-            except ErrConfigParserFlatNoOpt:
-                nsca_port = NSCA_PORT
-            publishPassiveResultNSCA(nsca_bin, nsca_conf, nsca_host,
-                                 nsca_port, reslist, delim=DELIM)
-        else:
-            raise ErrNagiosLib, 'Unknown mechanism defined in %s: %s. %s' % \
-                    (modefile, method, ' Valid options are: nsca, nagioscmd.')
-    except (ErrConfigParserFlat, ErrConfigParserFlatNoOpt), e:
-        raise ErrNagiosLib, \
-                'Problem parsing configuration file. %s ' % str(e)
+                self.__queue[:0] = unsent
+                if self.__since is None:
+                    self.__since = time.time()
+            finally:
+                self.__lock.release()
+            raise
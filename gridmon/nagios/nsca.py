@@ -0,0 +1,334 @@
+##############################################################################
+#
+# NAME:        nsca.py
+#
+# FACILITY:    SAM (Service Availability Monitoring)
+#
+# COPYRIGHT:
+#         Copyright (c) 2009, Members of the EGEE Collaboration.
+#         http://www.eu-egee.org/partners/
+#         Licensed under the Apache License, Version 2.0.
+#         http://www.apache.org/licenses/LICENSE-2.0
+#         This software is provided "as is", without warranties
+#         or conditions of any kind, either express or implied.
+#
+# DESCRIPTION:
+#
+#         In-process client of Nagios Service Check Acceptor (NSCA).
+#
+# AUTHORS:     SAM team, CERN
+#
+# CREATED:     16-Oct-2026
+#
+##############################################################################
+
+"""
+In-process client of Nagios Service Check Acceptor (NSCA).
+
+Implements NSCA protocol version 3 as spoken by ``send_nsca``:
+
+  - on connect the server sends an initialisation packet - 128 bytes of
+    initialisation vector (IV) and 4 bytes of timestamp;
+  - the client sends a fixed size data packet per result - version,
+    CRC32 of the packet, timestamp, return code, host name, service
+    description and plugin output - optionally encrypted.
+
+Supported encryption methods: `ENCRYPT_NONE` and `ENCRYPT_XOR`.
+
+`NSCAClient` keeps its connection open across results. `get_client()`
+returns clients cached per process. `read_send_nsca_config()` reads
+password and encryption method from ``send_nsca.cfg``.
+"""
+
+__docformat__ = 'restructuredtext en'
+
+import os
+import time
+import errno
+import select
+import struct
+import socket
+import threading
+import zlib
+
+__all__ = ['NSCAClient',
+           'ErrNSCA',
+           'get_client',
+           'read_send_nsca_config',
+           'ENCRYPT_NONE',
+           'ENCRYPT_XOR']
+
+ENCRYPT_NONE = 0
+ENCRYPT_XOR = 1
+
+NSCA_PORT = 5667
+PACKET_VERSION = 3
+IV_SIZE = 128
+INIT_PACKET_SIZE = IV_SIZE + 4
+MAX_HOSTNAME_LENGTH = 64
+MAX_DESCRIPTION_LENGTH = 128
+MAX_PLUGINOUTPUT_LENGTH = 512
+"as compiled in NSCA; 4096 for servers built with bigger buffers."
+
+class ErrNSCA(StandardError):
+    "NSCA client exception."
+
+def _packet_format(max_output):
+    # version, (pad), crc32, timestamp, return code, host, service, output,
+    # (pad) - mimics layout of C struct data_packet_struct
+    return '!hxxIIh%is%is%isxx' % (MAX_HOSTNAME_LENGTH,
+                                   MAX_DESCRIPTION_LENGTH,
+                                   max_output)
+
+def _cstr(s, size):
+    "Truncate to fit into C buffer of `size` with terminating NUL."
+    return s[:size-1]
+
+def _xor(data, iv, password):
+    """XOR encryption as of NSCA: with IV, then with password."""
+    d = map(ord, data)
+    n = len(iv)
+    for i in range(len(d)):
+        d[i] = d[i] ^ ord(iv[i % n])
+    if password:
+        n = len(password)
+        for i in range(len(d)):
+            d[i] = d[i] ^ ord(password[i % n])
+    return ''.join(map(chr, d))
+
+def build_packet(timestamp, host, service, status, output,
+                 max_output=MAX_PLUGINOUTPUT_LENGTH):
+    """Build (unencrypted) data packet with CRC32 filled in.
+
+    :rtype: `str`
+    """
+    fmt = _packet_format(max_output)
+    args = [int(timestamp) & 0xffffffffL,
+            int(status),
+            _cstr(host, MAX_HOSTNAME_LENGTH),
+            _cstr(service, MAX_DESCRIPTION_LENGTH),
+            _cstr(output, max_output)]
+    packet = struct.pack(fmt, *([PACKET_VERSION, 0] + args))
+    crc = zlib.crc32(packet) & 0xffffffffL
+    return struct.pack(fmt, *([PACKET_VERSION, crc] + args))
+
+def parse_packet(packet, max_output=MAX_PLUGINOUTPUT_LENGTH):
+    """Unpack (unencrypted) data packet and verify its CRC32.
+
+    :return: (version, timestamp, status, host, service, output)
+    :rtype: `tuple`
+    :raises `ErrNSCA`: on CRC mismatch.
+    """
+    fmt = _packet_format(max_output)
+    ver, crc, ts, rc, host, svc, out = struct.unpack(fmt, packet)
+    zeroed = struct.pack(fmt, ver, 0, ts, rc, host, svc, out)
+    if zlib.crc32(zeroed) & 0xffffffffL != crc:
+        raise ErrNSCA('CRC32 mismatch.')
+    return (ver, ts, rc, host.split('\0', 1)[0], svc.split('\0', 1)[0],
+            out.split('\0', 1)[0])
+
+class NSCAClient(object):
+    """Client of NSCA server. The connection is established on first use
+    and kept open until `close()`.
+    """
+    def __init__(self, host, port=NSCA_PORT, encryption=ENCRYPT_NONE,
+                 password='', timeout=10, max_output=MAX_PLUGINOUTPUT_LENGTH):
+        """Initialise `NSCAClient`.
+
+        :param host: NSCA server.
+        :param port: NSCA port.
+        :param encryption: `ENCRYPT_NONE` or `ENCRYPT_XOR`.
+        :param password: password shared with the server.
+        :param timeout: socket timeout in seconds.
+        :param max_output: size of plugin output in the server's packets.
+
+        :raises `ErrNSCA`: on unsupported encryption method.
+        """
+        encryption = int(encryption)
+        if encryption not in (ENCRYPT_NONE, ENCRYPT_XOR):
+            raise ErrNSCA('Unsupported encryption method %i.' % encryption)
+        self.host = host
+        self.port = int(port)
+        self.encryption = encryption
+        self.password = password
+        self.timeout = timeout
+        self.max_output = max_output
+        self.__sock = None
+        self.__iv = None
+        self.__srv_time = None
+        self.__conn_time = None
+        self.__lock = threading.Lock()
+
+    def __recv(self, n):
+        data = []
+        got = 0
+        while got < n:
+            try:
+                d = self.__sock.recv(n - got)
+            except socket.error, e:
+                if e[0] == errno.EINTR:
+                    continue
+                raise
+            if not d:
+                raise ErrNSCA('Connection closed by NSCA server %s:%i.' % \
+                              (self.host, self.port))
+            data.append(d)
+            got += len(d)
+        return ''.join(data)
+
+    def connect(self):
+        """Connect and read the initialisation packet.
+
+        :raises `ErrNSCA`: on connection errors.
+        """
+        self.close()
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect((self.host, self.port))
+            self.__sock = sock
+            init = self.__recv(INIT_PACKET_SIZE)
+        except (socket.error, ErrNSCA), e:
+            self.close()
+            raise ErrNSCA('Failed connecting to NSCA server %s:%i. %s' % \
+                          (self.host, self.port, str(e)))
+        self.__iv = init[:IV_SIZE]
+        self.__srv_time = struct.unpack('!I', init[IV_SIZE:])[0]
+        self.__conn_time = time.time()
+
+    def close(self):
+        "Close connection to the server."
+        if self.__sock is not None:
+            try:
+                self.__sock.close()
+            except socket.error:
+                pass
+        self.__sock = None
+
+    def __alive(self):
+        "Check that the server didn't close the kept connection."
+        try:
+            r, _, _ = select.select([self.__sock], [], [], 0)
+            if r and not self.__sock.recv(1):
+                return False
+        except (select.error, socket.error):
+            return False
+        return True
+
+    def __timestamp(self):
+        # server rejects packets older than its max_packet_age; keep the
+        # server's clock ticking on a long lived connection
+        return self.__srv_time + int(time.time() - self.__conn_time)
+
+    def __send_packet(self, host, service, status, output):
+        packet = build_packet(self.__timestamp(), host, service, status,
+                              output, self.max_output)
+        if self.encryption == ENCRYPT_XOR:
+            packet = _xor(packet, self.__iv, self.password)
+        self.__sock.sendall(packet)
+
+    def send(self, host, service, status, output):
+        """Send a passive check result. Reconnects once if the kept
+        connection turns out to be broken.
+
+        :param host: host name.
+        :param service: service description.
+        :param status: return code (0-3).
+        :param output: plugin output.
+
+        :raises `ErrNSCA`: on failure.
+        """
+        self.send_many([(host, service, status, output)])
+
+    def send_many(self, results):
+        """Send a number of passive check results.
+
+        :param results: list of (host, service, status, output).
+        :raises `ErrNSCA`: on failure. Its `sent` attribute holds the number
+          of results sent before the failure, `unsent` - the rest of them.
+        """
+        self.__lock.acquire()
+        try:
+            i = 0
+            retried = False
+            if self.__sock is not None and not self.__alive():
+                self.close()
+            try:
+                while i < len(results):
+                    if self.__sock is None:
+                        self.connect()
+                    try:
+                        self.__send_packet(*results[i])
+                    except socket.error, e:
+                        self.close()
+                        if retried:
+                            raise ErrNSCA('Failed sending to NSCA server %s:%i. %s' % \
+                                          (self.host, self.port, str(e)))
+                        retried = True
+                        continue
+                    i += 1
+            except ErrNSCA, e:
+                e.sent = i
+                e.unsent = results[i:]
+                raise
+        finally:
+            self.__lock.release()
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_client(host, port=NSCA_PORT, encryption=ENCRYPT_NONE, password='',
+               **kwargs):
+    """Return `NSCAClient` cached per process for the given server and
+    encryption settings.
+
+    :rtype: `NSCAClient`
+    """
+    key = (host, int(port), int(encryption), password)
+    _clients_lock.acquire()
+    try:
+        try:
+            return _clients[key]
+        except KeyError:
+            c = _clients[key] = NSCAClient(host, port, encryption, password,
+                                           **kwargs)
+            return c
+    finally:
+        _clients_lock.release()
+
+_configs = {}
+
+def read_send_nsca_config(path):
+    """Read ``password`` and ``encryption_method`` from send_nsca
+    configuration file. Cached per file and its modification time.
+
+    :return: (password, encryption method)
+    :rtype: `tuple`
+    :raises `ErrNSCA`: if the file can't be read.
+    """
+    try:
+        mtime = os.stat(path).st_mtime
+        try:
+            cmtime, conf = _configs[path]
+            if cmtime == mtime:
+                return conf
+        except KeyError:
+            pass
+        password = ''
+        encryption = ENCRYPT_NONE
+        for ln in open(path).readlines():
+            ln = ln.strip()
+            if not ln or ln.startswith('#') or not '=' in ln:
+                continue
+            k, v = ln.split('=', 1)
+            k = k.strip().lower()
+            if k == 'password':
+                password = v
+            elif k == 'encryption_method':
+                encryption = int(v)
+    except (OSError, IOError), e:
+        raise ErrNSCA('Failed reading %s. %s' % (path, str(e)))
+    except ValueError:
+        raise ErrNSCA('Bad encryption_method in %s.' % path)
+    _configs[path] = (mtime, (password, encryption))
+    return password, encryption
@@ -24,13 +24,47 @@
 
 """
 Nagios compliant performance data container and handler.
+
+`parse()` and `PerfDataTable` do the reverse - read performance data
+strings of many results into columns of ``array('d')`` per label and
+aggregate them.
 """
 
 __docformat__ = 'restructuredtext en'
 
+import re
+from array import array
+
 __all__ = ['PerfData',
            'value2str',
-           'perfdata']
+           'perfdata',
+           'parse',
+           'percentile',
+           'PerfDataTable',
+           'FIELDS',
+           'NAN']
+
+FIELDS = ('value', 'warn', 'crit', 'min', 'max')
+"fields of a performance data item."
+
+_INF = 1e300 * 1e300
+NAN = _INF - _INF
+"not a number - for missing or non-numeric fields."
+
+_UOM_SCALE = {'s'  : ('s', 1),
+              'ms' : ('s', 1e-3),
+              'us' : ('s', 1e-6),
+              'B'  : ('B', 1),
+              'KB' : ('B', 1024),
+              'MB' : ('B', 1024 ** 2),
+              'GB' : ('B', 1024 ** 3),
+              'TB' : ('B', 1024 ** 4)}
+"units of measurement converted to the base ones: UOM: (base UOM, scale)."
+
+_item_re = re.compile(r"('(?:[^']|'')+'|[^\s=']+)=" +
+                      r"([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)?" +
+                      r"([^\s;]*)" + r"(?:;([^\s;]*))?" * 4)
+"label, value number, UOM, warn, crit, min, max."
 
 def perfdata(order):
     """Factory producing instance of `PerfData`.
@@ -66,9 +100,11 @@ def value2str(d):
 class PerfData(object):
     """Represents Nagios performance data as a set of ordered key-value pairs in
     a predefined format.
+
+    Each key gets a slot at the position defined by the order. Updates
+    re-render only the slots of the given keys; the string is serialised
+    once on `get()`. The state is per instance.
     """
-    __perf_data = ''
-    __pd = {}
     empty = '0;;'
     "zero value for performance data."
 
@@ -82,6 +118,10 @@ class PerfData(object):
         """
         if type(order) in [list, tuple]:
             self.__order = order
+            self.__index = {}
+            for i in range(len(order)):
+                self.__index.setdefault(order[i], []).append(i)
+            self.__empty = ['%s=%s' % (o, self.empty) for o in order]
             self.update({})
         else:
             raise TypeError('Order should be list or tuple. %s given.' % \
@@ -99,27 +139,44 @@ class PerfData(object):
             raise TypeError('Expected str, got %s' % type(data))
     def update(self, data):
         """Update performance data. Order the data by the order defined at
-        the object initialisation.
+        the object initialisation. Keys not given in `data` are set to
+        `empty`; keys not in the order are ignored.
 
         :param data: performance data as key-value pairs
         :type data: `dict`
         :raises `TypeError`: `data` should be `dict`
         """
         if isinstance(data, dict):
-            self.__pd.update(data)
-            pd = []
-            for o in self.__order:
-                s = self.empty
-                try:
-                    d = data[o]
-                except KeyError:
-                    pass
-                else:
-                    s = self.value2str(d)
-                pd.append('%s=%s' % (o, s))
-            self.__perf_data = ' '.join(pd)
+            self.__fill(data, self.__empty[:])
         else:
             raise TypeError('Expected dict, got %s' % type(data))
+    def merge(self, data):
+        """Update performance data of the keys given in `data` only. The
+        other keys keep their values.
+
+        :param data: performance data as key-value pairs
+        :type data: `dict`
+        :raises `TypeError`: `data` should be `dict`
+        """
+        if isinstance(data, dict):
+            self.__fill(data, self.__slots)
+        else:
+            raise TypeError('Expected dict, got %s' % type(data))
+    def __fill(self, data, slots):
+        """Render values of `data` into `slots`. Nothing is changed if a
+        value can't be rendered."""
+        filled = []
+        for k, v in data.items():
+            try:
+                positions = self.__index[k]
+            except KeyError:
+                continue
+            filled.append((positions, '%s=%s' % (k, self.value2str(v))))
+        for positions, s in filled:
+            for i in positions:
+                slots[i] = s
+        self.__slots = slots
+        self.__perf_data = None
     def value2str(self, d):
         """Translate performance data values into Nagios compliant
         string representation. See `perfdata.value2str()`.
@@ -151,4 +208,164 @@ class PerfData(object):
         :return: Nagios performance data as string (no "new line")
         :rtype: `str`
         """
+        if self.__perf_data is None:
+            self.__perf_data = ' '.join(self.__slots)
         return self.__perf_data.lstrip().rstrip()
+
+def parse(data):
+    """Parse Nagios performance data string
+    ``label=value[UOM];[warn];[crit];[min];[max] ...``.
+
+    Labels may be quoted (``'my label'=1``). Values with time and size
+    units are converted to seconds and bytes. Missing and non-numeric
+    fields (``U``, range thresholds like ``10:20``) are `NAN`. Tokens
+    which are not ``label=value`` are skipped.
+
+    :return: ``[(label, uom, value, warn, crit, min, max), ..]``
+    :rtype: `list`
+    """
+    res = []
+    for label, value, uom, warn, crit, vmin, vmax in _item_re.findall(data):
+        if label[0] == "'":
+            label = label[1:-1].replace("''", "'")
+        if value:
+            item = [label, uom, float(value)]
+        else:
+            # 'U' (unknown) or junk
+            item = [label, '', NAN]
+        for f in (warn, crit, vmin, vmax):
+            if not f:
+                item.append(NAN)
+                continue
+            try:
+                item.append(float(f))
+            except ValueError:
+                # 'U' or a range threshold
+                item.append(NAN)
+        if uom:
+            try:
+                uom, scale = _UOM_SCALE[uom]
+            except KeyError:
+                pass
+            else:
+                item[1] = uom
+                if scale != 1:
+                    item[2:] = [x * scale for x in item[2:]]
+        res.append(tuple(item))
+    return res
+
+def percentile(values, p):
+    """Percentile `p` (0-100) of sorted `values` with linear interpolation
+    between the closest ranks.
+
+    :raises `ValueError`: on empty `values` or `p` out of 0-100.
+    """
+    if not values:
+        raise ValueError('Percentile of no values.')
+    if p < 0 or p > 100:
+        raise ValueError('Percentile should be 0-100, got %s.' % p)
+    k = (len(values) - 1) * p / 100.
+    f = int(k)
+    if f == len(values) - 1:
+        return values[f]
+    return values[f] + (values[f + 1] - values[f]) * (k - f)
+
+class PerfDataTable(object):
+    """Performance data of many results (e.g. of hosts) in columns.
+
+    For each label there is an ``array('d')`` per field (see `FIELDS`)
+    and a list of sources the rows came from. Labels missing in a result
+    get no row, so columns of different labels may differ in length.
+    """
+    def __init__(self):
+        self.__labels = []
+        self.__columns = {}
+        self.__uoms = {}
+        self.__sources = {}
+
+    def add(self, data, source=None):
+        """Parse performance data string of a result and append it.
+
+        :param source: where the data came from (e.g. host name).
+        """
+        for item in parse(data):
+            label = item[0]
+            try:
+                columns = self.__columns[label]
+            except KeyError:
+                columns = [array('d') for f in FIELDS]
+                self.__columns[label] = columns
+                self.__labels.append(label)
+                self.__uoms[label] = item[1]
+                self.__sources[label] = []
+            columns[0].append(item[2])
+            columns[1].append(item[3])
+            columns[2].append(item[4])
+            columns[3].append(item[5])
+            columns[4].append(item[6])
+            self.__sources[label].append(source)
+
+    def add_many(self, results):
+        """Append performance data of many results.
+
+        :param results: ``[(source, data), ..]`` or ``{source: data}``.
+        """
+        if isinstance(results, dict):
+            results = results.items()
+        for source, data in results:
+            self.add(data, source)
+
+    def labels(self):
+        """Labels in the order they were first seen.
+
+        :rtype: `list`
+        """
+        return self.__labels[:]
+
+    def uom(self, label):
+        "Unit of measurement of `label` (after conversion, see `parse()`)."
+        return self.__uoms[label]
+
+    def sources(self, label):
+        "Sources of the rows of `label`."
+        return self.__sources[label][:]
+
+    def column(self, label, field='value'):
+        """Column of `field` of `label`.
+
+        :rtype: ``array('d')``
+        :raises `KeyError`: unknown label.
+        :raises `ValueError`: unknown field.
+        """
+        return self.__columns[label][list(FIELDS).index(field)]
+
+    def aggregate(self, label, field='value', percentiles=(50, 90, 95)):
+        """Aggregate `field` of `label` across the results. `NAN` values
+        are ignored.
+
+        :return: ``{'count': N, 'min': x, 'max': x, 'mean': x,
+          'p50': x, ..}``; only ``count`` if there are no values.
+        :rtype: `dict`
+        """
+        values = [x for x in self.column(label, field) if x == x]
+        res = {'count' : len(values)}
+        if not values:
+            return res
+        values.sort()
+        res['min'] = values[0]
+        res['max'] = values[-1]
+        res['mean'] = sum(values) / len(values)
+        for p in percentiles:
+            res['p%s' % p] = percentile(values, p)
+        return res
+
+    def summary(self, field='value', percentiles=(50, 90, 95)):
+        """Aggregate `field` of all labels (see `aggregate()`).
+
+        :return: label: aggregates
+        :rtype: `dict`
+        """
+        res = {}
+        for label in self.__labels:
+            res[label] = self.aggregate(label, field, percentiles)
+        return res
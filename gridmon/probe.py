@@ -34,10 +34,13 @@ import sys
 import getopt
 import time
 import re
+import thread
 
 import signal
 
 from gridmon.process import popenpgrp, signaling, pexpectpgrp
+from gridmon.process.engine import OutputCapture
+from gridmon.threadpool import WorkerPool
 from gridmon.nagios import nagios
 from gridmon.nagios import perfdata
 from gridmon.errmatch import *
@@ -52,9 +55,89 @@ __all__ = ['MetricGatherer',
            'ProbeFormatRenderer',
            'ErrProbe',
            #'to_status',
-           'to_retcode'
+           #'to_retcode'
            ]
 
+# Only the main thread receives signals. Metrics run from worker threads
+# must not re-arm or cancel probe's global timeout.
+_main_thread = thread.get_ident()
+
+TIMING_LABELS = ('wall', 'cpu', 'children')
+
+# Sequence number of commands run in the process; makes names of their
+# output files unique.
+_cmd_seq = [0]
+_cmd_seq_lock = thread.allocate_lock()
+
+def _next_cmd_seq():
+    _cmd_seq_lock.acquire()
+    try:
+        _cmd_seq[0] += 1
+        return _cmd_seq[0]
+    finally:
+        _cmd_seq_lock.release()
+
+def _times():
+    "Wall clock, CPU and children CPU times of the process (seconds)."
+    t = os.times()
+    return (time.time(), t[0] + t[1], t[2] + t[3])
+
+def _profiler():
+    "Profiler - C{cProfile} if available, C{profile} otherwise."
+    try:
+        import cProfile
+        return cProfile.Profile()
+    except ImportError:
+        import profile
+        return profile.Profile()
+
+_json_control_re = re.compile(r'[\x00-\x1f\x7f]')
+_json_control_chars = ''.join([chr(i) for i in range(32)]) + '\x7f'
+_json_all_chars = ''.join([chr(i) for i in range(256)])
+_json_controls = {'\r' : '\\r', '\t' : '\\t', '\b' : '\\b', '\f' : '\\f'}
+
+def _json_control_char(m):
+    c = m.group()
+    return _json_controls.get(c) or '\\u%04x' % ord(c)
+
+def _json_value(v):
+    "JSON representation of a string, number, boolean or C{None}."
+    if v is None:
+        return 'null'
+    if v is True:
+        return 'true'
+    if v is False:
+        return 'false'
+    if isinstance(v, (int, long)):
+        return str(v)
+    if isinstance(v, float):
+        return repr(v)
+    if isinstance(v, unicode):
+        v = v.encode('utf-8')
+    elif not isinstance(v, str):
+        v = str(v)
+    try:
+        v.decode('utf-8')
+    except UnicodeError:
+        v = v.decode('latin-1').encode('utf-8')
+    v = v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    if len(v.translate(_json_all_chars, _json_control_chars)) != len(v):
+        v = _json_control_re.sub(_json_control_char, v)
+    return '"%s"' % v
+
+def _jsonl(record):
+    "Dictionary as a line of JSON object with sorted keys."
+    keys = record.keys()
+    keys.sort()
+    return '{%s}\n' % ', '.join(['%s: %s' % (_json_value(str(k)),
+                                             _json_value(record[k]))
+                                  for k in keys])
+
+def _alarm(seconds):
+    'Call C{signal.alarm()} if running in the main thread.'
+    if thread.get_ident() == _main_thread:
+        signal.alarm(seconds)
+
 #
 # Exceptions
 #
@@ -73,14 +156,23 @@ class ErrProbeMetricOutputTypeError(TypeError):
 class ProbeFormatRenderer(object):
     """A class to abstract out the rendering of the test results.
 
+    Output of a result is built in a buffer and written to the stream with
+    a single C{write()}; C{sys.stdout} is not touched.
+
     @ivar output: output stream where the test results should be rendered
     @type output: file-like object
 
     @ivar sanitize: sanitize output using L{gridmon.utils.outputsanitiser()}
     @type sanitize: boolean
+
+    @ivar output_format: C{nagios} - Nagios plugin output, C{jsonl} - a JSON
+        object per result per line.
+    @type output_format: C{str}
     """
 
-    def __init__(self, stream=sys.stdout, sanitize=True):
+    FORMATS = ('nagios', 'jsonl')
+
+    def __init__(self, stream=sys.stdout, sanitize=True, output_format='nagios'):
         """Initialize the renderer.
 
         @keyword stream: output stream where the test results should be rendered.
@@ -88,77 +180,114 @@ class ProbeFormatRenderer(object):
 
         @kwarg sanitize: sanitize output using L{gridmon.utils.outputsanitiser()}
         @type sanitize: C{boolean}
+
+        @kwarg output_format: one of L{FORMATS}.
+        @type output_format: C{str}
+        @raise ValueError: unknown output format.
         """
         self.output = stream
         self.sanitize = sanitize
+        self.output_format = self.__check_format(output_format)
+
+    def __check_format(self, output_format):
+        if not output_format in self.FORMATS:
+            raise ValueError('Unknown output format %s. Expected one of: %s.' % \
+                             (output_format, ', '.join(self.FORMATS)))
+        return output_format
+
+    def format(self, data={}, sanitize=True, output_format=None):
+        """Format a result. See L{render()}.
+
+        @return: (return code, output)
+        @rtype: C{tuple}
+        """
+        output_format = self.__check_format(output_format or
+                                            self.output_format)
+        error = None
+        if not data:
+            error = 'UNKNOWN: No results given to render.'
+        else:
+            for key in ['metricStatus', 'summaryData']:
+                if not data.has_key(key):
+                    error = 'UNKNOWN: %s not given to renderer.' % key
+                    break
+        if error:
+            if output_format == 'jsonl':
+                return 3, _jsonl({'metricStatus' : 'UNKNOWN',
+                                  'summaryData'  : error})
+            return 3, error + '\n'
+
+        status = samutils.to_status(data['metricStatus'])
+        summary = data['summaryData'].rstrip('\n')
+        details = data.get('detailsData')
+        if details is not None:
+            details = details.rstrip('\n')
+        perf = data.get('perfData')
+
+        if output_format == 'jsonl':
+            record = data.copy()
+            record['metricStatus'] = status
+            record['summaryData'] = summary
+            if details is not None:
+                record['detailsData'] = details
+            return samutils.retCodes[status], _jsonl(record)
+
+        if self.sanitize and sanitize:
+            summary = samutils.outputsanitiser(summary)
+            if details is not None:
+                details = samutils.outputsanitiser(details)
+        if perf:
+            if details is not None:
+                out = '%s\n%s|%s\n' % (summary, details, perf)
+            else:
+                out = '%s|%s\n' % (summary, perf)
+        elif details is not None:
+            out = '%s\n%s\n' % (summary, details)
+        else:
+            out = summary + '\n'
+        return samutils.retCodes[status], out
 
-    def render(self, data={}, sanitize=True):
+    def render(self, data={}, sanitize=True, output_format=None):
         """Render Nagios compliant output from a given data to L{self.output}
         stream.
 
         @param data: expected keys C{metricStatus}, C{summaryData}, C{detailsData},
             C{perfData}. Mandatory: C{metricStatus} and C{summaryData}.
+            In C{jsonl} format all keys are rendered.
         @type data: C{dict}
 
         @param sanitize: sanitize output using L{gridmon.utils.outputsanitiser}
+            (not applied in C{jsonl} format)
         @type sanitize: C{boolean}
-        """
-        saveout = sys.stdout
-        sys.stdout = self.output
 
-        if not data:
-            print "UNKNOWN: No results given to render."
-            sys.stdout = saveout
-            return 3
-        for key in ['metricStatus', 'summaryData']:
-            if not data.has_key(key):
-                print "UNKNOWN: %s not given to renderer." % key
-                sys.stdout = saveout
-                return 3
-
-        for k in ['summaryData', 'detailsData']:
-            try:
-                if data[k].endswith('\n'):
-                    data[k] = data[k].rstrip('\n')
-            except KeyError:
-                pass
+        @param output_format: overrides L{output_format}.
+        @type output_format: C{str}
 
-        if not self.sanitize or not sanitize:
-            if data.has_key('perfData') and data['perfData']:
-                if data.has_key('detailsData'):
-                    print data['summaryData']
-                    print '%s|%s' % (data['detailsData'], data['perfData'])
-                else:
-                    print '%s|%s' % (data['summaryData'], data['perfData'])
-            else:
-                print data['summaryData']
-                if data.has_key('detailsData'):
-                    print data['detailsData']
-        else:
-            if data.has_key('perfData') and data['perfData']:
-                if data.has_key('detailsData'):
-                    print samutils.outputsanitiser(data['summaryData'])
-                    print '%s|%s' % (
-                            samutils.outputsanitiser(data['detailsData']),
-                            data['perfData'])
-                else:
-                    print '%s|%s' % (
-                            samutils.outputsanitiser(data['summaryData']),
-                            data['perfData'])
-            else:
-                print samutils.outputsanitiser(data['summaryData'])
-                if data.has_key('detailsData'):
-                    print samutils.outputsanitiser(data['detailsData'])
+        @return: Nagios return code.
+        @rtype: C{int}
+        """
+        retcode, out = self.format(data, sanitize, output_format)
+        self.output.write(out)
+        return retcode
+
+    def render_many(self, results, sanitize=True, output_format=None):
+        """Render a number of results with a single write to L{self.output}.
+        See L{render()}.
 
-        sys.stdout = saveout
+        @param results: list of result dictionaries.
+        @type results: C{list}
 
-        if samutils.to_status(data['metricStatus']).upper()   == 'UNKNOWN':
-            return 3
-        elif samutils.to_status(data['metricStatus']).upper() == 'CRITICAL':
-            return 2
-        elif samutils.to_status(data['metricStatus']).upper() == 'WARNING':
-            return 1
-        return 0
+        @return: Nagios return codes of the results.
+        @rtype: C{list}
+        """
+        retcodes = []
+        outs = []
+        for data in results:
+            retcode, out = self.format(data, sanitize, output_format)
+            retcodes.append(retcode)
+            outs.append(out)
+        self.output.write(''.join(outs))
+        return retcodes
 
     def renderDesc(self, data={}):
         """Render metrics' description to L{self.output} stream.
@@ -167,15 +296,12 @@ class ProbeFormatRenderer(object):
             metrics.
         @type data: dict
         """
-        saveout = sys.stdout
-        sys.stdout = self.output
-
+        out = []
         for attr,value in data.items():
             if attr != 'detailsData':
-                print "%s: %s"%(attr, value)
-        print "EOT"
-
-        sys.stdout = saveout
+                out.append("%s: %s\n" % (attr, value))
+        out.append("EOT\n")
+        self.output.write(''.join(out))
 
 
 class MetricGatherer(object):
@@ -225,7 +351,7 @@ class MetricGatherer(object):
     methodMap   = {}
     __metrSuff2metrName = {}
     serviceType = 'Undefined'
-    execMetric  = 'Default'
+    __execMetric = 'Default'
     verbosity   = VERBOSITY_MIN
     # return codes a'la Nagios
     retCodes    = samutils.retCodes
@@ -255,11 +381,58 @@ class MetricGatherer(object):
     nsca_port      = '5667'
     send_nsca      = '/usr/sbin/send_nsca'
     send_nsca_conf = '/etc/nagios/send_nsca.cfg'
+    nsca_batch     = nagios.NSCA_BATCH
+    nsca_client    = nagios.NSCA_CLIENT
     nagcmdfile = '/var/nagios/rw/nagios.cmd'
 
+    # Passive checks results are published in batches of up to
+    # passcheck_max_results or when queued for passcheck_max_age seconds
+    passcheck_max_results = 50
+    passcheck_max_age = 10
+    __publisher = None
+    __publisher_of = None
+
+    # Number of metrics a wrapper metric runs concurrently (<= 1 - sequentially)
+    parallel_metrics = 0
+
+    # Add times of metrics to their performance data; wrapper metrics add
+    # times of the metrics they run as well
+    perf_timing = False
+
+    # Bytes of plugin output of passive checks results (None - no limit).
+    # Complete output of a truncated result is written to <service>.output
+    # in the metric's working directory.
+    output_budget = None
+
+    # Host name to publish passive checks results for. If not set -
+    # $NAGIOS_HOSTNAME or hostname of the tested service.
+    nagios_hostname = None
+
     # object (singleton) to hold and manipulate metrics output
     __mo = MetricOutputHandlerSingleton.getInstance()
 
+    # Bytes of details data kept in memory; the rest is spilled to a file
+    # in the metric's working directory (None - no limit)
+    detdata_max_size = None
+
+    # Bytes kept from the beginning and the end of output of commands run
+    # with run_cmd() (None - keep all). Complete output goes to a file in
+    # the metric's working directory.
+    cmd_output_head = 262144
+    cmd_output_tail = 262144
+
+    # Seconds results of gridutils.query_bdii() are cached for in
+    # <workdir_run>/bdii-cache.<uid> (0 - no caching)
+    bdii_cache_ttl = 0
+
+    # Share DNS lookups between probes in <workdir_run>/.dns-cache.<uid>
+    # (default - in-memory cache of the process only)
+    dns_cache_persist = False
+
+    # Share working and failed BDII endpoints between probes in
+    # <workdir_run>/.ldap-state.<uid> (default - kept in memory of the process)
+    ldap_state_persist = False
+
     # Nagios performance data
     __perf_data = ''
 
@@ -297,6 +470,11 @@ Reporting passive checks (when used with wrapper checks)
 --nsca-port <port>      Port NSCA is listening on (Default: %s)
 --send-nsca <path>      NSCA client binary.  (Default: %s)
 --send-nsca-conf <path> NSCA configuration file. (Default: %s)
+--nsca-batch <N>        Maximum number of results sent with one invocation
+                        of NSCA client. (Default: %s)
+--nsca-client <send_nsca|native> Run NSCA client binary or use the in-process
+                        one. The latter reads password and encryption method
+                        from --send-nsca-conf. (Default: %s)
 
 --nagcmdfile <path>   Nagios command file.
                       Order: $NAGIOS_COMMANDFILE, --nagcmdfile
@@ -319,15 +497,64 @@ Reporting passive checks (when used with wrapper checks)
 
 --no-details-header   Don't include header in details data.
 
+--details-max-size <bytes> Keep up to this many bytes of details data in
+                      memory. The rest is spilled to a temporary file in
+                      the working directory of the metric. (Default: no limit)
+
+--cmd-output-keep <head KB>:<tail KB>|all Keep only the beginning and the end
+                      of output of commands run by metrics. Complete output
+                      is written to <metric>.<command>.<pid>.<N>.out in the
+                      working directory of the metric. (Default: %s)
+
+--bdii-cache-ttl <sec> Share successful BDII query results between probes
+                      of the user for that many seconds. Stored in
+                      bdii-cache.<uid>/ of the working directory.
+                      (Default: %i - no caching)
+
+--dns-cache-persist   Share DNS lookups between probes. Stored in
+                      .dns-cache.<uid> of the working directory. (Default:
+                      cached in memory of the probe only)
+
+--ldap-state-persist  Share working and recently failed BDII endpoints
+                      between probes. Stored in .ldap-state.<uid> of the
+                      working directory. (Default: kept in memory of the
+                      probe only)
+
+--ldap-native         Query BDII with the built-in LDAP client instead of
+                      ldapsearch CLI if LDAP API (python-ldap) is not
+                      available. (Default: ldapsearch CLI)
+
+--parallel-metrics <N> Run up to N metrics of a wrapper metric concurrently.
+                      Metrics listed in 'metricChildren' of another metric
+                      are started only after the latter succeeded.
+                      (Default: %s - sequentially)
+
+--perf-timing         Add wall clock, CPU and child processes CPU time of
+                      metrics to their performance data (time_wall,
+                      time_cpu, time_children). Wrapper metrics add the times
+                      of each metric they run (<metric>_wall, ...). CPU times
+                      are of the whole probe, i.e. include metrics run
+                      concurrently with --parallel-metrics.
+
+--output-budget <bytes> Truncate plugin output of passive checks results to
+                      this many bytes. Complete output of a truncated result
+                      is written to <service>.output in the working directory
+                      of the metric. (Default: no limit)
+
 """%(passcheckdest,
      nsca_port,
      send_nsca,
      send_nsca_conf,
+     nsca_batch,
+     nsca_client,
      nagcmdfile,
      voName,
      errorDBFile,
      ','.join(errorTopics),
-     workdir_run
+     workdir_run,
+     '%i:%i' % (cmd_output_head / 1024, cmd_output_tail / 1024),
+     bdii_cache_ttl,
+     parallel_metrics
      #probes_workdir+'/<VO>'
      )
 
@@ -337,6 +564,8 @@ Reporting passive checks (when used with wrapper checks)
                     'nsca-port=',
                     'send-nsca=',
                     'send-nsca-conf=',
+                    'nsca-batch=',
+                    'nsca-client=',
                     'nagcmdfile=',
                     'vo=',
                     'err-db=',
@@ -344,7 +573,16 @@ Reporting passive checks (when used with wrapper checks)
                     'work-dir=',
                     'stdout',
                     'no-details-header',
-                    'vo-fqan=']
+                    'details-max-size=',
+                    'cmd-output-keep=',
+                    'bdii-cache-ttl=',
+                    'dns-cache-persist',
+                    'ldap-state-persist',
+                    'ldap-native',
+                    'vo-fqan=',
+                    'parallel-metrics=',
+                    'perf-timing',
+                    'output-budget=']
 
     sanitize = True
 
@@ -352,6 +590,7 @@ Reporting passive checks (when used with wrapper checks)
         """ """
 
         self.serviceType = type
+        self.__timings = {}
 
         if tuples.has_key('metric'):
             self.set_execMetric(tuples['metric'])
@@ -375,7 +614,10 @@ Reporting passive checks (when used with wrapper checks)
                                            self.cmdopts_long)
         self._parseopts_super(opts)
 
-        if self.set_details_header:
+        if tuples.has_key('detailsHeader'):
+            # built by another gatherer of the same run (batch mode)
+            self.__dict__.update(tuples['detailsHeader'])
+        elif self.set_details_header:
             self._set_details_header()
 
     def set_metrics(self, metrics):
@@ -458,6 +700,17 @@ Reporting passive checks (when used with wrapper checks)
                 self.send_nsca = v
             elif o == '--send-nsca-conf':
                 self.send_nsca_conf = v
+            elif o == '--nsca-client':
+                if v not in ('send_nsca', 'native'):
+                    raise getopt.GetoptError(
+                        '--nsca-client must be one of <send_nsca|native>. %s given.' % v)
+                self.nsca_client = v
+            elif o == '--nsca-batch':
+                try:
+                    self.nsca_batch = int(v)
+                except ValueError:
+                    raise getopt.GetoptError(
+                            '--nsca-batch must be an integer. %s given.' % v)
             elif o == '--nagcmdfile':
                 self.nagcmdfile = v
             elif o == '--vo':
@@ -485,8 +738,52 @@ Reporting passive checks (when used with wrapper checks)
                 self.__mo.set_stream()
             elif o == '--no-details-header':
                 self.set_details_header = False
+            elif o == '--details-max-size':
+                try:
+                    self.detdata_max_size = int(v)
+                except ValueError:
+                    raise getopt.GetoptError(
+                            '--details-max-size must be an integer. %s given.' % v)
+                self.__mo.set_spill(self.detdata_max_size)
+            elif o == '--cmd-output-keep':
+                if v == 'all':
+                    self.cmd_output_head = self.cmd_output_tail = None
+                else:
+                    try:
+                        h, t = v.split(':')
+                        self.cmd_output_head = int(h) * 1024
+                        self.cmd_output_tail = int(t) * 1024
+                    except ValueError:
+                        raise getopt.GetoptError(
+                            '--cmd-output-keep must be <head KB>:<tail KB> or all. %s given.' % v)
+            elif o == '--bdii-cache-ttl':
+                try:
+                    self.bdii_cache_ttl = int(v)
+                except ValueError:
+                    raise getopt.GetoptError(
+                            '--bdii-cache-ttl must be an integer. %s given.' % v)
+            elif o == '--dns-cache-persist':
+                self.dns_cache_persist = True
+            elif o == '--ldap-state-persist':
+                self.ldap_state_persist = True
+            elif o == '--ldap-native':
+                gridutils.LDAP_NATIVE = True
             elif o == '--vo-fqan':
                 self.__set_fqan(v)
+            elif o == '--parallel-metrics':
+                try:
+                    self.parallel_metrics = int(v)
+                except ValueError:
+                    raise getopt.GetoptError(
+                            '--parallel-metrics must be an integer. %s given.' % v)
+            elif o == '--perf-timing':
+                self.perf_timing = True
+            elif o == '--output-budget':
+                try:
+                    self.output_budget = int(v)
+                except ValueError:
+                    raise getopt.GetoptError(
+                            '--output-budget must be an integer. %s given.' % v)
 
         if self.passcheckdest == 'nsca' and not self.nsca_server:
             errstr = "--nsca-server must be set if --pass-check-dest is set to 'nsca'."
@@ -498,6 +795,20 @@ Reporting passive checks (when used with wrapper checks)
         except KeyError, e:
             pass
 
+        if self.bdii_cache_ttl > 0:
+            gridutils.set_bdii_cache(os.path.join(self.workdir_run,
+                                        'bdii-cache.%i' % os.getuid()),
+                                     self.bdii_cache_ttl)
+        # share working and failed BDII endpoints and DNS lookups between
+        # probes
+        if os.path.isdir(self.workdir_run):
+            if self.ldap_state_persist:
+                gridutils.set_ldap_state(os.path.join(self.workdir_run,
+                                            '.ldap-state.%i' % os.getuid()))
+            if self.dns_cache_persist:
+                samutils.set_dns_cache(os.path.join(self.workdir_run,
+                                        '.dns-cache.%i' % os.getuid()))
+
     def __set_fqan(self, fqan):
         self.__fqan = fqan
         self.fqan_norm = self.__norm_fqan(fqan)
@@ -588,13 +899,33 @@ Reporting passive checks (when used with wrapper checks)
         'Header for details data.'
         import socket
         self.testing_from = 'Testing from: %s' % socket.gethostname() #@UndefinedVariable
-        self.testing_DN = 'DN: %s' % gridutils.get_testing_DN()
-        self.testing_VOMS_FQANs = 'VOMS FQANs: %s' % \
-                                        ', '.join(gridutils.get_voms_fqans())
+        # cached in the working directory per proxy file
+        cachedir = None
+        if os.path.isdir(self.workdir_run):
+            cachedir = self.workdir_run
+        dn, fqans = gridutils.get_proxy_identity(cachedir)
+        self.testing_DN = 'DN: %s' % dn
+        self.testing_VOMS_FQANs = 'VOMS FQANs: %s' % ', '.join(fqans)
         self.details_header = '%s\n%s\n%s' % (self.testing_from,
                                               self.testing_DN,
                                               self.testing_VOMS_FQANs)
 
+    def _get_details_header(self):
+        """Header for details data as set by L{_set_details_header()}.
+
+        @return: attributes of the header; can be passed to other gatherers
+            as C{detailsHeader} in C{tuples}.
+        @rtype: C{dict}
+        """
+        hdr = {}
+        for k in ['testing_from', 'testing_DN', 'testing_VOMS_FQANs',
+                  'details_header']:
+            try:
+                hdr[k] = getattr(self, k)
+            except AttributeError:
+                pass
+        return hdr
+
     def __get_cmd_opts_client(self):
         """Parse self.metrics dict to get command line options defined
         for each metric.
@@ -699,6 +1030,9 @@ Reporting passive checks (when used with wrapper checks)
                     sys.stdout.write(stsmsg)
                     sys.stdout.write(detmsg)
                     sys.exit(self.retCodes[status])
+            if self.detdata_max_size is not None:
+                self.__mo.set_spill(self.detdata_max_size,
+                                    self.workdir_metric)
 
     def list(self):
         "List all metric methods in this class"
@@ -709,7 +1043,16 @@ Reporting passive checks (when used with wrapper checks)
         return metrics
 
     def __get_perf_data(self):
+        st = self.__thread_state()
+        if st is not None:
+            return st['perf_data']
         return self.__perf_data
+    def __store_perf_data(self, data):
+        st = self.__thread_state()
+        if st is not None:
+            st['perf_data'] = data
+        else:
+            self.__perf_data = data
     def __set_perf_data(self, data):
         """Set Nagios performance data. Overloaded setter.
         data - PerfData|str|[('key', str|[int|long|float|str,..]|(int|long|float|str,..)), ..]
@@ -718,7 +1061,7 @@ Reporting passive checks (when used with wrapper checks)
         TypeError if one of the type requrements is not met.
         """
         if isinstance(data, str):
-            self.__perf_data = data
+            self.__store_perf_data(data)
         elif isinstance(data, list) or isinstance(data, tuple):
             pd = []
             for v in data:
@@ -734,9 +1077,9 @@ Reporting passive checks (when used with wrapper checks)
                         s = perfdata.PerfData.empty
                     if v[0]:
                         pd.append('%s=%s' % (v[0], s))
-            self.__perf_data = ' '.join(pd)
+            self.__store_perf_data(' '.join(pd))
         elif isinstance(data, perfdata.PerfData):
-            self.__perf_data = data.get()
+            self.__store_perf_data(data.get())
         else:
             raise TypeError('Expected str, list or tuple, got %s' % type(data))
     perf_data = property(__get_perf_data, __set_perf_data, None,
@@ -814,22 +1157,70 @@ Reporting passive checks (when used with wrapper checks)
             methodName = "metric" + metric
 
         if hasattr(self,methodName):
+            if self.perf_timing:
+                # don't carry over performance data of a previous metric
+                self.perf_data = ''
+                t0 = _times()
             try:
                 ret = getattr(self,methodName)()
             except StandardError:
                 samutils.exit_trace('UNKNOWN',
                            'unhandled exception while gathering metric results.')
+            if self.perf_timing:
+                timing = self.__record_timing(metric, t0)
             try:
-                return self._handle_metric_output(ret)
+                out = self._handle_metric_output(ret)
             except ErrProbeMetricOutputTypeError:
                 samutils.exit_trace('UNKNOWN',
                             'exception while processing metric results.')
+            if self.perf_timing:
+                pd = perfdata.PerfData(['time_%s' % x for x in TIMING_LABELS])
+                pd.update(timing)
+                out['perfData'] = ' '.join([x for x in
+                                    [out.get('perfData', ''), pd.get()] if x])
+            return out
         else:
             status = samutils.to_status(3)
             return {'metricStatus' : status,
                     'summaryData' : "%s: Metric %s does not exist." % \
                                     (status, metric)}
 
+    def __record_timing(self, metric, t0):
+        """Remember times of C{metric} started at C{t0} (see L{_times()}).
+
+        @return: performance data C{{'time_wall': '<sec>s', ...}}
+        @rtype: C{dict}
+        """
+        t1 = _times()
+        timing = [t1[i] - t0[i] for i in range(len(t0))]
+        self.__timings[metric] = timing
+        pd = {}
+        for i in range(len(timing)):
+            pd['time_%s' % TIMING_LABELS[i]] = '%.3fs' % timing[i]
+        return pd
+
+    def __set_metrics_timing(self, metricsRun):
+        """Set performance data to times of the metrics run by a wrapper
+        metric - C{<metric suffix>_wall}, etc. in C{metricsOrder} order. Metrics
+        that didn't run get zero times."""
+        labels = []
+        values = {}
+        for m in self.metrics[metricsRun]['metricsOrder']:
+            try:
+                timing = self.__timings[self.metrSuff2metrName(m)]
+            except KeyError:
+                timing = None
+            for i in range(len(TIMING_LABELS)):
+                label = '%s_%s' % (m, TIMING_LABELS[i])
+                labels.append(label)
+                if timing:
+                    values[label] = '%.3fs' % timing[i]
+                else:
+                    values[label] = '0.000s'
+        pd = perfdata.PerfData(labels)
+        pd.update(values)
+        self.perf_data = pd
+
     def desc(self, metric):
         "Return the test definition block"
         desc = None
@@ -904,6 +1295,49 @@ Reporting passive checks (when used with wrapper checks)
         "Gives envoked metric prefix"
         return self.__metricsPrefix
 
+    def __thread_state(self):
+        """Metric execution state private to the calling thread or C{None}
+        if the thread wasn't attached with L{_attach_thread()}."""
+        try:
+            return self.__thrstate[thread.get_ident()]
+        except (AttributeError, KeyError):
+            return None
+
+    def _attach_thread(self):
+        """Give the calling thread its own name of executed metric,
+        performance data and output container. Used to run metrics
+        concurrently."""
+        try:
+            states = self.__thrstate
+        except AttributeError:
+            states = self.__thrstate = {}
+        st = {'execMetric' : self.execMetric,
+              'perf_data'  : ''}
+        states[thread.get_ident()] = st
+        self.__mo.attach_thread()
+
+    def _detach_thread(self):
+        'Drop the state set up by L{_attach_thread()} for the calling thread.'
+        self.__mo.detach_thread()
+        try:
+            del self.__thrstate[thread.get_ident()]
+        except (AttributeError, KeyError):
+            pass
+
+    def __get_execmetric(self):
+        st = self.__thread_state()
+        if st is not None:
+            return st['execMetric']
+        return self.__execMetric
+    def __set_execmetric(self, metricName):
+        st = self.__thread_state()
+        if st is not None:
+            st['execMetric'] = metricName
+        else:
+            self.__execMetric = metricName
+    execMetric = property(__get_execmetric, __set_execmetric, None,
+                          "Name of the metric being executed.")
+
     def set_execMetric(self, metricName):
         "Set a name of a metric that was called."
         self.execMetric = metricName
@@ -977,7 +1411,8 @@ Reporting passive checks (when used with wrapper checks)
         except TypeError:
             pass
 
-        rc, lines = pexpectpgrp.spawn_cmd(cmd, setpgrp=setpgrp)
+        rc, lines = pexpectpgrp.spawn_cmd(cmd, setpgrp=setpgrp,
+                                capture=self._cmd_output_capture(cmd))
 
         if rc == 0:
             status = 'OK'
@@ -987,7 +1422,7 @@ Reporting passive checks (when used with wrapper checks)
                 stsmsg = ''
             detmsg = stsmsg+'\n'+lines
         else:
-            em = ErrorsMatching(self.errorDBFile, self.errorTopics)
+            em = get_errors_matching(self.errorDBFile, self.errorTopics)
             er = em.match(lines)
             if er:
                 status = er[0][2]
@@ -1006,6 +1441,29 @@ Reporting passive checks (when used with wrapper checks)
 
         return(self.retCodes[status], stsmsg, detmsg)
 
+    def _cmd_output_capture(self, cmd):
+        """Capture of output of C{cmd} bounded by L{cmd_output_head} and
+        L{cmd_output_tail}. Complete output is written to
+        C{<metric>.<command>.<pid>.<N>.out} in L{workdir_metric} (if it was
+        created with L{make_workdir()}); N - sequence number of the command
+        in the process.
+
+        @return: C{None} if output is not to be bounded.
+        @rtype: L{OutputCapture}
+        """
+        if self.cmd_output_head is None or self.cmd_output_tail is None:
+            return None
+        path = None
+        if self.workdir_metric and os.path.isdir(self.workdir_metric):
+            try:
+                prog = os.path.basename(cmd.split()[0])
+            except IndexError:
+                prog = 'cmd'
+            path = os.path.join(self.workdir_metric, '%s.%s.%i.%i.out' % \
+                                    (self.execMetric2MetricSuff(), prog,
+                                     os.getpid(), _next_cmd_seq()))
+        return OutputCapture(self.cmd_output_head, self.cmd_output_tail, path)
+
 #    def run_cmd2(self, cmd, verb='-v', _verbosity=None):
 #        """Run a command given by a user.
 #        The command will be started and the output processed in accordance
@@ -1214,7 +1672,7 @@ Reporting passive checks (when used with wrapper checks)
                 except KeyError:
                     stsmsg = status+': '
             else:
-                em = ErrorsMatching(self.errorDBFile, self.errorTopics)
+                em = get_errors_matching(self.errorDBFile, self.errorTopics)
                 er = em.match(stderr)
                 if er:
                     status = er[0][2]
@@ -1250,7 +1708,7 @@ Reporting passive checks (when used with wrapper checks)
                 except KeyError:
                     stsmsg = detmsg = status+': success.'
             else:
-                em = ErrorsMatching(self.errorDBFile, self.errorTopics)
+                em = get_errors_matching(self.errorDBFile, self.errorTopics)
                 er = em.match(stderr)
                 if er:
                     status = er[0][2]
@@ -1288,7 +1746,7 @@ Reporting passive checks (when used with wrapper checks)
                     stsmsg = status+': success.'
                 detmsg = '%s\n%s\n%s' % (stsmsg,cmd,stdout)
             else:
-                em = ErrorsMatching(self.errorDBFile, self.errorTopics)
+                em = get_errors_matching(self.errorDBFile, self.errorTopics)
                 er = em.match(stdout)
                 if er:
                     status = er[0][2]
@@ -1329,7 +1787,7 @@ Reporting passive checks (when used with wrapper checks)
                     stsmsg = status+': success.'
                 detmsg = '%s\n%s\n%s\n%s' % (stsmsg,config,cmd,stdout)
             else:
-                em = ErrorsMatching(self.errorDBFile, self.errorTopics)
+                em = get_errors_matching(self.errorDBFile, self.errorTopics)
                 er = em.match(stdout)
                 if er:
                     status = er[0][2]
@@ -1355,80 +1813,245 @@ Reporting passive checks (when used with wrapper checks)
         """Format and print metric results to stdout.
 
         - chres   - list of hashes with keys:
-                    host, service, status, summary, details
+                    host, service, status, summary, details[, perfData]
         """
         for d in chres:
             print 'metric results >>> <%s,%s>' % (str(d['host']),str(d['service']))
             print d['summary'].replace('\\n','\n')
-            print d['details'].replace('\\n','\n')
+            if d.get('perfData'):
+                print '%s|%s' % (d['details'].replace('\\n','\n'), d['perfData'])
+            else:
+                print d['details'].replace('\\n','\n')
 
-    def _submit_service_checks(self, chres):
-        """Publishe passive metrics to either of
-        - Nagios command file
-        - NSCA
+    def _get_publisher(self):
+        """Passive checks publisher (L{nagios.PassiveResultPublisher}) set up
+        for L{passcheckdest}. Created on first use; configuration is resolved
+        only then.
 
-        - chres - list of hashes with keys:
-                  host, service, status, summary, details
+        @raise ErrProbe: if NSCA client or its configuration is missing.
+        @raise nagios.ErrNagiosLib: on problems with configuration.
         """
-        if self.sanitize:
-            for i in range(len(chres)):
-                try:
-                    chres[i]['summary'] = samutils.outputsanitiser(chres[i]['summary'])
-                except StandardError: pass
-                try:
-                    chres[i]['details'] = samutils.outputsanitiser(chres[i]['details'])
-                except StandardError: pass
-        try:
-            if self.passcheckdest == 'nagcmd':
-                nagios.publishPassiveResultNAGCMD(self.nagcmdfile, chres)
-
-            elif self.passcheckdest == 'nsca':
+        if self.__publisher_of is not None:
+            return self.__publisher_of._get_publisher()
+        if self.__publisher is not None:
+            return self.__publisher
+        if self.passcheckdest == 'nagcmd':
+            conf = {'method' : 'nagioscmd',
+                    'nagcmd' : self.nagcmdfile}
+        elif self.passcheckdest == 'nsca':
+            if self.nsca_client != 'native':
                 try:
                     os.stat(self.send_nsca)
                 except OSError:
-                    raise ErrProbe(os.stat(self.send_nsca),
+                    raise ErrProbe(self.send_nsca,
                             "ERROR: NSCA client doesn't exist.")
-                try:
-                    os.stat(self.send_nsca_conf)
-                except OSError:
-                    raise ErrProbe(os.stat(self.send_nsca_conf),
-                            "ERROR: Nagios command file doesn't exist.")
+            try:
+                os.stat(self.send_nsca_conf)
+            except OSError:
+                raise ErrProbe(self.send_nsca_conf,
+                        "ERROR: NSCA configuration file doesn't exist.")
+            conf = {'method'      : 'nsca',
+                    'nsca_host'   : self.nsca_server,
+                    'nsca_port'   : self.nsca_port,
+                    'nsca_bin'    : self.send_nsca,
+                    'nsca_conf'   : self.send_nsca_conf,
+                    'nsca_batch'  : self.nsca_batch,
+                    'nsca_client' : self.nsca_client}
+        elif self.passcheckdest == 'config':
+            if self.passcheckconf:
+                conf = nagios.readPassiveResultConfig(self.passcheckconf)
+            else:
+                conf = nagios.readPassiveResultConfig()
+        else:
+            print "UNKNOWN: Unsupported passive check submission method: %s" % \
+                self.passcheckdest
+            sys.exit(3)
+        self.__publisher = nagios.PassiveResultPublisher(conf,
+                                        max_results=self.passcheck_max_results,
+                                        max_age=self.passcheck_max_age)
+        return self.__publisher
+
+    def __exit_on_publish_error(self, e):
+        status = 'UKNOWN'
+        sys.stdout.write(status+': exception publishing passive check\n')
+        sys.stdout.write(status+': exception publishing passive check\n%s\n'%\
+                         str(e))
+        sys.exit(samutils.to_retcode(status))
 
-                nagios.publishPassiveResultNSCA(self.send_nsca,
-                                self.send_nsca_conf, self.nsca_server,
-                                self.nsca_port, chres)
+    def _submit_service_checks(self, chres):
+        """Publishe passive metrics to either of
+        - Nagios command file
+        - NSCA
 
-            elif self.passcheckdest == 'active':
-                self.__submit_service_check_active(chres)
+        Results are queued in the publisher (see L{_get_publisher()}) and
+        published in batches. Call L{_flush_service_checks()} to publish
+        them all.
 
-            elif self.passcheckdest == 'config':
-                if self.passcheckconf:
-                    nagios.publishPassiveResult(chres,
-                                                modefile=self.passcheckconf)
-                else:
-                    nagios.publishPassiveResult(chres)
-            else:
-                print "UNKNOWN: Unsupported passive check submission method: %s" % \
-                    self.passcheckdest
-                sys.exit(3)
+        - chres - list of hashes with keys:
+                  host, service, status, summary, details[, perfData]
 
+        Plugin output is encoded by L{_encode_output()}.
+        """
+        if self.passcheckdest == 'active':
+            if self.sanitize:
+                for i in range(len(chres)):
+                    try:
+                        chres[i]['summary'] = samutils.outputsanitiser(chres[i]['summary'])
+                    except StandardError: pass
+                    try:
+                        chres[i]['details'] = samutils.outputsanitiser(chres[i]['details'])
+                    except StandardError: pass
+            self.__submit_service_check_active(chres)
+            return
+        try:
+            for r in chres:
+                try:
+                    r['output'] = self._encode_output(r)
+                except KeyError, e:
+                    raise nagios.ErrNagiosLib('Missing attribute: %s' % str(e))
+            self._get_publisher().publish(chres)
         except nagios.ErrNagiosLib, e:
-            status = 'UKNOWN'
-            sys.stdout.write(status+': exception publishing passive check\n')
-            sys.stdout.write(status+': exception publishing passive check\n%s\n'%\
-                             str(e))
-            sys.exit(samutils.to_retcode(status))
+            self.__exit_on_publish_error(e)
+
+    def _encode_output(self, result):
+        """Plugin output of passive check C{result} sanitised, escaped and
+        truncated to L{output_budget} (see L{samutils.encode_output()}).
+        Complete output of a truncated result is written to
+        C{<service>.output} in L{workdir_metric} (if it was created with
+        L{make_workdir()}) and referred to from the truncated one.
+
+        @param result: keys C{service}, C{summary}, C{details}, C{perfData}.
+        @type result: C{dict}
+        @rtype: C{str}
+        """
+        summary = result['summary']
+        details = result.get('details', '')
+        perf = result.get('perfData', '')
+        path = None
+        if self.output_budget is not None and self.workdir_metric and \
+                os.path.isdir(self.workdir_metric):
+            path = os.path.join(self.workdir_metric, '%s.output' % \
+                                re.sub('[^\w.-]', '_', str(result['service'])))
+        output, truncated = samutils.encode_output(summary, details, perf,
+                                                   self.output_budget,
+                                                   self.sanitize, path)
+        if truncated and path:
+            try:
+                fp = open(path, 'w')
+                try:
+                    fp.write('%s\n%s\n' % (summary, details))
+                    if perf:
+                        fp.write('|%s\n' % perf)
+                finally:
+                    fp.close()
+            except (IOError, OSError):
+                output, truncated = samutils.encode_output(summary, details,
+                                                           perf,
+                                                           self.output_budget,
+                                                           self.sanitize)
+        return output
+
+    def _set_publisher(self, gatherer):
+        "Publish passive checks results with the publisher of C{gatherer}."
+        self.__publisher_of = gatherer
+
+    def _flush_service_checks(self):
+        "Publish passive checks results queued by L{_submit_service_checks()}."
+        if self.__publisher_of is not None:
+            return self.__publisher_of._flush_service_checks()
+        if self.__publisher is None:
+            return
+        try:
+            self.__publisher.flush()
+        except nagios.ErrNagiosLib, e:
+            self.__exit_on_publish_error(e)
+
+    def _submit_metric_result(self, hostname, metricName, ret):
+        """Publish results of a metric run by a wrapper metric (or in batch
+        mode) as passive check result. With L{perf_timing} performance data
+        of the metric is published after the '|' of the plugin output.
+        """
+        # NB! Nasty HACK to overcome Nagios's deficiency.
+        #     Relevant when reporting passive check results.
+        #     Mangle actual VO-neutral metric name and add VO to it.
+        metricNameNagios = '%s-%s' % (metricName, self.fqan or self.voName)
+
+        result = {'host'   : hostname,
+                  'service': metricNameNagios,
+                  'status' : samutils.to_retcode(ret['metricStatus']),
+                  'summary': ret['summaryData'],
+                  'details': ret['detailsData']}
+        if self.perf_timing and ret.get('perfData'):
+            # hand performance data over separately - appended to the
+            # details it would be sanitised with them ('|' -> 'OR')
+            result['details'] = result['details'].rstrip('\n')
+            result['perfData'] = ret['perfData']
+        self._submit_service_checks([result])
+
+    def __submit_masked(self, hostname, metricName, summary, children):
+        """Publish passive check results with WARNING for the children of
+        a failed "node" metric.
+
+        - children - list of metrics suffixes
+        """
+        child_status = 'WARNING'
+        child_summary = '%s: Masked by %s - "%s"' % \
+                        (child_status, metricName, summary)
+        metric_res = []
+        for msuff in children:
+            metric_res.append({'host' : hostname,
+                'service'  : self.get_metricsPrefix()+'-'+msuff+'-%s' % \
+                                                (self.fqan or self.voName),
+                'status'   : str(self.retCodes[child_status]),
+                'summary'  : child_summary,
+                'details'  : ''})
+        if metric_res:
+            self._submit_service_checks(metric_res)
+
+    def __escalate_status(self, all_status, met_status):
+        """Should status of a failed "leaf" metric with "critical: Y"
+        override the current status of the wrapper?
+        """
+        if all_status == 'OK':
+            return True
+        elif met_status == 'CRITICAL' and all_status != 'CRITICAL':
+            return True
+        elif met_status == 'WARNING'  and all_status not in ('WARNING','CRITICAL'):
+            return True
+        return False
 
     def metricAll(self, metricsRun = 'All'):
         """Run metrics specified in self.metrics[metricsRun]['metricsOrder']
+
+        If L{parallel_metrics} is greater than one, the metrics are run
+        concurrently with L{_metricAll_parallel()}.
+
+        Passive checks results queued by the metrics are published before
+        returning, while the timeout for publishing is still armed. With
+        L{perf_timing} the times of the metrics are set as performance data.
         """
+        timing = self.perf_timing and self.metrics.has_key(metricsRun)
+        if timing:
+            for m in self.metrics[metricsRun]['metricsOrder']:
+                try:
+                    del self.__timings[self.metrSuff2metrName(m)]
+                except KeyError:
+                    pass
+        try:
+            return self.__metricAll(metricsRun)
+        finally:
+            if timing:
+                self.__set_metrics_timing(metricsRun)
+
+    def __metricAll(self, metricsRun):
 
         # hostname to uniquely define a service
-        hostname = ''
-        try:
-            hostname = os.environ['NAGIOS_HOSTNAME']
-        except KeyError:
-            hostname = self.hostName
+        hostname = self.nagios_hostname
+        if not hostname:
+            try:
+                hostname = os.environ['NAGIOS_HOSTNAME']
+            except KeyError:
+                hostname = self.hostName
 
         all_status = 'OK'
         all_summary = 'success.'
@@ -1451,8 +2074,10 @@ Reporting passive checks (when used with wrapper checks)
             sys.stdout.write('Defined metrics are:\n'+'\n'.join(msl)+'\n')
             sys.exit(samutils.to_retcode(all_status))
 
+        if self.parallel_metrics > 1:
+            return self._metricAll_parallel(metricsRun, hostname)
+
         for metricSuff in self.metrics[metricsRun]['metricsOrder']:
-            metricPref = self.get_metricsPrefix()
             metricName = self.metrSuff2metrName(metricSuff)
             all_detmsg += 'Invoking metric: [%s] %s\n' % \
                         (samutils.time_now(), metricName)
@@ -1470,56 +2095,31 @@ Reporting passive checks (when used with wrapper checks)
                 ret['metricStatus'] = 'WARNING'
                 ret['summaryData'] = 'Timed out. %s' % str(e)
                 # get what the metric was able to gather so far
-                if len(signaling.proc) == 1: # was running in a single threaded mode
-                    self.printd(signaling.proc.values()[0].output, cr=False)
+                self.printd(self._output_so_far(), cr=False)
                 ret['detailsData'] = self.get_detdata()
                 timedout = True
-                signal.alarm(3)
-
-            # NB! Nasty HACK to overcome Nagios's deficiency.
-            #     Relevant when reporting passive check results.
-            #     Mangle actual VO-neutral metric name and add VO to it.
-            metricNameNagios = '%s-%s' % (metricName, self.fqan or self.voName)
+                _alarm(3)
 
             try:
-                self._submit_service_checks([{
-                             'host'   : hostname,
-                             'service': metricNameNagios,
-                             'status' : samutils.to_retcode(ret['metricStatus']),
-                             'summary': ret['summaryData'],
-                             'details': ret['detailsData'].replace('\n','\\n')}])
+                self._submit_metric_result(hostname, metricName, ret)
                 met_status = ret['metricStatus']
                 if met_status != 'OK':
                     # publish Nagios passive check results with WARNING for the
                     # siblings of the "node" metric
                     if len(self.metrics[metricSuff]['metricChildren']) > 0 or timedout:
-                        child_status = 'WARNING'
-                        child_summary = '%s: Masked by %s - "%s"' % \
-                                        (child_status, metricName, ret['summaryData'])
-                        metric_res = []
-                        for msuff in self.metrics[metricSuff]['metricChildren']:
-                            metric_res.append({'host' : hostname,
-                                'service'  : metricPref+'-'+msuff+'-%s' % (self.fqan or self.voName),
-                                'status'   : str(self.retCodes[child_status]),
-                                'summary'  : child_summary,
-                                'details'  : ''})
-                        self._submit_service_checks(metric_res)
+                        self.__submit_masked(hostname, metricName,
+                                     ret['summaryData'],
+                                     self.metrics[metricSuff]['metricChildren'])
                         all_summary = 'METRIC FAILED [%s]: %s' % \
                                     (metricName, ret['summaryData'])
                         all_detmsg += '%s\n' % all_summary
-                        signal.alarm(0)
+                        self._flush_service_checks()
+                        _alarm(0)
                         return (met_status, all_summary, all_detmsg)
                     # set proper status for failed "leaf" metrics
                     elif self.metrics[metricSuff].has_key('critical') and \
                         self.metrics[metricSuff]['critical'] == 'Y':
-                        c = False
-                        if all_status == 'OK':
-                            c = True
-                        elif met_status == 'CRITICAL' and all_status != 'CRITICAL':
-                            c = True
-                        elif met_status == 'WARNING'  and all_status not in ('WARNING','CRITICAL'):
-                            c = True
-                        if c:
+                        if self.__escalate_status(all_status, met_status):
                             all_status = met_status
                             all_summary = 'METRIC FAILED [%s]: %s' % \
                                         (metricName, ret['summaryData'])
@@ -1528,14 +2128,209 @@ Reporting passive checks (when used with wrapper checks)
                         """Leaf metricis w/o "critical: Y"
                            don't affect status of the wrapper."""
             except signaling.TimeoutError, e:
-                all_status = 'UNKOWN'
-                all_summary = 'Timed out while publishing metric results. %s' % str(e)
-                all_detmsg += all_summary + '\n'
-                all_detmsg += '='*25 + '\n'
-                all_detmsg += '* Last metric: %s\n' % metricName
-                all_detmsg += '* Details data:\n%s' % ret['detailsData']
-                return (all_status, all_summary, all_detmsg)
+                return self.__publish_timedout(e, metricName, ret, all_detmsg)
+
+        try:
+            self._flush_service_checks()
+        except signaling.TimeoutError, e:
+            return self.__publish_timedout(e, metricName, ret, all_detmsg)
+        return (all_status, all_summary, all_detmsg)
+
+    def __publish_timedout(self, e, metricName, ret, all_detmsg):
+        """Result of a wrapper metric timed out while publishing results
+        of its metrics; C{ret} - results of the last metric.
+        """
+        all_status = 'UNKNOWN'
+        all_summary = 'Timed out while publishing metric results. %s' % str(e)
+        all_detmsg += all_summary + '\n'
+        all_detmsg += '='*25 + '\n'
+        all_detmsg += '* Last metric: %s\n' % metricName
+        all_detmsg += '* Details data:\n%s' % ret['detailsData']
+        return (all_status, all_summary, all_detmsg)
+
+    def _output_so_far(self):
+        """Output gathered so far by the command of a timed out metric.
+
+        Children of all threads are booked in the process-wide
+        C{signaling.proc}, so, the output is known only if a single command
+        is running and metrics are not run concurrently
+        (L{parallel_metrics}); C{''} otherwise.
+        """
+        if self.parallel_metrics > 1 or len(signaling.proc) != 1:
+            return ''
+        return signaling.proc.values()[0].output
+
+    def __metrics_dag(self, metricsRun):
+        """Dependency graph of the metrics run by a wrapper metric.
+
+        A metric depends on all the metrics from
+        C{self.metrics[metricsRun]['metricsOrder']}, which list it in their
+        C{metricChildren}.
+
+        @return: (order, parents, children)
+          - order - C{list} of metrics suffixes as given in C{metricsOrder}
+          - parents - C{dict} metric suffix: C{list} of metrics it depends on
+          - children - C{dict} metric suffix: C{list} of dependent metrics
+        @rtype: C{tuple}
+        """
+        order = list(self.metrics[metricsRun]['metricsOrder'])
+        parents = {}
+        children = {}
+        for m in order:
+            parents[m] = []
+            children[m] = []
+        for m in order:
+            try:
+                chlds = self.metrics[m]['metricChildren']
+            except KeyError:
+                chlds = []
+            for c in chlds:
+                if parents.has_key(c) and c != m and not m in parents[c]:
+                    parents[c].append(m)
+                    children[m].append(c)
+        return (order, parents, children)
+
+    def _gather_in_thread(self, metricName):
+        """Run L{gather()} for a metric in a worker thread with the thread's own
+        metric state and output container."""
+        self._attach_thread()
+        try:
+            try:
+                return self.gather(metricName)
+            except SystemExit:
+                status = 'UNKNOWN'
+                return {'metricStatus' : status,
+                        'summaryData'  : '%s: metric %s exited prematurely.' % \
+                                                (status, metricName),
+                        'detailsData'  : self.get_detdata()}
+        finally:
+            self._detach_thread()
+
+    def _metricAll_parallel(self, metricsRun, hostname):
+        """Run metrics specified in self.metrics[metricsRun]['metricsOrder']
+        on a pool of L{parallel_metrics} worker threads.
+
+        Metrics are started in C{metricsOrder} order as soon as all metrics
+        they depend on (see L{__metrics_dag()}) have finished with OK. When a
+        metric with children fails or times out, its dependent metrics are
+        not run, but published as masked by the failed metric. Independent
+        metrics carry on. The first failed "node" metric defines the status
+        of the wrapper; otherwise, "leaf" metrics with C{critical: Y} do as in
+        the sequential mode.
+
+        @param metricsRun: wrapper metric suffix.
+        @param hostname: hostname to publish passive checks results for.
+        @return: (status, summary, details)
+        @rtype: C{tuple}
+        """
+        order, parents, children = self.__metrics_dag(metricsRun)
+
+        all_status = 'OK'
+        all_summary = 'success.'
+        all_detmsg = ''
+        node_failure = None
+
+        # pending, running, done, masked
+        state = dict.fromkeys(order, 'pending')
+        succeeded = {}
+        running = []
+
+        def descendants(m):
+            res = []
+            todo = list(children[m])
+            while todo:
+                c = todo.pop(0)
+                if state[c] == 'pending' and not c in res:
+                    res.append(c)
+                    todo.extend(children[c])
+            return res
+
+        def mask(metricName, m, summary):
+            ds = descendants(m)
+            for c in ds:
+                state[c] = 'masked'
+            self.__submit_masked(hostname, metricName, summary, ds)
+
+        pool = WorkerPool(self.parallel_metrics)
+        metricName = ''
+        ret = dict.fromkeys(['metricStatus','summaryData','detailsData'],'')
+        try:
+            try:
+                while True:
+                    for m in order:
+                        if state[m] != 'pending':
+                            continue
+                        ready = True
+                        for p in parents[m]:
+                            if not succeeded.has_key(p):
+                                ready = False
+                                break
+                        if ready:
+                            name = self.metrSuff2metrName(m)
+                            all_detmsg += 'Invoking metric: [%s] %s\n' % \
+                                                (samutils.time_now(), name)
+                            state[m] = 'running'
+                            running.append(m)
+                            pool.submit(m, self._gather_in_thread, (name,))
+                    if not pool.pending():
+                        break
+
+                    m, ret, exc = pool.get_result()
+                    state[m] = 'done'
+                    running.remove(m)
+                    metricName = self.metrSuff2metrName(m)
+                    if exc:
+                        status = 'UNKNOWN'
+                        ret = {'metricStatus' : status,
+                               'summaryData'  : '%s: exception while gathering '
+                                    'metric results. %s' % (status, exc[1]),
+                               'detailsData'  : ''}
+
+                    self._submit_metric_result(hostname, metricName, ret)
+                    met_status = ret['metricStatus']
+                    if met_status == 'OK':
+                        succeeded[m] = 1
+                    elif children[m]:
+                        mask(metricName, m, ret['summaryData'])
+                        summary = 'METRIC FAILED [%s]: %s' % \
+                                        (metricName, ret['summaryData'])
+                        all_detmsg += '%s\n' % summary
+                        if not node_failure:
+                            node_failure = (met_status, summary)
+                    elif self.metrics[m].has_key('critical') and \
+                            self.metrics[m]['critical'] == 'Y':
+                        if self.__escalate_status(all_status, met_status):
+                            all_status = met_status
+                            all_summary = 'METRIC FAILED [%s]: %s' % \
+                                        (metricName, ret['summaryData'])
+                            all_detmsg += '%s\n' % all_summary
+                self._flush_service_checks()
 
+            except signaling.TimeoutError, e:
+                _alarm(3)
+                try:
+                    for m in running:
+                        metricName = self.metrSuff2metrName(m)
+                        ret = {'metricStatus' : 'WARNING',
+                               'summaryData'  : 'Timed out. %s' % str(e),
+                               'detailsData'  : ''}
+                        self._submit_metric_result(hostname, metricName, ret)
+                        mask(metricName, m, ret['summaryData'])
+                        summary = 'METRIC FAILED [%s]: %s' % \
+                                        (metricName, ret['summaryData'])
+                        all_detmsg += '%s\n' % summary
+                        if not node_failure:
+                            node_failure = (ret['metricStatus'], summary)
+                    self._flush_service_checks()
+                except signaling.TimeoutError, e:
+                    return self.__publish_timedout(e, metricName, ret,
+                                                   all_detmsg)
+        finally:
+            pool.shutdown()
+
+        if node_failure:
+            _alarm(0)
+            return (node_failure[0], node_failure[1], all_detmsg)
         return (all_status, all_summary, all_detmsg)
 
     def metricDefault(self):
@@ -1546,6 +2341,13 @@ Reporting passive checks (when used with wrapper checks)
 class Runner:
     """Metrics runner.
     """
+    # Number of hosts checked concurrently in batch mode
+    batch_workers = 10
+
+    # Number of functions listed in the summary of a profiled check
+    profile_top = 5
+    profile_summary = ''
+
     def __init__(self, gathererClass, renderer = ProbeFormatRenderer()):
         """Set metrics gatherer and metric results format renderer.
 
@@ -1558,6 +2360,235 @@ class Runner:
         self.gathererClass = gathererClass
         self.renderer = renderer
 
+    def serve(self, path, max_children=None):
+        """Run the probe as a persistent daemon serving check requests on
+        UNIX socket C{path}. See L{gridmon.probedaemon}.
+
+        @param path: UNIX socket to listen on.
+        @type path: C{str}
+        @param max_children: maximum number of concurrently run checks.
+        @type max_children: C{int}
+
+        @return: exit code of the daemon.
+        @rtype: C{int}
+        """
+        from gridmon.probedaemon import ProbeDaemon, MAX_CHILDREN
+        return ProbeDaemon(self, path,
+                           max_children or MAX_CHILDREN).serve_forever()
+
+    def _read_hosts(self, path):
+        """Read hosts to be tested in batch mode. One host per line:
+        C{<FQDN|URI> [<Nagios host name>]}. Empty lines and lines starting
+        with C{#} are skipped.
+
+        @param path: file to read; C{-} - standard input.
+        @type path: C{str}
+
+        @return: list of (FQDN or URI, Nagios host name or C{None})
+        @rtype: C{list}
+
+        @raise IOError: if the file can't be read.
+        """
+        if path == '-':
+            fp = sys.stdin
+        else:
+            fp = open(path)
+        hosts = []
+        try:
+            for line in fp.readlines():
+                fields = line.split()
+                if not fields or fields[0].startswith('#'):
+                    continue
+                if len(fields) > 1:
+                    hosts.append((fields[0], fields[1]))
+                else:
+                    hosts.append((fields[0], None))
+        finally:
+            if fp is not sys.stdin:
+                fp.close()
+        return hosts
+
+    def run_batch(self, tuples, metric, hosts, workers=None):
+        """Run a metric against a number of hosts in one process.
+
+        A gatherer is created for every host. The details header (proxy's
+        DN and VOMS FQANs) is built only once for the batch. The metric is
+        gathered on a pool of C{workers} threads and results for each host
+        are published as passive checks results. Global timeout given in
+        C{tuples} applies to the whole batch; hosts not finished in time are
+        published with WARNING.
+
+        @param tuples: parameters as prepared by L{run()}.
+        @type tuples: C{dict}
+        @param metric: name of a metric to run.
+        @type metric: C{str}
+        @param hosts: list of (FQDN or URI, Nagios host name or C{None}).
+        @type hosts: C{list}
+        @param workers: maximum number of hosts checked concurrently
+            (Default: L{batch_workers}).
+        @type workers: C{int}
+
+        @return: exit code of the batch check.
+        @rtype: C{int}
+        """
+        sanitize = tuples.get('sanitize', True)
+        output_format = tuples.get('outputFormat')
+        if not hosts:
+            return self.renderer.render({'metricStatus' : 'UNKNOWN',
+                                         'summaryData'  : 'UNKNOWN: no hosts to test given.'},
+                                        sanitize=sanitize,
+                                        output_format=output_format)
+
+        gatherers = []
+        header = None
+        for uri, nagios_hostname in hosts:
+            t = tuples.copy()
+            t['serviceURI'] = uri
+            if header is not None:
+                t['detailsHeader'] = header
+            try:
+                gatherer = self.gathererClass(t)
+            except StandardError:
+                samutils.exit_trace('UNKNOWN',
+                       'exception while initializing metric gatherer for %s.' % uri)
+            if header is None:
+                header = gatherer._get_details_header()
+            gatherer.nagios_hostname = nagios_hostname or gatherer.hostName
+            if gatherers:
+                # results of all hosts are published in common batches
+                gatherer._set_publisher(gatherers[0])
+            gatherers.append(gatherer)
+
+        try:
+            metricName = gatherers[0].metrSuff2metrName(metric)
+        except KeyError:
+            metricName = metric
+
+        results = [None] * len(gatherers)
+        signal.signal(signal.SIGTERM, signaling.sig_alrm)
+        signal.signal(signal.SIGALRM, signaling.sig_alrm)
+        signal.alarm(int(tuples['timeout']))
+        pool = WorkerPool(min(workers or self.batch_workers, len(gatherers)))
+        try:
+            try:
+                for i in range(len(gatherers)):
+                    pool.submit(i, gatherers[i]._gather_in_thread, (metric,))
+                while pool.pending():
+                    i, ret, exc = pool.get_result()
+                    if exc:
+                        status = 'UNKNOWN'
+                        ret = {'metricStatus' : status,
+                               'summaryData'  : '%s: exception while gathering '
+                                    'metric results. %s' % (status, exc[1]),
+                               'detailsData'  : ''}
+                    results[i] = ret
+                    g = gatherers[i]
+                    g._submit_metric_result(g.nagios_hostname, metricName, ret)
+            except signaling.TimeoutError, e:
+                signal.alarm(3)
+                for i in range(len(gatherers)):
+                    if results[i] is None:
+                        ret = {'metricStatus' : 'WARNING',
+                               'summaryData'  : 'WARNING: Timed out. %s' % str(e),
+                               'detailsData'  : ''}
+                        results[i] = ret
+                        g = gatherers[i]
+                        g._submit_metric_result(g.nagios_hostname, metricName,
+                                                ret)
+        finally:
+            pool.shutdown()
+        try:
+            gatherers[0]._flush_service_checks()
+        except signaling.TimeoutError:
+            pass
+        signal.alarm(0)
+
+        # overall status is the worst one
+        severity = {'OK' : 0, 'WARNING' : 1, 'UNKNOWN' : 2, 'CRITICAL' : 3}
+        counts = dict.fromkeys(severity.keys(), 0)
+        all_status = 'OK'
+        details = []
+        for i in range(len(gatherers)):
+            status = samutils.to_status(results[i]['metricStatus'])
+            if not severity.has_key(status):
+                status = 'UNKNOWN'
+            counts[status] += 1
+            if severity[status] > severity[all_status]:
+                all_status = status
+            details.append('%s: %s' % (gatherers[i].nagios_hostname,
+                                       results[i]['summaryData']))
+        summary = '%s: %s run against %i hosts. OK: %i, WARNING: %i, ' \
+                  'CRITICAL: %i, UNKNOWN: %i' % (all_status, metricName,
+                          len(gatherers), counts['OK'], counts['WARNING'],
+                          counts['CRITICAL'], counts['UNKNOWN'])
+        if (output_format or self.renderer.output_format) == 'jsonl':
+            # a line per host and the summary line
+            records = []
+            for i in range(len(gatherers)):
+                record = results[i].copy()
+                record['hostName'] = gatherers[i].nagios_hostname
+                records.append(record)
+            records.append({'metricStatus' : all_status,
+                            'summaryData'  : summary})
+            return self.renderer.render_many(records,
+                                        output_format=output_format)[-1]
+        return self.renderer.render({'metricStatus' : all_status,
+                                     'summaryData'  : summary,
+                                     'detailsData'  : '\n'.join(details)},
+                                    sanitize=sanitize,
+                                    output_format=output_format)
+
+    def _gather_profiled(self, gatherer, metric, directory):
+        """Run L{MetricGatherer.gather()} under profiler. Profile data is
+        written to C{<directory>/<host>.<metric>.<timestamp>.<pid>.pstats},
+        also if the metric times out. One line summary of the data is kept in
+        L{profile_summary}.
+
+        @return: result of C{gather()}.
+        @rtype: C{dict}
+        """
+        prof = _profiler()
+        try:
+            return prof.runcall(gatherer.gather, metric,
+                                clear_summary_details=False)
+        finally:
+            self.profile_summary = self._write_profile(prof, directory,
+                                                       gatherer.hostName,
+                                                       metric)
+
+    def _write_profile(self, prof, directory, host, metric):
+        """Dump profile data and summarise functions with the highest
+        internal time.
+
+        @return: one line summary or error message.
+        @rtype: C{str}
+        """
+        import pstats
+        name = '%s.%s.%s.%i.pstats' % (host, metric,
+                                       time.strftime('%Y%m%dT%H%M%S'),
+                                       os.getpid())
+        path = os.path.join(directory, re.sub('[^\w.-]', '_', name))
+        try:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            prof.dump_stats(path)
+            stats = pstats.Stats(path)
+        except (OSError, IOError), e:
+            return 'Profile: failed writing %s. %s' % (path, str(e))
+        funcs = [(v[2], k) for k, v in stats.stats.items()]
+        funcs.sort()
+        funcs.reverse()
+        top = []
+        for tt, (fn, line, func) in funcs[:self.profile_top]:
+            if fn == '~':
+                top.append('%s %.3fs' % (func, tt))
+            else:
+                top.append('%s:%i(%s) %.3fs' % (os.path.basename(fn), line,
+                                                func, tt))
+        return 'Profile %s: %i calls in %.3fs. Top: %s' % (path,
+                                    stats.total_calls, stats.total_tt,
+                                    ', '.join(top))
+
     def _set_probeshome(self):
         if not os.environ.has_key('PROBES_HOME'):
             os.environ['PROBES_HOME'] = \
@@ -1583,6 +2614,12 @@ class Runner:
         list_metrics=None
         help=None
         sanitize = True
+        daemon = None
+        daemon_children = None
+        hosts_file = None
+        batch_workers = None
+        profile_dir = None
+        output_format = None
         # order: X509_USER_PROXY, -x, default
         proxy = os.environ.get('X509_USER_PROXY',
                                '/tmp/x509up_u'+str(os.geteuid()))
@@ -1607,8 +2644,24 @@ specific parameters>]
 -l|--list          Metrics list in WLCG format
 -x                 VOMS proxy (Order: -x, X509_USER_PROXY, /tmp/x509up_u<UID>)
 --nosanity         Don't sanitize metrics output.
-
-  Mandatory paramters: hostname (-H) or URI (-u).
+--daemon <socket>  Run as a daemon serving checks requested over the UNIX
+                   socket. Use gridmon-probe-client as the check command.
+--daemon-children <N>  Maximum number of checks run concurrently by the
+                   daemon.
+--hosts-file <file> Batch mode. Run the metric against all hosts listed in
+                   the file ('-' - standard input), one '<FQDN|URI> [<Nagios
+                   host name>]' per line. Results are published as passive
+                   checks. The timeout applies to the whole batch.
+--batch-workers <N> Number of hosts tested concurrently in batch mode.
+                   (Default: %i)
+--profile <dir>    Run the check under profiler and write the profile data
+                   to <dir>/<host>.<metric>.<timestamp>.<pid>.pstats. With
+                   verbosity 3 a summary is added to details data. Not used
+                   with --daemon or --hosts-file.
+--output-format <nagios|jsonl>  Nagios plugin output (default) or a JSON
+                   object per line - per host and the summary in batch mode.
+
+  Mandatory paramters: hostname (-H) or URI (-u), or --hosts-file.
 
   If specified with -m|--metric <name>, the given metric will be executed.
   Otherwise, a wrapper metric (acting as an active check) will be run. The
@@ -1620,7 +2673,8 @@ specific parameters>]
      tuples['timeout'],
      VERBOSITY_MIN,
      VERBOSITY_MAX,
-     tuples['verbosity'])
+     tuples['verbosity'],
+     self.batch_workers)
 
         opts,_ = (None,None)
         try:
@@ -1634,7 +2688,13 @@ specific parameters>]
                                                 'hostname=',
                                                 'verbose=',
                                                 'list',
-                                                'wlcg'])
+                                                'wlcg',
+                                                'daemon=',
+                                                'daemon-children=',
+                                                'hosts-file=',
+                                                'batch-workers=',
+                                                'profile=',
+                                                'output-format='])
         except getopt.GetoptError, e:
             sys.stdout.write(usage)
             sys.stdout.write("Error: %s\n"% str(e))
@@ -1651,6 +2711,13 @@ specific parameters>]
             sys.stdout.write(usage)
             sys.stdout.write("""Error:
  -u|--uri and -H|--hostname cannot be given together.
+""")
+            sys.exit(1)
+        if '--hosts-file' in k and \
+            ('-u' in k or '--uri' in k or '-H' in k or '--hostname' in k):
+            sys.stdout.write(usage)
+            sys.stdout.write("""Error:
+ --hosts-file cannot be given together with -u|--uri or -H|--hostname.
 """)
             sys.exit(1)
 
@@ -1687,18 +2754,46 @@ specific parameters>]
                     proxy = v
                 elif o == '--nosanity':
                     sanitize = False
+                elif o == '--daemon':
+                    daemon = v
+                elif o == '--daemon-children':
+                    daemon_children = int(v)
+                elif o == '--hosts-file':
+                    hosts_file = v
+                elif o == '--batch-workers':
+                    batch_workers = int(v)
+                elif o == '--profile':
+                    profile_dir = v
+                elif o == '--output-format':
+                    if not v in ProbeFormatRenderer.FORMATS:
+                        raise ValueError('unknown output format %s' % v)
+                    output_format = v
                 else:
                     tuples['metricOptions'] += ' '+o+' '+v+' '
 
             tuples['sanitize'] = sanitize
+            tuples['outputFormat'] = output_format
 
         except (getopt.GetoptError, ValueError), e:
             sys.stdout.write(usage)
             sys.stdout.write("Error : %s\n"% e)
             sys.exit(1)
 
+        if daemon:
+            return self.serve(daemon, daemon_children)
+
         os.environ['X509_USER_PROXY'] = proxy
 
+        if hosts_file and not (help or list_metrics or list_versions):
+            try:
+                hosts = self._read_hosts(hosts_file)
+            except IOError, e:
+                sys.stdout.write('UNKNOWN: failed to read hosts file.\n')
+                sys.stdout.write('UNKNOWN: failed to read hosts file. %s\n' % \
+                                 str(e))
+                sys.exit(3)
+            return self.run_batch(tuples, metric, hosts, batch_workers)
+
         if not tuples.has_key('serviceURI'):
             # UGH ! Need to do this, just to pull some version stuff
             # out of the probe
@@ -1746,17 +2841,33 @@ specific parameters>]
         signal.signal(signal.SIGALRM, signaling.sig_alrm)
         signal.alarm(int(tuples['timeout']))
         try:
-            result = gatherer.gather(metric, clear_summary_details=False)
+            if profile_dir:
+                result = self._gather_profiled(gatherer, metric, profile_dir)
+                if tuples['verbosity'] >= VERBOSITY_MAX:
+                    result['detailsData'] = '%s\n%s' % (
+                                result.get('detailsData', '').rstrip('\n'),
+                                self.profile_summary)
+            else:
+                result = gatherer.gather(metric, clear_summary_details=False)
+            gatherer._flush_service_checks()
         except signaling.TimeoutError, e:
             summary = 'Timed out. %s' % str(e)
-            if len(signaling.proc) == 1: # was running in a single threaded mode
-                gatherer.printd(signaling.proc.values()[0].output, cr=False)
+            gatherer.printd(gatherer._output_so_far(), cr=False)
             gatherer.printd('\n' + summary)
+            if profile_dir:
+                gatherer.printd(self.profile_summary, v=VERBOSITY_MAX)
+            signal.alarm(3)
+            try:
+                gatherer._flush_service_checks()
+            except signaling.TimeoutError:
+                pass
             return self.renderer.render(
                         gatherer._handle_metric_output(('WARNING', summary)),
-                                                        sanitize=sanitize)
+                                                        sanitize=sanitize,
+                                                output_format=output_format)
         except KeyboardInterrupt, e:
             sys.stdout.write('KeyboardInterrupt\n')
             sys.exit(1)
 
-        return self.renderer.render(result, sanitize=sanitize)
+        return self.renderer.render(result, sanitize=sanitize,
+                                    output_format=output_format)
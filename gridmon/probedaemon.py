@@ -0,0 +1,381 @@
+##############################################################################
+#
+# NAME:        probedaemon.py
+#
+# FACILITY:    SAM (Service Availability Monitoring)
+#
+# COPYRIGHT:
+#         Copyright (c) 2009, Members of the EGEE Collaboration.
+#         http://www.eu-egee.org/partners/
+#         Licensed under the Apache License, Version 2.0.
+#         http://www.apache.org/licenses/LICENSE-2.0
+#         This software is provided "as is", without warranties
+#         or conditions of any kind, either express or implied.
+#
+# DESCRIPTION:
+#
+#         Persistent probe daemon and its client.
+#
+# AUTHORS:     SAM team, CERN
+#
+# CREATED:     16-Oct-2026
+#
+##############################################################################
+
+"""
+Persistent probe daemon and its client.
+
+`ProbeDaemon` listens on a local UNIX socket on behalf of a probe, which
+has already imported the framework and its own modules. For every check
+request it forks a child that runs `gridmon.probe.Runner.run()` with the
+command line, environment and working directory of the requesting client.
+Output of the child (stdout and stderr) and its exit code are sent back to
+the client. Forking per request keeps the checks isolated from each other
+(probes rely on class level state, signals and ``sys.exit()``), while
+interpreter startup and imports are paid once.
+
+`client_main()` is a shim to be executed by Nagios in place of the probe::
+
+    gridmon-probe-client [-f <probe>] <socket> [probe parameters]
+
+Wire format: both request and response are sequences of netstrings
+(``<length>:<data>,``). Request: protocol version, working directory,
+number of arguments, arguments, number of environment variables,
+``KEY=value`` pairs. Response: exit code, output.
+"""
+
+__docformat__ = 'restructuredtext en'
+
+import os
+import sys
+import stat
+import errno
+import signal
+import select
+import socket
+import getopt
+import tempfile
+
+__all__ = ['ProbeDaemon',
+           'ErrProbeDaemon',
+           'ErrProbeDaemonConnect',
+           'request',
+           'client_main']
+
+PROTO_VERSION = '1'
+
+MAX_CHILDREN = 20
+"default maximum number of checks run concurrently by the daemon."
+
+CLIENT_TIMEOUT = 900
+"seconds a client waits for a response from the daemon."
+
+class ErrProbeDaemon(Exception):
+    "Probe daemon protocol or connection error."
+
+class ErrProbeDaemonConnect(ErrProbeDaemon):
+    "Probe daemon can't be connected."
+
+def _sig_term(sig, frame):
+    raise SystemExit(0)
+
+def _pack(strings):
+    return ''.join(['%d:%s,' % (len(s), s) for s in strings])
+
+def _unpack(data):
+    """Split a string of netstrings.
+
+    :raises `ErrProbeDaemon`: on malformed data.
+    """
+    res = []
+    i = 0
+    l = len(data)
+    while i < l:
+        j = data.find(':', i)
+        if j < 0:
+            raise ErrProbeDaemon('Malformed message.')
+        try:
+            n = int(data[i:j])
+        except ValueError:
+            raise ErrProbeDaemon('Malformed message.')
+        if data[j+1+n:j+2+n] != ',':
+            raise ErrProbeDaemon('Malformed message.')
+        res.append(data[j+1:j+1+n])
+        i = j + 2 + n
+    return res
+
+def _recv_all(sock):
+    chunks = []
+    while True:
+        try:
+            d = sock.recv(65536)
+        except socket.error, e:
+            if e[0] == errno.EINTR:
+                continue
+            raise
+        if not d:
+            break
+        chunks.append(d)
+    return ''.join(chunks)
+
+def _encode_request(argv, env, cwd):
+    strings = [PROTO_VERSION, cwd, str(len(argv))]
+    strings.extend(argv)
+    envl = ['%s=%s' % (k, v) for k, v in env.items()]
+    strings.append(str(len(envl)))
+    strings.extend(envl)
+    return _pack(strings)
+
+def _decode_request(data):
+    """:return: (argv, env, cwd)
+    :raises `ErrProbeDaemon`: on malformed request.
+    """
+    f = _unpack(data)
+    try:
+        if f[0] != PROTO_VERSION:
+            raise ErrProbeDaemon('Unsupported protocol version %s.' % f[0])
+        cwd = f[1]
+        n = int(f[2])
+        argv = f[3:3+n]
+        m = int(f[3+n])
+        env = {}
+        for kv in f[4+n:4+n+m]:
+            k, v = kv.split('=', 1)
+            env[k] = v
+    except (IndexError, ValueError):
+        raise ErrProbeDaemon('Malformed request.')
+    return argv, env, cwd
+
+class ProbeDaemon(object):
+    """Serve probe check requests over a local UNIX socket.
+    """
+    def __init__(self, runner, path, max_children=MAX_CHILDREN):
+        """Initialise `ProbeDaemon`.
+
+        :param runner: runner of the probe (`gridmon.probe.Runner`).
+        :param path: UNIX socket to listen on. Created with ``0600``
+          permissions, as requests are run with the daemon's credentials.
+        :type path: `str`
+        :param max_children: maximum number of checks run concurrently.
+        :type max_children: `int`
+        """
+        self.runner = runner
+        self.path = path
+        self.max_children = max(int(max_children), 1)
+        self.__children = {}
+        self.__sock = None
+
+    def __listen(self):
+        try:
+            if stat.S_ISSOCK(os.stat(self.path)[stat.ST_MODE]):
+                os.unlink(self.path)
+        except OSError:
+            pass
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        umask = os.umask(077)
+        try:
+            sock.bind(self.path)
+        finally:
+            os.umask(umask)
+        sock.listen(128)
+        self.__sock = sock
+
+    def __reap(self, block=False):
+        while self.__children:
+            try:
+                if block:
+                    pid, _ = os.waitpid(-1, 0)
+                else:
+                    pid, _ = os.waitpid(-1, os.WNOHANG)
+            except OSError, e:
+                if e.errno == errno.EINTR:
+                    continue
+                self.__children.clear()
+                break
+            if pid == 0:
+                break
+            try:
+                del self.__children[pid]
+            except KeyError:
+                pass
+            if block:
+                break
+
+    def serve_forever(self):
+        """Accept and dispatch requests until interrupted.
+
+        :return: exit code for the daemon process.
+        :rtype: `int`
+        """
+        self.__listen()
+        signal.signal(signal.SIGTERM, _sig_term)
+        try:
+            while True:
+                self.__reap()
+                if len(self.__children) >= self.max_children:
+                    self.__reap(block=True)
+                    continue
+                try:
+                    r, _, _ = select.select([self.__sock], [], [], 1.0)
+                except select.error, e:
+                    if e[0] == errno.EINTR:
+                        continue
+                    raise
+                if not r:
+                    continue
+                try:
+                    conn, _ = self.__sock.accept()
+                except socket.error, e:
+                    if e[0] in (errno.EINTR, errno.EAGAIN):
+                        continue
+                    raise
+                pid = os.fork()
+                if pid == 0:
+                    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                    self.__sock.close()
+                    rc = 0
+                    try:
+                        try:
+                            self.handle(conn)
+                        except:
+                            rc = 1
+                    finally:
+                        os._exit(rc)
+                conn.close()
+                self.__children[pid] = 1
+        except (KeyboardInterrupt, SystemExit):
+            pass
+        self.__sock.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+        return 0
+
+    def handle(self, conn):
+        """Run a check requested over `conn` (in a forked child) and send
+        back its exit code and output.
+        """
+        argv, env, cwd = _decode_request(_recv_all(conn))
+
+        for k in os.environ.keys():
+            del os.environ[k]
+        for k, v in env.items():
+            os.environ[k] = v
+        try:
+            os.chdir(cwd)
+        except OSError:
+            pass
+
+        # child's stdout and stderr (including of the commands it spawns)
+        # are collected in a temporary file
+        out = tempfile.TemporaryFile()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        devnull = os.open('/dev/null', os.O_RDONLY)
+        os.dup2(devnull, 0)
+        os.close(devnull)
+        os.dup2(out.fileno(), 1)
+        os.dup2(out.fileno(), 2)
+
+        rc = 0
+        try:
+            rc = self.runner.run([sys.argv[0]] + argv)
+        except SystemExit, e:
+            rc = e.code
+        except:
+            import traceback
+            sys.stdout.write('UNKNOWN: unhandled exception in probe daemon.\n')
+            traceback.print_exc(file=sys.stdout)
+            rc = 3
+        if rc is None:
+            rc = 0
+        elif not isinstance(rc, int):
+            sys.stdout.write('%s\n' % rc)
+            rc = 1
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+        out.seek(0)
+        conn.sendall(_pack([str(rc), out.read()]))
+        conn.close()
+
+def request(path, argv, env=None, cwd=None, timeout=CLIENT_TIMEOUT):
+    """Send a check request to a `ProbeDaemon`.
+
+    :param path: UNIX socket of the daemon.
+    :param argv: probe parameters (without program name).
+    :type argv: `list`
+    :param env: environment for the check (default: `os.environ`).
+    :param cwd: working directory for the check (default: current one).
+
+    :return: (exit code, output)
+    :rtype: `tuple`
+    :raises `ErrProbeDaemonConnect`: if the daemon can't be connected.
+    :raises `ErrProbeDaemon`: on communication or protocol errors.
+    """
+    if env is None:
+        env = os.environ
+    if cwd is None:
+        cwd = os.getcwd()
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(path)
+    except socket.error, e:
+        sock.close()
+        raise ErrProbeDaemonConnect('Failed connecting to probe daemon %s. '
+                                    '%s' % (path, str(e)))
+    try:
+        sock.sendall(_encode_request(argv, env, cwd))
+        sock.shutdown(1)
+        data = _recv_all(sock)
+        sock.close()
+    except socket.error, e:
+        raise ErrProbeDaemon('Failed talking to probe daemon %s. %s' % \
+                             (path, str(e)))
+    f = _unpack(data)
+    try:
+        return int(f[0]), f[1]
+    except (IndexError, ValueError):
+        raise ErrProbeDaemon('Malformed response from probe daemon %s.' % path)
+
+def client_main(argv):
+    """Client shim to be run by Nagios instead of a probe.
+
+    ``<prog> [-f <probe>] <socket> [probe parameters]``
+
+    With ``-f`` the probe is executed directly if the daemon can't be
+    connected. Other errors (e.g. timeout waiting for the reply, malformed
+    reply) are reported as UNKNOWN.
+
+    :return: exit code of the check.
+    :rtype: `int`
+    """
+    usage = 'Usage: %s [-f <probe>] <socket> [probe parameters]\n' % argv[0]
+    try:
+        opts, args = getopt.getopt(argv[1:], 'f:')
+    except getopt.GetoptError, e:
+        sys.stdout.write('UNKNOWN: %s\n%s' % (str(e), usage))
+        return 3
+    if not args:
+        sys.stdout.write('UNKNOWN: probe daemon socket not given.\n%s' % usage)
+        return 3
+    fallback = None
+    for o, v in opts:
+        if o == '-f':
+            fallback = v
+    try:
+        rc, out = request(args[0], args[1:])
+    except ErrProbeDaemonConnect, e:
+        if fallback:
+            os.execv(fallback, [fallback] + args[1:])
+        sys.stdout.write('UNKNOWN: %s\n' % str(e))
+        return 3
+    except ErrProbeDaemon, e:
+        # the check might have been run already
+        sys.stdout.write('UNKNOWN: %s\n' % str(e))
+        return 3
+    sys.stdout.write(out)
+    sys.stdout.flush()
+    return rc
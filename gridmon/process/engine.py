@@ -0,0 +1,520 @@
+##############################################################################
+#
+# NAME:        engine.py
+#
+# FACILITY:    SAM (Service Availability Monitoring)
+#
+# COPYRIGHT:
+#         Copyright (c) 2009, Members of the EGEE Collaboration.
+#         http://www.eu-egee.org/partners/
+#         Licensed under the Apache License, Version 2.0.
+#         http://www.apache.org/licenses/LICENSE-2.0
+#         This software is provided "as is", without warranties
+#         or conditions of any kind, either express or implied.
+#
+# DESCRIPTION:
+#
+#         Event-driven engine to run and follow a number of child processes.
+#
+# AUTHORS:     SAM team, CERN
+#
+# CREATED:     16-Oct-2026
+#
+##############################################################################
+
+"""
+Event-driven engine to run and follow a number of child processes.
+
+`ProcessEngine` spawns children as session (and, hence, process group)
+leaders with their stdout and stderr connected to a PTY or a pipe, and
+follows all of them from a single ``poll()`` (or ``select()``) loop. Output
+is read in large chunks, optionally split into lines on the fly, and is
+kept as a list of chunks. Each child can have an idle (no output) and a
+total deadline; on expiry the whole process group of the child is killed.
+
+`OutputCapture` - bounded capture of output: keeps its head and tail in
+memory and, optionally, streams all of it to a file.
+
+`run_cmds()` - run a number of commands concurrently and collect their
+return codes and output.
+"""
+
+__docformat__ = 'restructuredtext en'
+
+import os
+import sys
+import pty
+import time
+import errno
+import fcntl
+import signal
+import select
+
+__all__ = ['ProcessEngine',
+           'Child',
+           'OutputCapture',
+           'run_cmds']
+
+CHUNK_SIZE = 65536
+"maximum number of bytes read from a child at once."
+
+KILL_GRACE = 2
+"seconds between ``SIGTERM`` and ``SIGKILL`` sent to a timed out child."
+
+UNKNOWN_EXIT_CODE = 255
+"exit code of a child whose exit status couldn't be collected."
+
+def _set_cloexec(fd):
+    fcntl.fcntl(fd, fcntl.F_SETFD,
+                fcntl.fcntl(fd, fcntl.F_GETFD) | fcntl.FD_CLOEXEC)
+
+class OutputCapture(object):
+    """Bounded capture of output.
+
+    The first `head` and the last `tail` bytes are kept in memory. Output in
+    between is dropped and marked in `getvalue()`. If `path` is given, the
+    complete output is streamed to that file.
+
+    :ivar size: number of bytes written so far.
+    """
+    def __init__(self, head, tail, path=None):
+        """Initialise `OutputCapture`.
+
+        :param head: bytes kept from the start of output.
+        :type head: `int`
+        :param tail: bytes kept from the end of output.
+        :type tail: `int`
+        :param path: file to write the complete output to. Truncated if
+            exists. Not used if it can't be opened.
+        :type path: `str`
+        """
+        self.head = max(int(head), 0)
+        self.tail = max(int(tail), 0)
+        self.size = 0
+        self.path = None
+        self.__head = []
+        self.__hsize = 0
+        self.__tail = []
+        "chunks; the first one may start before the last `tail` bytes"
+        self.__tsize = 0
+        self.__file = None
+        if path:
+            try:
+                self.__file = open(path, 'w')
+                self.path = path
+            except IOError:
+                pass
+
+    def write(self, data):
+        "Capture a chunk of output."
+        self.size += len(data)
+        if self.__file is not None:
+            try:
+                self.__file.write(data)
+            except IOError:
+                self.close()
+                self.path = None
+        if self.__hsize < self.head:
+            n = self.head - self.__hsize
+            self.__head.append(data[:n])
+            self.__hsize += len(data[:n])
+            data = data[n:]
+        if not data or not self.tail:
+            return
+        self.__tail.append(data)
+        self.__tsize += len(data)
+        while self.__tsize - len(self.__tail[0]) >= self.tail:
+            self.__tsize -= len(self.__tail.pop(0))
+
+    def close(self):
+        "Close the file the output is streamed to."
+        if self.__file is not None:
+            try:
+                self.__file.close()
+            except IOError:
+                pass
+            self.__file = None
+
+    def elided(self):
+        "Number of bytes dropped from the middle of output."
+        return max(self.size - self.head - self.tail, 0)
+
+    def getvalue(self):
+        """Captured output. The dropped region is replaced with a note.
+
+        :rtype: `str`
+        """
+        if self.__file is not None:
+            try:
+                self.__file.flush()
+            except IOError:
+                pass
+        head = ''.join(self.__head)
+        tail = ''.join(self.__tail)
+        self.__head = [head]
+        self.__tail = [tail]
+        n = self.elided()
+        if not n:
+            return head + tail
+        if self.tail:
+            tail = tail[-self.tail:]
+        else:
+            tail = ''
+        if self.path:
+            where = ' Complete output is in %s.' % self.path
+        else:
+            where = ''
+        return '%s\n[... %i bytes of output skipped.%s ...]\n%s' % \
+                    (head, n, where, tail)
+
+class Child(object):
+    """Child process run by `ProcessEngine`.
+
+    :ivar pid: process ID (and process group ID) of the child.
+    :ivar status: exit status as returned by ``os.waitpid()`` or `None`.
+    :ivar timed_out: `None`, ``'idle'`` or ``'total'``.
+    :ivar nlines: number of complete lines read so far.
+    """
+    def __init__(self, cmd, use_pty=True, timeout=None, idle_timeout=None,
+                 on_line=None, env=None, capture=None, stderr=None):
+        """Fork and execute `cmd`.
+
+        :param cmd: command to run. A string is run with ``/bin/sh -c``, a
+            list is executed directly (``argv[0]`` looked up in ``$PATH``).
+        :type cmd: `str` or `list`
+        :param use_pty: connect child's stdout and stderr to a PTY (line
+            buffered output of most programs) or to a pipe.
+        :type use_pty: `bool`
+        :param timeout: seconds the child is allowed to run.
+        :param idle_timeout: seconds the child is allowed to produce no output.
+        :param on_line: callable ``on_line(child, line)`` called for each
+            complete line of output.
+        :param env: environment for the child (default: inherited).
+        :type env: `dict`
+        :param capture: store output in this `OutputCapture` (default: keep
+            all output in memory).
+        :type capture: `OutputCapture`
+        :param stderr: file descriptor to connect child's stderr to
+            (default: stderr goes to the output as stdout).
+        :type stderr: `int`
+        """
+        self.cmd = cmd
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.on_line = on_line
+        self.status = None
+        self.timed_out = None
+        self.nlines = 0
+        self.capture = capture
+        self.__chunks = []
+        self.__partial = ''
+        self.__killed_at = None
+
+        if isinstance(cmd, str):
+            argv = ['/bin/sh', '-c', cmd]
+        else:
+            argv = list(cmd)
+
+        if use_pty:
+            self.pid, self.fd = pty.fork()
+            if self.pid == 0:
+                self.__exec(argv, env, stderr)
+        else:
+            r, w = os.pipe()
+            self.pid = os.fork()
+            if self.pid == 0:
+                try:
+                    os.setsid()
+                    os.close(r)
+                    devnull = os.open('/dev/null', os.O_RDONLY)
+                    os.dup2(devnull, 0)
+                    os.dup2(w, 1)
+                    os.dup2(w, 2)
+                except:
+                    os._exit(127)
+                self.__exec(argv, env, stderr)
+            os.close(w)
+            self.fd = r
+        _set_cloexec(self.fd)
+        self.started = self.last_read = time.time()
+
+    def __exec(self, argv, env, stderr):
+        try:
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
+            if stderr is not None:
+                os.dup2(stderr, 2)
+            if env is None:
+                os.execvp(argv[0], argv)
+            else:
+                os.execvpe(argv[0], argv, env)
+        except:
+            try:
+                os.write(2, '%s: %s\n' % (argv[0], sys.exc_info()[1]))
+            except:
+                pass
+        os._exit(127)
+
+    def kill(self, sig=signal.SIGTERM):
+        "Kill entire group."
+        try:
+            os.kill(-self.pid, sig)
+        except OSError:
+            pass
+
+    def __store(self, data):
+        if self.capture is not None:
+            self.capture.write(data)
+        else:
+            self.__chunks.append(data)
+
+    def __get_output(self):
+        if self.capture is not None:
+            return self.capture.getvalue()
+        if len(self.__chunks) > 1:
+            self.__chunks = [''.join(self.__chunks)]
+        try:
+            return self.__chunks[0]
+        except IndexError:
+            return ''
+    output = property(__get_output, None, None,
+                      "Output of the child read so far.")
+
+    def __get_returncode(self):
+        if self.status is None:
+            return None
+        if os.WIFSIGNALED(self.status):
+            return 128 + os.WTERMSIG(self.status)
+        return os.WEXITSTATUS(self.status)
+    returncode = property(__get_returncode, None, None,
+                          "Exit code; 128+N if killed by signal N.")
+
+    def _feed(self, data):
+        "Store a chunk of output and split it into lines."
+        self.last_read = time.time()
+        self.__store(data)
+        if self.on_line is None and not '\n' in data:
+            return
+        if self.__partial:
+            data = self.__partial + data
+        lines = data.split('\n')
+        self.__partial = lines.pop()
+        self.nlines += len(lines)
+        if self.on_line is not None:
+            for l in lines:
+                self.on_line(self, l + '\n')
+
+    def _eof(self):
+        "Output is over. Flush the last incomplete line."
+        if self.__partial:
+            self.nlines += 1
+            if self.on_line is not None:
+                self.on_line(self, self.__partial)
+            self.__partial = ''
+        if self.capture is not None:
+            self.capture.close()
+        try:
+            os.close(self.fd)
+        except OSError:
+            pass
+        self.fd = None
+
+    def _check_deadlines(self, now):
+        """Kill the child if it passed its deadlines.
+
+        :return: seconds till the next deadline or `None`.
+        """
+        if self.__killed_at is not None:
+            if now - self.__killed_at >= KILL_GRACE:
+                self.kill(signal.SIGKILL)
+                return None
+            return KILL_GRACE - (now - self.__killed_at)
+        wait = []
+        if self.timeout is not None:
+            left = self.started + self.timeout - now
+            if left <= 0:
+                return self.__expire('total', self.timeout, now)
+            wait.append(left)
+        if self.idle_timeout is not None and self.fd is not None:
+            left = self.last_read + self.idle_timeout - now
+            if left <= 0:
+                return self.__expire('idle', self.idle_timeout, now)
+            wait.append(left)
+        if wait:
+            return min(wait)
+        return None
+
+    def __expire(self, reason, secs, now):
+        self.timed_out = reason
+        if reason == 'idle':
+            msg = "\n* Timed out after %i sec " % secs + \
+                  "while waiting for output from child.\n"
+        else:
+            msg = "\n* Timed out after %i sec.\n" % secs
+        self.__store(msg)
+        self.kill(signal.SIGTERM)
+        self.__killed_at = now
+        return KILL_GRACE
+
+    def _reap(self):
+        "Collect exit status without blocking. Returns `True` if reaped."
+        if self.status is not None:
+            return True
+        try:
+            pid, status = os.waitpid(self.pid, os.WNOHANG)
+        except OSError, e:
+            if e.errno == errno.EINTR:
+                return False
+            # e.g. ECHILD - reaped by someone else; don't take it for success
+            self.status = UNKNOWN_EXIT_CODE << 8
+            self.__store("\n* Exit status of child %i is unknown: %s.\n" % \
+                         (self.pid, e.strerror))
+            return True
+        if pid == 0:
+            return False
+        self.status = status
+        return True
+
+    def done(self):
+        "Output was read till EOF and exit status collected."
+        return self.fd is None and self.status is not None
+
+class ProcessEngine(object):
+    """Drive a number of `Child` processes from one event loop.
+    """
+    def __init__(self, chunk_size=CHUNK_SIZE, register=True):
+        """Initialise `ProcessEngine`.
+
+        :param chunk_size: maximum number of bytes read at once.
+        :param register: book children in `gridmon.process.signaling.proc`,
+            so that they are killed on the probe's global timeout.
+        """
+        self.chunk_size = chunk_size
+        self.register = register
+        self.children = []
+
+    def spawn(self, cmd, **kwargs):
+        """Start a child. See `Child` for parameters.
+
+        :rtype: `Child`
+        """
+        child = Child(cmd, **kwargs)
+        self.children.append(child)
+        if self.register:
+            from gridmon.process import signaling
+            signaling.proc[child.pid] = child
+        return child
+
+    def active(self):
+        "Children that are not done yet."
+        return [c for c in self.children if not c.done()]
+
+    def __wait(self, fds, timeout):
+        "Wait for readable file descriptors."
+        if hasattr(select, 'poll'):
+            p = select.poll()
+            for fd in fds:
+                p.register(fd, select.POLLIN | select.POLLPRI |
+                               select.POLLERR | select.POLLHUP)
+            if timeout is None:
+                ready = p.poll()
+            else:
+                ready = p.poll(int(timeout * 1000) + 1)
+            return [fd for fd, _ in ready]
+        r, _, _ = select.select(fds, [], [], timeout)
+        return r
+
+    def __release(self, child):
+        if self.register:
+            from gridmon.process import signaling
+            try:
+                del signaling.proc[child.pid]
+            except KeyError:
+                pass
+
+    def step(self, max_wait=None):
+        """One iteration of the event loop: wait for output (at most until
+        the nearest deadline or `max_wait` seconds), read it, enforce
+        deadlines and reap finished children.
+
+        :return: number of children not done yet.
+        :rtype: `int`
+        """
+        active = self.active()
+        if not active:
+            return 0
+
+        now = time.time()
+        waits = []
+        if max_wait is not None:
+            waits.append(max_wait)
+        byfd = {}
+        for c in active:
+            w = c._check_deadlines(now)
+            if w is not None:
+                waits.append(w)
+            if c.fd is not None:
+                byfd[c.fd] = c
+            elif c.status is None:
+                # output is closed, but process still runs
+                waits.append(0.1)
+        timeout = None
+        if waits:
+            timeout = max(min(waits), 0)
+
+        ready = []
+        if byfd:
+            try:
+                ready = self.__wait(byfd.keys(), timeout)
+            except (select.error, OSError, IOError), e:
+                if e[0] != errno.EINTR:
+                    raise
+        elif timeout:
+            time.sleep(timeout)
+
+        for fd in ready:
+            c = byfd[fd]
+            try:
+                data = os.read(fd, self.chunk_size)
+            except OSError, e:
+                if e.errno == errno.EINTR:
+                    continue
+                # EIO on PTY master - slave side is closed
+                data = ''
+            if data:
+                c._feed(data)
+            else:
+                c._eof()
+
+        n = 0
+        for c in active:
+            if c.fd is None and c._reap():
+                self.__release(c)
+            else:
+                n += 1
+        return n
+
+    def run(self, max_wait=None):
+        """Run the event loop until all children are done.
+
+        :return: list of children.
+        :rtype: `list`
+        """
+        while self.step(max_wait):
+            pass
+        return self.children
+
+def run_cmds(cmds, timeout=None, idle_timeout=None, use_pty=True):
+    """Run commands concurrently.
+
+    :param cmds: list of commands (see `Child`).
+    :param timeout: per command total deadline in seconds.
+    :param idle_timeout: per command idle deadline in seconds.
+
+    :return: list of (return code, output) in the order of `cmds`.
+    :rtype: `list`
+    """
+    engine = ProcessEngine()
+    for cmd in cmds:
+        engine.spawn(cmd, use_pty=use_pty, timeout=timeout,
+                     idle_timeout=idle_timeout)
+    return [(c.returncode, c.output) for c in engine.run()]
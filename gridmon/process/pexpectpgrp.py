@@ -27,7 +27,7 @@ Wrapping `pexpect.spawn` class to fork processes as session leaders.
 
 `SpawnPgrp` wrapper around `pexpect.spawn` class for forking processes as
 session leaders. `spawn_cmd()` - function to spawn and follow a process
-using `SpawnPgrp`.
+using `gridmon.process.engine`.
 """
 
 __docformat__ = 'restructuredtext en'
@@ -55,7 +55,7 @@ class SpawnPgrp(spawn):
         spawn.__init__(self, command, args=[], timeout=timeout,
                        maxread=2000, searchwindowsize=None,
                        logfile=None, env=None)
-        self.__output = ''
+        self.__output = []
         self.__setpgrp = setpgrp
 
     def __fork_pty(self):
@@ -72,55 +72,48 @@ class SpawnPgrp(spawn):
             pass
 
     def __set_output(self, o):
-        self.__output += o
+        self.__output.append(o)
     def __get_output(self):
-        return self.__output
+        if len(self.__output) > 1:
+            self.__output = [''.join(self.__output)]
+        try:
+            return self.__output[0]
+        except IndexError:
+            return ''
     output = property(__get_output, __set_output)
 
-def spawn_cmd(cmd, setpgrp=False):
-    """Use `SpawnPgrp` to spawn a process. Line-buffered pipes from/to child.
+def spawn_cmd(cmd, setpgrp=False, timeout=None, idle_timeout=None,
+              capture=None):
+    """Spawn a process and follow it till it exits. Child's stdout and
+    stderr are connected to a PTY (line-buffered output).
+
+    The process is driven by `gridmon.process.engine.ProcessEngine`. It is
+    always started as a session leader, so that it can be killed with its
+    whole process group (on timeouts or by `gridmon.process.signaling`).
 
-    :param cmd: command to run
+    :param cmd: command to run (parsed into arguments as by `pexpect.spawn`;
+        not passed through a shell)
     :type cmd: `str`
-    :param setpgrp: set new process group for the spawned process (default:
-        `False`)
+    :param setpgrp: kept for backward compatibility. Ignored.
     :type setpgrp: `bool`
+    :param timeout: kill the process after that many seconds (default: no
+        limit)
+    :type timeout: `int`
+    :param idle_timeout: kill the process if it didn't produce output for
+        that many seconds (default: no limit)
+    :type idle_timeout: `int`
+    :param capture: bound the output kept in memory (default: keep all)
+    :type capture: `gridmon.process.engine.OutputCapture`
 
     :return: return code and process output as a tuple
     :rtype: `tuple`
     """
-    from gridmon.process import signaling
+    from pexpect import split_command_line
+    from gridmon.process.engine import ProcessEngine
 
-    read_timeout = 30 # default value in Pexpect is 30 sec
-    process = SpawnPgrp(cmd, setpgrp=setpgrp, timeout=read_timeout)
+    engine = ProcessEngine()
+    process = engine.spawn(split_command_line(cmd), timeout=timeout,
+                           idle_timeout=idle_timeout, capture=capture)
+    engine.run()
 
-    signaling.proc[process.pid] = process
-
-    line = None
-    while True:
-        try:
-            line = process.readline()
-        except TIMEOUT:
-            process.output = "\n* Timed out after %i sec " % read_timeout + \
-                                "while waiting for output from child.\n"
-            continue
-            if not process.isalive():
-                process.output = "* Child process %i died.\n" % process.pid
-                break
-        if not line:
-            break
-        else:
-            process.output = line
-
-    # Hack. Otherwise obtaining exit status and return code
-    # of the child process doesn't work properly.
-    process.isalive()
-    try:
-        _, status = os.waitpid(process.pid,os.WNOHANG)
-    except OSError:
-        status = process.status
-
-    ln = process.output
-    del signaling.proc[process.pid]
-
-    return (os.WEXITSTATUS(status), ln)
+    return (process.returncode, process.output)
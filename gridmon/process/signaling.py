@@ -31,6 +31,7 @@ __docformat__ = 'restructuredtext en'
 
 import signal
 from gridmon.process.pexpectpgrp import SpawnPgrp
+from gridmon.process.engine import Child
 
 sig_names = dict([(k, v) for v, k in signal.__dict__.iteritems() if v.startswith('SIG')])
 "Dictionary with names of signals (`int`:`str` key-pair)."
@@ -46,6 +47,6 @@ def sig_alrm(sig, frame):
     """
     if proc:
         for p in proc.values():
-            if isinstance(p, SpawnPgrp):
+            if isinstance(p, (SpawnPgrp, Child)):
                 p.kill()
     raise TimeoutError('Caught signal %s.' % sig_names[sig])
@@ -0,0 +1,349 @@
+##############################################################################
+#
+# NAME:        proxy.py
+#
+# FACILITY:    SAM (Service Availability Monitoring)
+#
+# COPYRIGHT:
+#         Copyright (c) 2009, Members of the EGEE Collaboration.
+#         http://www.eu-egee.org/partners/
+#         Licensed under the Apache License, Version 2.0.
+#         http://www.apache.org/licenses/LICENSE-2.0
+#         This software is provided "as is", without warranties
+#         or conditions of any kind, either express or implied.
+#
+# DESCRIPTION:
+#
+#         In-process reader of X.509 proxies and their VOMS attributes.
+#
+# AUTHORS:     SAM team, CERN
+#
+# CREATED:     16-Oct-2026
+#
+##############################################################################
+
+"""
+In-process reader of X.509 proxies and their VOMS attributes.
+
+Certificates of a proxy file (PEM) are decoded with a minimal DER parser.
+From the proxy certificate the subject DN and the validity period are
+taken; the end of life of the proxy is the earliest ``notAfter`` in the
+chain. VOMS FQANs are read from attribute certificates in the VOMS
+extension (``1.3.6.1.4.1.8005.100.100.5``). Signatures are not verified.
+
+`load_proxy()` - parsed proxy, cached per process while the file is not
+changed.
+"""
+
+__docformat__ = 'restructuredtext en'
+
+import os
+import time
+import base64
+import calendar
+import threading
+
+__all__ = ['Proxy',
+           'ErrProxy',
+           'load_proxy',
+           'proxy_path']
+
+OID_VOMS_ACSEQ = '1.3.6.1.4.1.8005.100.100.5'
+OID_VOMS_ATTRS = '1.3.6.1.4.1.8005.100.100.4'
+
+# Names of attributes in DNs as printed by OpenSSL (and voms-proxy-info)
+_DN_ATTRS = {'2.5.4.3'  : 'CN',
+             '2.5.4.4'  : 'SN',
+             '2.5.4.5'  : 'serialNumber',
+             '2.5.4.6'  : 'C',
+             '2.5.4.7'  : 'L',
+             '2.5.4.8'  : 'ST',
+             '2.5.4.10' : 'O',
+             '2.5.4.11' : 'OU',
+             '2.5.4.12' : 'title',
+             '2.5.4.42' : 'GN',
+             '0.9.2342.19200300.100.1.1'  : 'UID',
+             '0.9.2342.19200300.100.1.25' : 'DC',
+             '1.2.840.113549.1.9.1'       : 'emailAddress'}
+
+# DER tags
+_INTEGER = 0x02
+_OCTET_STRING = 0x04
+_OID = 0x06
+_SEQUENCE = 0x30
+_SET = 0x31
+_UTCTIME = 0x17
+_GENERALIZEDTIME = 0x18
+_EXPLICIT_3 = 0xa3
+
+class ErrProxy(StandardError):
+    "Proxy can't be read or decoded."
+
+def _tlv(data, pos):
+    """Decode DER header at `pos`.
+
+    :return: (tag, start of contents, end of contents)
+    :raises `ErrProxy`: on truncated or unsupported encoding.
+    """
+    try:
+        tag = ord(data[pos])
+        l = ord(data[pos+1])
+    except IndexError:
+        raise ErrProxy('Truncated DER data.')
+    pos += 2
+    if l & 0x80:
+        n = l & 0x7f
+        if n == 0 or n > 4:
+            raise ErrProxy('Unsupported DER length encoding.')
+        l = 0
+        for c in data[pos:pos+n]:
+            l = (l << 8) | ord(c)
+        pos += n
+    if pos + l > len(data):
+        raise ErrProxy('Truncated DER data.')
+    return tag, pos, pos + l
+
+def _children(data, start, end):
+    "List of (tag, start, end) of elements in [start, end)."
+    res = []
+    while start < end:
+        tag, s, e = _tlv(data, start)
+        res.append((tag, s, e))
+        start = e
+    return res
+
+def _oid(v):
+    "Dotted form of encoded object identifier."
+    ids = []
+    n = 0
+    for c in v:
+        c = ord(c)
+        n = (n << 7) | (c & 0x7f)
+        if not c & 0x80:
+            ids.append(n)
+            n = 0
+    if not ids:
+        return ''
+    first = min(ids[0] / 40, 2)
+    return '.'.join([str(first), str(ids[0] - first * 40)] +
+                    [str(i) for i in ids[1:]])
+
+def _time(tag, v):
+    "Seconds since the Epoch of UTCTime or GeneralizedTime."
+    v = v.rstrip('Z')
+    try:
+        if tag == _UTCTIME:
+            y = int(v[:2])
+            if y < 50:
+                y += 2000
+            else:
+                y += 1900
+            v = v[2:]
+        else:
+            y = int(v[:4])
+            v = v[4:]
+        return calendar.timegm((y, int(v[0:2]), int(v[2:4]), int(v[4:6]),
+                                int(v[6:8]), int(v[8:10] or 0), 0, 0, 0))
+    except (ValueError, IndexError):
+        raise ErrProxy('Malformed time %s.' % v)
+
+def _dn(data, start, end):
+    "OpenSSL style (/A=v/B=v) string of encoded Name."
+    rdns = []
+    for _, s, e in _children(data, start, end):          # SET
+        for _, s1, e1 in _children(data, s, e):          # SEQUENCE
+            (_, os_, oe), (_, vs, ve) = _children(data, s1, e1)[:2]
+            oid = _oid(data[os_:oe])
+            rdns.append('/%s=%s' % (_DN_ATTRS.get(oid, oid), data[vs:ve]))
+    return ''.join(rdns)
+
+def _fqans_from_acseq(data):
+    """VOMS FQANs in the value of VOMS AC sequence extension
+    ``AC_SEQ ::= SEQUENCE { SEQUENCE OF AC }``."""
+    fqans = []
+    ac_ends = []
+    _, s, e = _tlv(data, 0)                              # AC_SEQ
+    acs = _children(data, s, e)
+    if not acs:
+        return fqans, ac_ends
+    _, s, e = acs[0]                                     # SEQUENCE OF AC
+    for _, acs, ace in _children(data, s, e):
+        acinfo = _children(data, acs, ace)[0]
+        for tag, s1, e1 in _children(data, acinfo[1], acinfo[2]):
+            if tag != _SEQUENCE:
+                continue
+            items = _children(data, s1, e1)
+            # validity period - two GeneralizedTimes
+            if len(items) == 2 and items[0][0] == items[1][0] == \
+                    _GENERALIZEDTIME:
+                ac_ends.append(_time(_GENERALIZEDTIME,
+                                     data[items[1][1]:items[1][2]]))
+                continue
+            # attributes
+            for tag2, s2, e2 in items:
+                if tag2 != _SEQUENCE:
+                    break
+                attr = _children(data, s2, e2)
+                if attr[0][0] != _OID or \
+                        _oid(data[attr[0][1]:attr[0][2]]) != OID_VOMS_ATTRS:
+                    continue
+                # SET OF IetfAttrSyntax
+                for _, s3, e3 in _children(data, attr[1][1], attr[1][2]):
+                    for tag4, s4, e4 in _children(data, s3, e3):
+                        if tag4 != _SEQUENCE:
+                            continue        # policyAuthority
+                        for tag5, s5, e5 in _children(data, s4, e4):
+                            if tag5 == _OCTET_STRING:
+                                fqans.append(data[s5:e5])
+    return fqans, ac_ends
+
+class Certificate(object):
+    """Fields of a decoded X.509 certificate.
+
+    :ivar subject: subject DN.
+    :ivar issuer: issuer DN.
+    :ivar not_before: start of validity (seconds since the Epoch).
+    :ivar not_after: end of validity (seconds since the Epoch).
+    :ivar extensions: `dict` of extension OID: encoded value.
+    """
+    def __init__(self, der):
+        """Decode certificate.
+
+        :raises `ErrProxy`: on malformed certificate.
+        """
+        try:
+            _, s, e = _tlv(der, 0)
+            _, ts, te = _children(der, s, e)[0]
+            tbs = _children(der, ts, te)
+            if tbs[0][0] == 0xa0:                        # [0] version
+                tbs = tbs[1:]
+            # serial, signature, issuer, validity, subject, key, ...
+            self.issuer = _dn(der, tbs[2][1], tbs[2][2])
+            validity = _children(der, tbs[3][1], tbs[3][2])
+            self.not_before = _time(validity[0][0],
+                                    der[validity[0][1]:validity[0][2]])
+            self.not_after = _time(validity[1][0],
+                                   der[validity[1][1]:validity[1][2]])
+            self.subject = _dn(der, tbs[4][1], tbs[4][2])
+            self.extensions = {}
+            for tag, xs, xe in tbs[6:]:
+                if tag != _EXPLICIT_3:
+                    continue
+                _, ss, se = _tlv(der, xs)
+                for _, es, ee in _children(der, ss, se):
+                    ext = _children(der, es, ee)
+                    oid = _oid(der[ext[0][1]:ext[0][2]])
+                    # extnID, [critical], extnValue
+                    self.extensions[oid] = der[ext[-1][1]:ext[-1][2]]
+        except (IndexError, ValueError):
+            raise ErrProxy('Malformed certificate.')
+
+class Proxy(object):
+    """Decoded proxy.
+
+    :ivar path: proxy file.
+    :ivar subject: subject DN of the proxy certificate.
+    :ivar issuer: issuer DN of the proxy certificate.
+    :ivar not_after: end of life of the proxy - the earliest end of validity
+        of certificates in the file (seconds since the Epoch).
+    :ivar fqans: `list` of VOMS FQANs.
+    :ivar ac_not_after: end of validity of VOMS attributes or `None`.
+    :ivar certificates: `list` of `Certificate`.
+    """
+    def __init__(self, pem, path=None):
+        """Decode proxy.
+
+        :param pem: contents of proxy file.
+        :type pem: `str`
+        :raises `ErrProxy`: if no certificates can be decoded.
+        """
+        self.path = path
+        self.certificates = [Certificate(der) for der in _pem_blocks(pem)]
+        if not self.certificates:
+            raise ErrProxy('No certificates found in %s.' % (path or 'proxy'))
+        cert = self.certificates[0]
+        self.subject = cert.subject
+        self.issuer = cert.issuer
+        self.not_after = min([c.not_after for c in self.certificates])
+        self.fqans = []
+        self.ac_not_after = None
+        try:
+            acseq = cert.extensions[OID_VOMS_ACSEQ]
+        except KeyError:
+            return
+        try:
+            self.fqans, ends = _fqans_from_acseq(acseq)
+        except (IndexError, ValueError):
+            raise ErrProxy('Malformed VOMS extension.')
+        if ends:
+            self.ac_not_after = min(ends)
+
+    def time_left(self, now=None):
+        "Seconds till the end of life of the proxy (negative if expired)."
+        if now is None:
+            now = time.time()
+        return int(self.not_after - now)
+
+def _pem_blocks(pem):
+    "DER of certificates in PEM data."
+    blocks = []
+    begin = '-----BEGIN CERTIFICATE-----'
+    end = '-----END CERTIFICATE-----'
+    i = pem.find(begin)
+    while i >= 0:
+        j = pem.find(end, i)
+        if j < 0:
+            break
+        try:
+            blocks.append(base64.decodestring(pem[i+len(begin):j]))
+        except Exception:
+            raise ErrProxy('Malformed PEM data.')
+        i = pem.find(begin, j)
+    return blocks
+
+def proxy_path():
+    """Path to user proxy: ``X509_USER_PROXY`` or ``/tmp/x509up_u<uid>``.
+
+    :rtype: `str`
+    """
+    try:
+        return os.environ['X509_USER_PROXY']
+    except KeyError:
+        return '/tmp/x509up_u%i' % os.getuid()
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+def load_proxy(path=None):
+    """Read and decode proxy. Cached per path while inode, modification
+    time and size of the file stay the same.
+
+    :param path: proxy file (default: `proxy_path()`).
+    :rtype: `Proxy`
+    :raises `ErrProxy`: if the file can't be read or decoded.
+    """
+    if path is None:
+        path = proxy_path()
+    try:
+        st = os.stat(path)
+        key = (st.st_ino, st.st_mtime, st.st_size)
+        _cache_lock.acquire()
+        try:
+            try:
+                k, p = _cache[path]
+                if k == key:
+                    return p
+            except KeyError:
+                pass
+        finally:
+            _cache_lock.release()
+        pem = open(path).read()
+    except (OSError, IOError), e:
+        raise ErrProxy('Failed reading proxy %s. %s' % (path, str(e)))
+    p = Proxy(pem, path)
+    _cache_lock.acquire()
+    try:
+        _cache[path] = (key, p)
+    finally:
+        _cache_lock.release()
+    return p
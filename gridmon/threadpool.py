@@ -0,0 +1,146 @@
+##############################################################################
+#
+# NAME:        threadpool.py
+#
+# FACILITY:    SAM (Service Availability Monitoring)
+#
+# COPYRIGHT:
+#         Copyright (c) 2009, Members of the EGEE Collaboration.
+#         http://www.eu-egee.org/partners/
+#         Licensed under the Apache License, Version 2.0.
+#         http://www.apache.org/licenses/LICENSE-2.0
+#         This software is provided "as is", without warranties
+#         or conditions of any kind, either express or implied.
+#
+# DESCRIPTION:
+#
+#         Bounded pool of worker threads.
+#
+# AUTHORS:     SAM team, CERN
+#
+# CREATED:     16-Oct-2026
+#
+##############################################################################
+
+"""
+Bounded pool of worker threads.
+
+`WorkerPool` runs submitted jobs on a fixed number of daemon threads and
+hands results back to the submitting (main) thread. Results are collected
+with a polling timeout, so that signal handlers (e.g. ``SIGALRM`` used for
+probes' global timeout) keep running in the main thread while it waits.
+"""
+
+__docformat__ = 'restructuredtext en'
+
+import sys
+import threading
+import Queue
+
+__all__ = ['WorkerPool',
+           'run_parallel']
+
+POLL_INTERVAL = 0.5
+"seconds between checks for results; keeps main thread signal-responsive."
+
+class WorkerPool(object):
+    """Fixed-size pool of daemon worker threads.
+
+    Jobs are identified by a caller supplied `tag`. Results are returned as
+    ``(tag, result, exc_info)`` tuples, where `exc_info` is `None` on success
+    or `sys.exc_info()` of the exception the job raised.
+    """
+    def __init__(self, workers):
+        """Initialise `WorkerPool` and start worker threads.
+
+        :param workers: number of worker threads (at least one is started).
+        :type workers: `int`
+        """
+        self.__jobs = Queue.Queue()
+        self.__results = Queue.Queue()
+        self.__pending = 0
+        "number of jobs submitted, but not yet collected."
+        self.__threads = []
+        for i in range(max(int(workers), 1)):
+            t = threading.Thread(target=self.__worker)
+            t.setDaemon(True)
+            t.start()
+            self.__threads.append(t)
+
+    def __worker(self):
+        while True:
+            job = self.__jobs.get()
+            if job is None:
+                break
+            tag, func, args, kwargs = job
+            try:
+                res = func(*args, **kwargs)
+            except (SystemExit, KeyboardInterrupt, Exception):
+                self.__results.put((tag, None, sys.exc_info()))
+            else:
+                self.__results.put((tag, res, None))
+
+    def submit(self, tag, func, args=(), kwargs={}):
+        """Queue `func(*args, **kwargs)` for execution.
+
+        :param tag: job identifier returned along with the job's result.
+        """
+        self.__pending += 1
+        self.__jobs.put((tag, func, args, kwargs))
+
+    def pending(self):
+        "Number of jobs which results were not yet collected."
+        return self.__pending
+
+    def get_result(self, timeout=None):
+        """Wait for the next finished job.
+
+        :param timeout: seconds to wait; `None` - wait until a job finishes.
+        :return: ``(tag, result, exc_info)`` or `None` on timeout or when no
+          jobs are pending.
+        :rtype: `tuple`
+        """
+        if self.__pending == 0:
+            return None
+        waited = 0.0
+        while True:
+            try:
+                res = self.__results.get(True, POLL_INTERVAL)
+            except Queue.Empty:
+                waited += POLL_INTERVAL
+                if timeout is not None and waited >= timeout:
+                    return None
+            else:
+                self.__pending -= 1
+                return res
+
+    def shutdown(self):
+        """Ask worker threads to exit once the queued jobs are done.
+        Doesn't wait for the threads.
+        """
+        for t in self.__threads:
+            self.__jobs.put(None)
+
+def run_parallel(func, argslist, workers):
+    """Run `func` for every element of `argslist` on a `WorkerPool`.
+
+    :param func: callable.
+    :param argslist: `list` of argument tuples, one per call.
+    :param workers: maximum number of concurrent calls.
+
+    :return: `list` of ``(result, exc_info)`` in the order of `argslist`.
+    :rtype: `list`
+    """
+    res = [None] * len(argslist)
+    if not argslist:
+        return res
+    pool = WorkerPool(min(workers, len(argslist)))
+    try:
+        for i in range(len(argslist)):
+            pool.submit(i, func, argslist[i])
+        while pool.pending():
+            i, r, exc = pool.get_result()
+            res[i] = (r, exc)
+    finally:
+        pool.shutdown()
+    return res
@@ -30,6 +30,7 @@ __docformat__ = 'restructuredtext en'
 
 import os
 import re
+import stat
 import commands
 from random import choice
 import popen2
@@ -37,6 +38,12 @@ import time
 import sys
 import socket
 import getopt
+import atexit
+import marshal
+import zlib
+import threading
+
+from gridmon.threadpool import WorkerPool
 
 __all__ = ['time_now',
            'parse_uri',
@@ -52,11 +59,19 @@ __all__ = ['time_now',
            'do_longs',
            'getops_flexlongs',
            'get_launchdir',
+           'read_own_file',
+           'dump_data',
+           'load_data',
            'arch_zip',
            'arch_unzip',
            'dns_lookup_forward',
            'dns_lookup_reverse',
-           'ldap_url2hostname_ip'
+           'dns_lookup_forward_many',
+           'set_dns_cache',
+           'save_dns_cache',
+           'clear_dns_cache',
+           'ldap_url2hostname_ip',
+           'encode_output'
            ]
 
 retCodes = {'OK': 0, 'WARNING' : 1, 'CRITICAL' : 2, 'UNKNOWN' : 3}
@@ -296,13 +311,64 @@ def outputsanitiser(str):
     :return: sanitised string
     :rtype: `str`
     """
-    patterns = {
-                # Nagios treats data after pipes as performance data
-                '\|\||\|' : 'OR'
-                }
-    for p,s in patterns.items():
-        str = re.sub(p, s, str)
-    return str
+    # Nagios treats data after pipes as performance data
+    return str.replace('||', 'OR').replace('|', 'OR')
+
+OUTPUT_TRUNCATED = '[output truncated]'
+"note put at the end of truncated plugin output."
+OUTPUT_TRUNCATED_REF = '[output truncated; complete output in %s]'
+"note put at the end of truncated plugin output with a reference."
+
+def __escape_output(s, sanitize):
+    if sanitize:
+        s = outputsanitiser(s)
+    return s.replace('\n', '\\n')
+
+def encode_output(summary, details='', perf='', budget=None, sanitize=True,
+                  ref=None):
+    """Encode plugin output of a passive check result as a single line
+    ``summary\\ndetails|perf`` - pipes sanitised (see `outputsanitiser()`),
+    new lines escaped as ``\\n`` - of at most `budget` bytes.
+
+    Sanitising and escaping never shorten a string, so only the first
+    `budget` bytes of `summary` and `details` are encoded. Truncated output
+    ends with `OUTPUT_TRUNCATED` or, if `ref` is given, with
+    `OUTPUT_TRUNCATED_REF`. Performance data is kept if it fits.
+
+    :param budget: maximum size of the output in bytes (`None` - no limit).
+    :param ref: where the complete output can be found.
+    :return: (output, truncated)
+    :rtype: `tuple`
+    """
+    truncated = False
+    if budget is not None:
+        if len(summary) > budget:
+            summary = summary[:budget]
+            truncated = True
+        if len(details) > budget:
+            details = details[:budget]
+            truncated = True
+    out = '%s\\n%s' % (__escape_output(summary, sanitize),
+                        __escape_output(details, sanitize))
+    tail = ''
+    if perf:
+        tail = '|' + perf
+    if budget is None or (not truncated and len(out) + len(tail) <= budget):
+        return out + tail, False
+
+    if ref:
+        note = '\\n' + OUTPUT_TRUNCATED_REF % ref
+    else:
+        note = '\\n' + OUTPUT_TRUNCATED
+    if len(note) + len(tail) > budget:
+        tail = ''
+    if len(note) > budget:
+        note = ''
+    out = out[:budget - len(note) - len(tail)]
+    if out.endswith('\\'):
+        # don't leave a half of escaped new line
+        out = out[:-1]
+    return out + note + tail, True
 
 def do_longs(opts, opt, longopts, args):
     """Modified version of `getopt.do_longs()` which doesn't bail out if
@@ -397,6 +463,73 @@ def get_launchdir(path=None):
                     os.path.abspath(
                         path or sys.argv[0])))
 
+def read_own_file(path):
+    """Contents of a regular file owned by the current user. Meant for
+    state and cache files in directories shared with other users: a file
+    someone else created (or a symbolic link) is not trusted.
+
+    :param path: path to the file.
+    :type path: `str`
+    :return: contents of the file or `None` if it doesn't exist, can't be
+      read or is not a regular file owned by the user.
+    :rtype: `str`
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY | getattr(os, 'O_NOFOLLOW', 0))
+    except OSError:
+        return None
+    try:
+        try:
+            st = os.fstat(fd)
+            if not stat.S_ISREG(st.st_mode) or st.st_uid != os.getuid():
+                return None
+            data = []
+            while True:
+                d = os.read(fd, 65536)
+                if not d:
+                    break
+                data.append(d)
+            return ''.join(data)
+        except OSError:
+            return None
+    finally:
+        os.close(fd)
+
+# Header of data serialized with dump_data().
+DATA_MAGIC = 'gridmon-marshal-1\n'
+
+def dump_data(obj):
+    """Serialize `obj` for a state or cache file with `marshal`, prefixed
+    with a header and CRC32 of the data, see `load_data()`.
+
+    :raise ValueError: `obj` contains unsupported types.
+    :rtype: `str`
+    """
+    data = marshal.dumps(obj)
+    return '%s%08x\n%s' % (DATA_MAGIC, zlib.crc32(data) & 0xffffffffL, data)
+
+def load_data(data):
+    """Object serialized with `dump_data()`. `marshal` is not robust
+    against corrupted input, so the data is unmarshalled only after header
+    and checksum are verified.
+
+    :raise ValueError: data is not in `dump_data()` format or is corrupted.
+    """
+    l = len(DATA_MAGIC)
+    if not data.startswith(DATA_MAGIC) or data[l+8:l+9] != '\n':
+        raise ValueError('Unknown data format.')
+    try:
+        crc = int(data[l:l+8], 16)
+    except ValueError:
+        raise ValueError('Unknown data format.')
+    data = data[l+9:]
+    if zlib.crc32(data) & 0xffffffffL != crc:
+        raise ValueError('Data checksum mismatch.')
+    try:
+        return marshal.loads(data)
+    except (EOFError, TypeError):
+        raise ValueError('Corrupted data.')
+
 def exit_trace(status, msg):
     """Exit programm with stack trace.
 
@@ -441,8 +574,168 @@ def arch_unzip(path, directory='.'):
     directory = os.path.abspath(directory)
     run_cmd_data('cd %s && tar -zxf %s' % (directory, path), '')
 
+# In-process cache of DNS lookups. The resolver doesn't expose TTLs of
+# records; successful and failed lookups are kept for fixed times.
+DNS_CACHE_TTL = 300
+DNS_CACHE_NEGATIVE_TTL = 30
+DNS_WORKERS = 10
+# Number of new lookups after which a persisted cache is written.
+DNS_CACHE_SAVE_BATCH = 50
+__dns_cache = {'file'         : None,
+               'ttl'          : DNS_CACHE_TTL,
+               'negative_ttl' : DNS_CACHE_NEGATIVE_TTL,
+               'entries'      : {},
+               'unsaved'      : 0,
+               'atexit'       : False}
+__dns_lock = threading.Lock()
+
+def set_dns_cache(path=None, ttl=DNS_CACHE_TTL,
+                  negative_ttl=DNS_CACHE_NEGATIVE_TTL):
+    """Configure cache of DNS lookups.
+
+    :param path: file to persist the cache in across (short-lived)
+      processes; loaded now and written after every `DNS_CACHE_SAVE_BATCH`
+      new lookups and at exit (see `save_dns_cache()`). Stored with
+      `dump_data()`; a file not owned by the user is ignored. `None` - keep in
+      memory only.
+    :param ttl: seconds successful lookups are kept (0 - no caching).
+    :param negative_ttl: seconds failed lookups are kept (0 - no caching).
+    """
+    __dns_lock.acquire()
+    try:
+        if __dns_cache['file'] and __dns_cache['unsaved']:
+            __dns_cache_save()
+        __dns_cache['file'] = path
+        __dns_cache['ttl'] = ttl
+        __dns_cache['negative_ttl'] = negative_ttl
+        if path:
+            __dns_cache_load()
+            if not __dns_cache['atexit']:
+                atexit.register(save_dns_cache)
+                __dns_cache['atexit'] = True
+    finally:
+        __dns_lock.release()
+
+def save_dns_cache():
+    "Write new lookups to the cache file set with `set_dns_cache()`."
+    __dns_lock.acquire()
+    try:
+        if __dns_cache['file'] and __dns_cache['unsaved']:
+            __dns_cache_save()
+    finally:
+        __dns_lock.release()
+
+def clear_dns_cache():
+    "Forget cached DNS lookups (persisted file is not touched)."
+    __dns_lock.acquire()
+    try:
+        __dns_cache['entries'] = {}
+        __dns_cache['unsaved'] = 0
+    finally:
+        __dns_lock.release()
+
+def __dns_cache_load():
+    """Merge not expired entries from the cache file. Only a file of the
+    user in `dump_data()` format is read. Called with lock held.
+    """
+    data = read_own_file(__dns_cache['file'])
+    if data is None:
+        return
+    try:
+        entries = load_data(data)
+    except ValueError:
+        # corrupted file
+        return
+    if not isinstance(entries, dict):
+        return
+    now = time.time()
+    for k, v in entries.items():
+        if not (isinstance(k, tuple) and isinstance(v, tuple) and len(v) == 3
+                and isinstance(v[0], (int, float))):
+            continue
+        if v[0] > now and \
+                v[0] > __dns_cache['entries'].get(k, (0,))[0]:
+            __dns_cache['entries'][k] = v
+
+def __dns_cache_save():
+    """Write not expired entries merged with the ones other processes
+    saved meanwhile to the cache file. Write to a temporary file and rename
+    into place. Called with lock held.
+    """
+    __dns_cache['unsaved'] = 0
+    __dns_cache_load()
+    path = __dns_cache['file']
+    now = time.time()
+    entries = {}
+    for k, v in __dns_cache['entries'].items():
+        if v[0] > now:
+            entries[k] = v
+    tmp = '%s.%i' % (path, os.getpid())
+    try:
+        fd = os.open(tmp, os.O_WRONLY|os.O_CREAT|os.O_TRUNC, 0600)
+        os.write(fd, dump_data(entries))
+        os.close(fd)
+        os.rename(tmp, path)
+    except (OSError, IOError):
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+
+def __dns_cached(key, resolve, arg):
+    """Return cached result of `resolve(arg)`; `IOError` is cached as
+    failed lookup.
+    """
+    now = time.time()
+    __dns_lock.acquire()
+    try:
+        try:
+            expires, value, error = __dns_cache['entries'][key]
+            if expires > now:
+                if error is not None:
+                    raise IOError(error)
+                return value
+        except KeyError:
+            pass
+    finally:
+        __dns_lock.release()
+    try:
+        value = resolve(arg)
+    except IOError, e:
+        __dns_store(key, now + __dns_cache['negative_ttl'], None, str(e))
+        raise
+    __dns_store(key, now + __dns_cache['ttl'], value, None)
+    return value
+
+def __dns_store(key, expires, value, error):
+    if expires <= time.time():
+        return
+    __dns_lock.acquire()
+    try:
+        __dns_cache['entries'][key] = (expires, value, error)
+        if __dns_cache['file']:
+            __dns_cache['unsaved'] += 1
+            if __dns_cache['unsaved'] >= DNS_CACHE_SAVE_BATCH:
+                __dns_cache_save()
+    finally:
+        __dns_lock.release()
+
+def __forward(hostname):
+    try:
+        _, _, ips = socket.gethostbyname_ex(hostname)
+    except (socket.gaierror, socket.herror), e:
+        raise IOError(str(e))
+    return ips
+
+def __reverse(ip):
+    try:
+        hostname, _, _ = socket.gethostbyaddr(ip)
+    except (socket.gaierror, socket.herror), e:
+        raise IOError(str(e))
+    return hostname
+
 def dns_lookup_forward(hostname):
-    """Forward DNS lookup.
+    """Forward DNS lookup. Cached (see `set_dns_cache()`).
 
     :param hostname: hostname
     :type hostname: `str`
@@ -454,14 +747,10 @@ def dns_lookup_forward(hostname):
     """
     if not hostname:
         raise ValueError('Empty hostname provided.')
-    try:
-        _, _, ips = socket.gethostbyname_ex(hostname)
-    except (socket.gaierror, socket.herror), e:
-        raise IOError(str(e))
-    return ips
+    return list(__dns_cached(('A', hostname), __forward, hostname))
 
 def dns_lookup_reverse(ip):
-    """Reverse DNS lookup.
+    """Reverse DNS lookup. Cached (see `set_dns_cache()`).
 
     :param ip: valid IP as string
     :type ip: `str`
@@ -475,11 +764,68 @@ def dns_lookup_reverse(ip):
         socket.inet_aton(ip)
     except socket.error:
         raise ValueError('Not valid IP address given: %r' % ip)
+    return __dns_cached(('PTR', ip), __reverse, ip)
+
+def dns_lookup_forward_many(hostnames, workers=DNS_WORKERS):
+    """Forward DNS lookup of a number of hostnames. Lookups not in the cache
+    run concurrently.
+
+    :param hostnames: list of hostnames.
+    :param workers: maximum number of concurrent lookups.
+    :return: hostname: list of IPs or the exception (`ValueError`, `IOError`)
+      the lookup raised.
+    :rtype: `dict`
+    """
+    res = {}
+    pending = []
+    for h in hostnames:
+        if h in res or h in pending:
+            continue
+        try:
+            res[h] = __dns_cached_only(h)
+        except KeyError:
+            pending.append(h)
+        except (ValueError, IOError), e:
+            res[h] = e
+    if len(pending) == 1:
+        try:
+            res[pending[0]] = dns_lookup_forward(pending[0])
+        except (ValueError, IOError), e:
+            res[pending[0]] = e
+        return res
+    if not pending:
+        return res
+    pool = WorkerPool(min(len(pending), workers))
     try:
-        hostname, _, _ = socket.gethostbyaddr(ip)
-    except (socket.gaierror, socket.herror), e:
-        raise IOError(str(e))
-    return hostname
+        for h in pending:
+            pool.submit(h, dns_lookup_forward, (h,))
+        while pool.pending():
+            h, ips, exc = pool.get_result()
+            if exc:
+                res[h] = exc[1]
+            else:
+                res[h] = ips
+    finally:
+        pool.shutdown()
+    return res
+
+def __dns_cached_only(hostname):
+    """Forward lookup from the cache only.
+
+    :raises KeyError: if not cached.
+    """
+    if not hostname:
+        raise ValueError('Empty hostname provided.')
+    __dns_lock.acquire()
+    try:
+        expires, value, error = __dns_cache['entries'][('A', hostname)]
+    finally:
+        __dns_lock.release()
+    if expires <= time.time():
+        raise KeyError(hostname)
+    if error is not None:
+        raise IOError(error)
+    return list(value)
 
 def ldap_url2hostname_ip(ldap_url):
     """Given LDAP URL, return
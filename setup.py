@@ -10,6 +10,7 @@ setup(name='python-GridMon',
       url='http://cern.ch/',
       packages=['gridmon', 'gridmon.security', 'gridmon.nagios',
                 'gridmon.process'],
+      scripts=['bin/gridmon-probe-client'],
       data_files=[('/etc', ['etc/nagios-submit.conf']),
                   ('/etc/gridmon', ['etc/gridmon.errdb', 'etc/gridmon.conf'])]
      )
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# NAME:        testErrMatch.py
+#
+# FACILITY:    SAM (Service Availability Monitoring)
+#
+# DESCRIPTION:
+#
+#         Tests for gridmon.errmatch module.
+#
+# AUTHORS:     SAM team, CERN
+#
+# CREATED:     Oct 16, 2026
+#
+# NOTES:
+#
+# MODIFIED:
+#
+##############################################################################
+
+"""
+tests for gridmon.errmatch module.
+
+Tests for gridmon.errmatch module.
+
+SAM (Service Availability Monitoring)
+"""
+
+import os
+import re
+import sys
+import time
+import tempfile
+import unittest
+
+sys.path.insert(1, re.sub('/\w*$','/',os.getcwd()))
+
+from gridmon import errmatch
+
+errdb = re.sub('/\w*$','/',os.getcwd()) + 'etc/gridmon.errdb'
+
+class TestErrMatchCache(unittest.TestCase):
+    def test1Cached(self):
+        'Errors DB is loaded once per file and topics.'
+        em1 = errmatch.get_errors_matching(errdb, ['default', 'lfc'])
+        em2 = errmatch.get_errors_matching(errdb, ['default', 'lfc'])
+        self.failUnless(em1 is em2)
+        em3 = errmatch.get_errors_matching(errdb, ['default'])
+        self.failIf(em1 is em3)
+        self.failUnlessEqual(em1.match('lcg-cr: Host not known\n')[0][2],
+                             'UNKNOWN')
+
+    def test2Reloaded(self):
+        'Errors DB is reloaded when the file changes.'
+        fn = tempfile.mktemp()
+        open(fn, 'w').write('[t]\nc_status = WARNING\nc:\n foo\n')
+        try:
+            em1 = errmatch.get_errors_matching(fn, ['t'])
+            self.failUnlessEqual(em1.match('a foo b'), [('t', 'c', 'WARNING')])
+            open(fn, 'w').write('[t]\nc_status = CRITICAL\nc:\n foo|bar\n')
+            os.utime(fn, (time.time() + 10, time.time() + 10))
+            em2 = errmatch.get_errors_matching(fn, ['t'])
+            self.failIf(em1 is em2)
+            self.failUnlessEqual(em2.match('a bar b'), [('t', 'c', 'CRITICAL')])
+        finally:
+            os.unlink(fn)
+
+class TestErrMatchMatch(unittest.TestCase):
+    def setUp(self):
+        self.fn = tempfile.mktemp()
+        open(self.fn, 'w').write("""[t1]
+a_status = WARNING
+a:
+ first error|
+ Protocol(s) not supported
+b:
+ Second\\S+ error
+
+[t2]
+c_status = UNKNOWN
+c:
+ Connection to service.*failed
+""")
+        self.em = errmatch.ErrorsMatching(self.fn, ['t1', 't2'])
+
+    def tearDown(self):
+        os.unlink(self.fn)
+
+    def test1First(self):
+        'First match is the leftmost error, case insensitive.'
+        out = 'foo\nSECOND-x ERROR\nconnection to service X\nFailed\n' + \
+              'first error\n'
+        self.failUnlessEqual(self.em.match(out), [('t1', 'b', 'CRITICAL')])
+        self.failUnlessEqual(self.em.match('a\nb\n'), [])
+
+    def test2MatchAll(self):
+        'All matching options are reported once.'
+        out = 'first error; Protocol not supported; first error\n' + \
+              'Connection to service failed'
+        self.failUnlessEqual(self.em.match(out, matchall=True),
+                             [('t1', 'a', 'WARNING'), ('t2', 'c', 'UNKNOWN')])
+
+    def test3Large(self):
+        'Matching on large outputs.'
+        out = 'x' * 3000000 + '\nconnection to service failed'
+        t = time.time()
+        self.failUnlessEqual(self.em.match(out), [('t2', 'c', 'UNKNOWN')])
+        self.failUnless(time.time() - t < 1)
+
+    def test4RegexSyntax(self):
+        'Only literals are lower cased, regex syntax is left intact.'
+        self.failUnlessEqual(errmatch._lower_re(
+            r'(?P<Host>[A-Z]+) Down (?P=Host) (?:\S+) (?#X)(?iLu)\W'),
+            r'(?P<Host>[a-z]+) down (?P=Host) (?:\S+) (?#X)(?iLu)\W')
+        fn = tempfile.mktemp()
+        try:
+            open(fn, 'w').write(r"""[t]
+a_status = CRITICAL
+a:
+ (?P<Word>Lost) \S+ (?P=Word)
+b:
+ (?:Disk)\s+Full
+""")
+            em = errmatch.ErrorsMatching(fn, ['t'])
+            self.failUnlessEqual(em.match('LOST and lost; disk  FULL',
+                                          matchall=True),
+                                 [('t', 'a', 'CRITICAL'),
+                                  ('t', 'b', 'CRITICAL')])
+        finally:
+            os.unlink(fn)
+
+    def test5MatchAllChunks(self):
+        'Match all across several combined expressions.'
+        fn = tempfile.mktemp()
+        try:
+            f = open(fn, 'w')
+            f.write('[t]\n')
+            for i in range(300):
+                f.write('o%03i_status = WARNING\no%03i:\n Err(or)? %03i\n' %
+                        (i, i, i))
+            f.close()
+            em = errmatch.ErrorsMatching(fn, ['t'])
+            em._maxgroups = 10
+            em._matchers = em._combine(em._entries)
+            self.failUnless(len(em._matchers) > 1)
+            out = ' '.join(['err %03i error %03i' % (i, i)
+                            for i in range(299, -1, -1)]) + ' err 150'
+            t = time.time()
+            res = em.match(out, matchall=True)
+            self.failUnless(time.time() - t < 1)
+            self.failUnlessEqual(res, [('t', 'o%03i' % i, 'WARNING')
+                                       for i in range(299, -1, -1)])
+        finally:
+            os.unlink(fn)
+
+if __name__ == "__main__":
+    testcases = [TestErrMatchCache,
+                 TestErrMatchMatch]
+    for tc in testcases:
+        unittest.TextTestRunner(verbosity=2).\
+            run(unittest.TestLoader().loadTestsFromTestCase(tc))
@@ -33,6 +33,10 @@ import sys
 import unittest
 import socket
 import commands
+import time
+import cPickle
+import shutil
+import tempfile
 
 sys.path.insert(1, re.sub('/\w*$','/',os.getcwd()))
 
@@ -179,10 +183,283 @@ class TestGridutilsQueryBDII(unittest.TestCase):
             self.failUnless(re.search(pattern, res[1]),
                             who+' Expected: \n%s\ngot: \n%s' % (pattern, res[1]))
 
+class TestGridutilsProxyIdentity(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.calls = os.path.join(self.dir, 'calls')
+        vpi = os.path.join(self.dir, 'voms-proxy-info')
+        open(vpi, 'w').write("""#!/bin/sh
+echo $1 >> %s
+case $1 in
+  -subject) echo /DC=ch/CN=tester ;;
+  -fqan) echo /dteam/Role=NULL; echo /dteam/test ;;
+esac
+""" % self.calls)
+        os.chmod(vpi, 0755)
+        self.proxy = os.path.join(self.dir, 'x509up')
+        open(self.proxy, 'w').write('proxy 1')
+        self.env = {}
+        for k in ['PATH', 'X509_USER_PROXY']:
+            self.env[k] = os.environ.get(k)
+        os.environ['PATH'] = '%s:%s' % (self.dir, os.environ['PATH'])
+        os.environ['X509_USER_PROXY'] = self.proxy
+
+    def tearDown(self):
+        for k, v in self.env.items():
+            if v is None:
+                del os.environ[k]
+            else:
+                os.environ[k] = v
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def ncalls(self):
+        try:
+            return len(open(self.calls).readlines())
+        except IOError:
+            return 0
+
+    def test1Cached(self):
+        'Identity is cached until the proxy changes.'
+        ident = ('/DC=ch/CN=tester', ['/dteam/Role=NULL', '/dteam/test'])
+        self.failUnlessEqual(gridutils.get_proxy_identity(self.dir), ident)
+        self.failUnlessEqual(self.ncalls(), 2)
+        self.failUnlessEqual(gridutils.get_proxy_identity(self.dir), ident)
+        self.failUnlessEqual(self.ncalls(), 2)
+        # renewed proxy
+        open(self.proxy, 'w').write('proxy 2 renewed')
+        self.failUnlessEqual(gridutils.get_proxy_identity(self.dir), ident)
+        self.failUnlessEqual(self.ncalls(), 4)
+        self.failUnlessEqual(gridutils.get_proxy_identity(self.dir), ident)
+        self.failUnlessEqual(self.ncalls(), 4)
+
+    def test2NoCache(self):
+        'Without cache directory commands are run every time.'
+        gridutils.get_proxy_identity()
+        gridutils.get_proxy_identity()
+        self.failUnlessEqual(self.ncalls(), 4)
+
+class TestGridutilsBDIICache(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.calls = os.path.join(self.dir, 'calls')
+        ls = os.path.join(self.dir, 'ldapsearch')
+        open(ls, 'w').write("""#!/bin/sh
+echo "$*" >> %s
+case "$*" in
+  *fail*) echo "server error"; exit 1 ;;
+  *-b*) echo "dn: GlueSALocalID=ops,o=grid"
+        echo "GlueSAStateAvailableSpace: 197" ;;
+esac
+""" % self.calls)
+        os.chmod(ls, 0755)
+        self.path = os.environ['PATH']
+        os.environ['PATH'] = '%s:%s' % (self.dir, self.path)
+        self.cachedir = os.path.join(self.dir, 'cache')
+        gridutils.set_bdii_cache(self.cachedir, 60)
+        self.ldap_lib = gridutils.LDAP_LIB
+        self.ldap_native = gridutils.LDAP_NATIVE
+        gridutils.LDAP_LIB = False
+        gridutils.LDAP_NATIVE = False
+
+    def tearDown(self):
+        gridutils.LDAP_LIB = self.ldap_lib
+        gridutils.LDAP_NATIVE = self.ldap_native
+        gridutils.set_bdii_cache(None)
+        os.environ['PATH'] = self.path
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def ncalls(self):
+        try:
+            return len(open(self.calls).readlines())
+        except IOError:
+            return 0
+
+    def query(self, filter='(GlueSALocalID=ops)'):
+        return gridutils.query_bdii(filter, ['GlueSAStateAvailableSpace'],
+                                    ldap_url='ldap://127.0.0.1:2170')
+
+    def test1Cached(self):
+        'Successful results are served from cache.'
+        res = (1, [('GlueSALocalID=ops,o=grid',
+                    {'GlueSAStateAvailableSpace': ['197']})])
+        self.failUnlessEqual(self.query(), res)
+        n = self.ncalls()
+        self.failUnlessEqual(n, 2)
+        self.failUnlessEqual(self.query(), res)
+        self.failUnlessEqual(self.ncalls(), n)
+        # expired entries
+        for f in os.listdir(self.cachedir):
+            os.utime(os.path.join(self.cachedir, f),
+                     (time.time() - 120, time.time() - 120))
+        self.failUnlessEqual(self.query(), res)
+        self.failUnlessEqual(self.ncalls(), n + 2)
+
+    def test2Errors(self):
+        'Errors are not cached.'
+        self.failUnlessEqual(self.query('(fail=1)')[0], 0)
+        self.failUnlessEqual(self.query('(fail=1)')[0], 0)
+        self.failUnlessEqual(self.ncalls(), 4)
+        self.failIf(os.path.isdir(self.cachedir) and
+                    os.listdir(self.cachedir))
+
+    def test3Untrusted(self):
+        'Only data files of the user are read from the cache.'
+        res = self.query()
+        n = self.ncalls()
+        self.failUnlessEqual(os.stat(self.cachedir).st_mode & 0777, 0700)
+        files = [os.path.join(self.cachedir, f)
+                 for f in os.listdir(self.cachedir)]
+        self.failUnlessEqual(len(files), 1)
+        data = open(files[0]).read()
+        # pickles are not loaded
+        open(files[0], 'w').write(cPickle.dumps(samutils.load_data(data)))
+        self.failUnlessEqual(self.query(), res)
+        self.failUnlessEqual(self.ncalls(), n + 2)
+        self.failUnlessEqual(self.query(), res)
+        self.failUnlessEqual(self.ncalls(), n + 2)
+        if os.getuid() == 0:
+            # files of other users are ignored
+            os.chown(files[0], 1, 1)
+            self.failUnlessEqual(self.query(), res)
+            self.failUnlessEqual(self.ncalls(), n + 4)
+
+class TestGridutilsWorkingLDAPState(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.calls = os.path.join(self.dir, 'calls')
+        self.dead = os.path.join(self.dir, 'dead')
+        ls = os.path.join(self.dir, 'ldapsearch')
+        # bind: endpoints listed in 'dead' fail, 127.0.0.2 and (more)
+        # 127.0.0.3 are slow
+        open(ls, 'w').write("""#!/bin/sh
+echo "$3" >> %s
+if grep -q "^$3$" %s; then echo "Can't contact LDAP server"; exit 255; fi
+case "$3" in 127.0.0.2*) sleep 0.3 ;; 127.0.0.3*) sleep 1 ;; esac
+exit 0
+""" % (self.calls, self.dead))
+        os.chmod(ls, 0755)
+        self.setdead([])
+        self.path = os.environ['PATH']
+        os.environ['PATH'] = '%s:%s' % (self.dir, self.path)
+        self.ldap_lib = gridutils.LDAP_LIB
+        self.ldap_native = gridutils.LDAP_NATIVE
+        gridutils.LDAP_LIB = False
+        gridutils.LDAP_NATIVE = False
+        self.state = os.path.join(self.dir, 'state')
+        gridutils.set_ldap_state(self.state, 60)
+        self.reset_memory()
+        self.ldaps = ['ldap://127.0.0.1:2170', 'ldap://127.0.0.2:2170',
+                      'ldap://127.0.0.3:2170']
+
+    def tearDown(self):
+        gridutils.LDAP_LIB = self.ldap_lib
+        gridutils.LDAP_NATIVE = self.ldap_native
+        gridutils.set_ldap_state(None)
+        os.environ['PATH'] = self.path
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def setdead(self, hosts):
+        open(self.dead, 'w').write(''.join(['%s:2170\n' % h for h in hosts]))
+
+    def calls_made(self):
+        try:
+            calls = [x.strip() for x in open(self.calls).readlines()]
+        except IOError:
+            calls = []
+        open(self.calls, 'w').close()
+        calls.sort()
+        return calls
+
+    def reset_memory(self):
+        'Forget in-process state, as if in a new process.'
+        st = getattr(gridutils, '__ldap_state')
+        st['good'] = None
+        st['failed'] = {}
+
+    def test1Concurrent(self):
+        'Dead and slow endpoints do not delay selection.'
+        self.setdead(['127.0.0.1'])
+        t = time.time()
+        self.failUnlessEqual(gridutils.get_working_ldap(self.ldaps),
+                             'ldap://127.0.0.2:2170')
+        self.failUnless(time.time() - t < 1)
+        self.failUnless('127.0.0.1:2170' in self.calls_made())
+
+    def test2LastGood(self):
+        'Last working endpoint is tried first; failed ones are skipped.'
+        self.setdead(['127.0.0.1'])
+        gridutils.get_working_ldap(self.ldaps)
+        time.sleep(1.5)
+        self.calls_made()
+        self.reset_memory()
+        self.failUnlessEqual(gridutils.get_working_ldap(self.ldaps),
+                             'ldap://127.0.0.2:2170')
+        self.failUnlessEqual(self.calls_made(), ['127.0.0.2:2170'])
+        # last good one died; recently failed one is skipped
+        self.setdead(['127.0.0.1', '127.0.0.2'])
+        self.reset_memory()
+        self.failUnlessEqual(gridutils.get_working_ldap(self.ldaps),
+                             'ldap://127.0.0.3:2170')
+        self.failUnlessEqual(self.calls_made(),
+                             ['127.0.0.2:2170', '127.0.0.3:2170'])
+
+    def test3AllFailed(self):
+        'Recently failed endpoints are retried if nothing else is left.'
+        self.setdead(['127.0.0.1', '127.0.0.2', '127.0.0.3'])
+        self.failUnlessRaises(LookupError, gridutils.get_working_ldap,
+                              self.ldaps)
+        self.calls_made()
+        self.setdead([])
+        self.failUnlessEqual(gridutils.get_working_ldap(self.ldaps[:2]),
+                             'ldap://127.0.0.1:2170')
+
+    def test4LastGoodFailed(self):
+        'Last working endpoint is forgotten when it fails.'
+        self.setdead(['127.0.0.1'])
+        gridutils.get_working_ldap(self.ldaps)
+        self.setdead(['127.0.0.1', '127.0.0.2', '127.0.0.3'])
+        self.reset_memory()
+        self.calls_made()
+        self.failUnlessRaises(LookupError, gridutils.get_working_ldap,
+                              self.ldaps)
+        self.failUnlessEqual(self.calls_made(),
+                             ['127.0.0.2:2170', '127.0.0.3:2170'])
+        self.reset_memory()
+        self.failUnlessRaises(LookupError, gridutils.get_working_ldap,
+                              self.ldaps)
+        self.failUnlessEqual(getattr(gridutils, '__ldap_state')['good'], None)
+        self.failUnlessEqual(self.calls_made(), ['127.0.0.1:2170',
+                             '127.0.0.2:2170', '127.0.0.3:2170'])
+
+    def test5Untrusted(self):
+        'Only state files of the user in dump_data() format are read.'
+        state = ('ldap://127.0.0.3:2170', {})
+        open(self.state, 'w').write(samutils.dump_data(state))
+        self.failUnlessEqual(gridutils.get_working_ldap(self.ldaps),
+                             'ldap://127.0.0.3:2170')
+        self.failUnlessEqual(self.calls_made(), ['127.0.0.3:2170'])
+        # pickles are not loaded
+        self.reset_memory()
+        open(self.state, 'w').write(cPickle.dumps(state))
+        self.failUnlessEqual(gridutils.get_working_ldap(self.ldaps),
+                             'ldap://127.0.0.1:2170')
+        self.failUnlessEqual(len(self.calls_made()), 3)
+        if os.getuid() == 0:
+            # files of other users are ignored
+            self.reset_memory()
+            open(self.state, 'w').write(samutils.dump_data(state))
+            os.chown(self.state, 1, 1)
+            self.failUnlessEqual(gridutils.get_working_ldap(self.ldaps),
+                                 'ldap://127.0.0.1:2170')
+            self.failUnlessEqual(len(self.calls_made()), 3)
+
 if __name__ == "__main__":
     testcases = [TestGridutilsGetWorkingLDAP,
                  TestGridutilsGetWorkingLDAPNoContact,
-                 TestGridutilsQueryBDII]
+                 TestGridutilsQueryBDII,
+                 TestGridutilsProxyIdentity,
+                 TestGridutilsBDIICache,
+                 TestGridutilsWorkingLDAPState]
     for tc in testcases:
         unittest.TextTestRunner(verbosity=2).\
             run(unittest.TestLoader().loadTestsFromTestCase(tc))
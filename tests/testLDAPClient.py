@@ -0,0 +1,369 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# NAME:        testLDAPClient.py
+#
+# FACILITY:    SAM (Service Availability Monitoring)
+#
+# DESCRIPTION:
+#
+#         Tests for gridmon.ldapclient module.
+#
+# AUTHORS:     SAM team, CERN
+#
+# CREATED:     Oct 16, 2026
+#
+# NOTES:
+#
+# MODIFIED:
+#
+##############################################################################
+
+"""
+tests for gridmon.ldapclient module.
+
+Tests for gridmon.ldapclient module against a stand-in LDAP server serving
+LDIF fixtures.
+
+SAM (Service Availability Monitoring)
+"""
+
+import os
+import re
+import sys
+import socket
+import threading
+import unittest
+import StringIO
+
+sys.path.insert(1, re.sub('/\w*$','/',os.getcwd()))
+
+from gridmon import ldapclient
+from gridmon import ldif
+from gridmon import gridutils
+from gridmon.ldapclient import _tlv, _int, _seq, _items, _header, _int_value
+
+LDIF = """dn: mds-vo-name=local,o=grid
+objectClass: MDS
+
+dn: GlueSEUniqueID=se.example.org,mds-vo-name=local,o=grid
+objectClass: GlueSE
+GlueSEUniqueID: se.example.org
+GlueSEImplementationName: dCache
+
+dn: GlueSALocalID=ops,GlueSEUniqueID=se.example.org,mds-vo-name=local,o=grid
+objectClass: GlueSA
+GlueSALocalID: ops
+GlueSAStateAvailableSpace: 197000000000
+GlueSAAccessControlBaseRule: VO:ops
+GlueSAAccessControlBaseRule: VOMS:/ops/Role=production
+
+dn: GlueSALocalID=dteam,GlueSEUniqueID=se.example.org,mds-vo-name=local,o=grid
+objectClass: GlueSA
+GlueSALocalID: dteam
+GlueSAStateAvailableSpace: 5
+"""
+
+def _match(f, entry):
+    "Evaluate BER encoded filter on fixture entry."
+    tag, value = f
+    attrs = {}
+    for k, v in entry[1].items():
+        attrs[k.lower()] = [x.lower() for x in v]
+    if tag == 0xa0:
+        for sub in _items(value):
+            if not _match(sub, entry):
+                return False
+        return True
+    if tag == 0xa1:
+        for sub in _items(value):
+            if _match(sub, entry):
+                return True
+        return False
+    if tag == 0xa2:
+        return not _match(_items(value)[0], entry)
+    if tag == 0x87:
+        return value.lower() in attrs
+    if tag == 0xa3:
+        (_, a), (_, v) = _items(value)
+        return v.lower() in attrs.get(a.lower(), [])
+    if tag == 0xa4:
+        (_, a), (_, subs) = _items(value)
+        for v in attrs.get(a.lower(), []):
+            rx = '^'
+            for t, s in _items(subs):
+                s = re.escape(s.lower())
+                rx += {0x80 : '%s', 0x81 : '.*%s', 0x82 : '.*%s$'}[t] % s
+            if re.search(rx, v):
+                return True
+        return False
+    raise ValueError('unsupported filter 0x%x' % tag)
+
+class LDAPServer(threading.Thread):
+    """Stand-in LDAP server. Answers bind, search and unbind with entries
+    parsed from LDIF fixtures.
+    """
+    def __init__(self, data):
+        threading.Thread.__init__(self)
+        self.setDaemon(True)
+        self.entries = list(ldif.parse(StringIO.StringIO(data)))
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(5)
+        self.port = self.sock.getsockname()[1]
+        self.connections = 0
+        self.binds = 0
+        self.searches = []
+        self.result_code = 0
+        "forced result code of searches"
+        self.drop = False
+        "close connections after answering a search"
+
+    def run(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except socket.error:
+                return
+            self.connections += 1
+            t = threading.Thread(target=self.serve, args=(conn,))
+            t.setDaemon(True)
+            t.start()
+
+    def stop(self):
+        self.sock.close()
+
+    def serve(self, conn):
+        buf = ''
+        while True:
+            h = _header(buf, 0)
+            if h is None or h[2] > len(buf):
+                d = conn.recv(4096)
+                if not d:
+                    break
+                buf += d
+                continue
+            msg = buf[h[1]:h[2]]
+            buf = buf[h[2]:]
+            (_, msgid), (op, value) = _items(msg)[:2]
+            msgid = _int_value(msgid)
+            if op == 0x60:
+                self.binds += 1
+                self.send(conn, msgid, _seq([_int(0, 0x0a), _tlv(0x04, ''),
+                                             _tlv(0x04, '')], 0x61))
+            elif op == 0x63:
+                self.search(conn, msgid, _items(value))
+                if self.drop:
+                    break
+            elif op == 0x42:
+                break
+        conn.close()
+
+    def send(self, conn, msgid, op):
+        conn.sendall(_seq([_int(msgid), op]))
+
+    def search(self, conn, msgid, req):
+        base = req[0][1].lower()
+        sizelimit = _int_value(req[3][1])
+        attrs = [a.lower() for _, a in _items(req[7][1])]
+        self.searches.append((req[0][1], attrs))
+        sent = 0
+        code = self.result_code
+        for dn, entry in self.entries:
+            if not dn.lower().endswith(base) or \
+               not _match(req[6], (dn, entry)):
+                continue
+            if sizelimit and sent == sizelimit:
+                code = ldapclient.SIZE_LIMIT_EXCEEDED
+                break
+            vals = []
+            for k, v in entry.items():
+                if attrs and k.lower() not in attrs:
+                    continue
+                vals.append(_seq([_tlv(0x04, k),
+                                  _seq([_tlv(0x04, x) for x in v], 0x31)]))
+            self.send(conn, msgid, _seq([_tlv(0x04, dn), _seq(vals)], 0x64))
+            sent += 1
+        self.send(conn, msgid, _seq([_int(code, 0x0a), _tlv(0x04, ''),
+                                     _tlv(0x04, '')], 0x65))
+
+class TestBER(unittest.TestCase):
+    def test1Integers(self):
+        'BER encoding of integers.'
+        for n, enc in [(0, '\x02\x01\x00'), (127, '\x02\x01\x7f'),
+                       (128, '\x02\x02\x00\x80'), (256, '\x02\x02\x01\x00'),
+                       (-1, '\x02\x01\xff'), (-129, '\x02\x02\xff\x7f')]:
+            self.failUnlessEqual(_int(n), enc)
+            self.failUnlessEqual(_int_value(enc[2:]), n)
+
+    def test2Lengths(self):
+        'BER long form lengths.'
+        v = 'x' * 300
+        enc = _tlv(0x04, v)
+        self.failUnlessEqual(enc[:4], '\x04\x82\x01\x2c')
+        self.failUnlessEqual(_header(enc, 0), (0x04, 4, 304))
+        self.failUnlessEqual(_header(enc[:3], 0), None)
+
+    def test3Filters(self):
+        'Encoding of string filters.'
+        self.failUnlessEqual(ldapclient.encode_filter('objectClass=*'),
+                             '\x87\x0bobjectClass')
+        self.failUnlessEqual(ldapclient.encode_filter('(cn=a\\2ab)'),
+                             '\xa3\x09\x04\x02cn\x04\x03a*b')
+        self.failUnlessEqual(ldapclient.encode_filter('(cn=a*b*)'),
+                             '\xa4\x0c\x04\x02cn0\x06\x80\x01a\x81\x01b')
+        self.failUnlessEqual(ldapclient.encode_filter('(!(cn>=b))'),
+                             '\xa2\x09\xa5\x07\x04\x02cn\x04\x01b')
+        self.failUnlessEqual(ldapclient.encode_filter('(&(a=1)(|(b=2)(c=3)))'),
+            '\xa0\x1a\xa3\x06\x04\x01a\x04\x011'
+            '\xa1\x10\xa3\x06\x04\x01b\x04\x012\xa3\x06\x04\x01c\x04\x013')
+        for f in ['(cn=a', '(&(a=1)', '(!(a=1)(b=2))', '(cn:dn:=a)',
+                  '(=a)', '(cn=\\zz)', '(a=1)(b=2)']:
+            self.failUnlessRaises(ldapclient.ErrLDAP,
+                                  ldapclient.encode_filter, f)
+
+    def test4ParseURL(self):
+        'Host and port of LDAP URL.'
+        self.failUnlessEqual(ldapclient.parse_url('ldap://h.org:2170'),
+                             ('h.org', 2170))
+        self.failUnlessEqual(ldapclient.parse_url('h.org'), ('h.org', 389))
+
+class TestLDAPConnection(unittest.TestCase):
+    def setUp(self):
+        self.server = LDAPServer(LDIF)
+        self.server.start()
+        self.conn = ldapclient.LDAPConnection('127.0.0.1', self.server.port, 5)
+
+    def tearDown(self):
+        self.conn.unbind()
+        self.server.stop()
+
+    def test1Search(self):
+        'Search with attribute list.'
+        res = self.conn.search('o=grid', '(objectClass=GlueSA)',
+                               ['GlueSAStateAvailableSpace'])
+        self.failUnlessEqual(res,
+            [('GlueSALocalID=ops,GlueSEUniqueID=se.example.org,mds-vo-name=local,o=grid',
+              {'GlueSAStateAvailableSpace': ['197000000000']}),
+             ('GlueSALocalID=dteam,GlueSEUniqueID=se.example.org,mds-vo-name=local,o=grid',
+              {'GlueSAStateAvailableSpace': ['5']})])
+        self.failUnlessEqual(self.server.binds, 1)
+
+    def test2AllAttributes(self):
+        'Search for all attributes; multi-valued attributes.'
+        res = self.conn.search('o=grid', '(&(objectClass=GlueSA)'
+                               '(GlueSAAccessControlBaseRule=VOMS:*))')
+        self.failUnlessEqual(len(res), 1)
+        self.failUnlessEqual(res[0][1]['GlueSAAccessControlBaseRule'],
+                             ['VO:ops', 'VOMS:/ops/Role=production'])
+        self.failUnlessEqual(len(res[0][1]), 4)
+
+    def test3EmptyResult(self):
+        'Search without matches.'
+        self.failUnlessEqual(self.conn.search('o=grid', '(GlueSALocalID=cms)'),
+                             [])
+
+    def test4Limits(self):
+        'Size and time limits exceeded.'
+        try:
+            self.conn.search('o=grid', '(objectClass=*)', sizelimit=2)
+        except ldapclient.ErrLDAP, e:
+            self.failUnlessEqual(e.code, ldapclient.SIZE_LIMIT_EXCEEDED)
+            self.failUnlessEqual(len(e.entries), 2)
+        else:
+            self.fail('ErrLDAP not raised.')
+        self.server.result_code = ldapclient.TIME_LIMIT_EXCEEDED
+        try:
+            self.conn.search('o=grid', '(objectClass=*)', timelimit=1)
+        except ldapclient.ErrLDAP, e:
+            self.failUnlessEqual(e.code, ldapclient.TIME_LIMIT_EXCEEDED)
+            self.failUnlessEqual(len(e.entries), 4)
+        else:
+            self.fail('ErrLDAP not raised.')
+
+    def test5Reuse(self):
+        'Connection is kept across searches and re-established once broken.'
+        for i in range(3):
+            self.conn.search('o=grid', '(objectClass=GlueSE)')
+        self.failUnlessEqual(self.server.connections, 1)
+        self.failUnlessEqual(self.server.binds, 1)
+        self.server.drop = True
+        self.conn.search('o=grid', '(objectClass=GlueSE)')
+        res = self.conn.search('o=grid', '(objectClass=GlueSE)')
+        self.failUnlessEqual(len(res), 1)
+        self.failUnlessEqual(self.server.connections, 2)
+        self.failUnlessEqual(self.server.binds, 2)
+
+    def test6ServerDown(self):
+        'Connection refused.'
+        self.server.stop()
+        conn = ldapclient.LDAPConnection('127.0.0.1', self.server.port, 5)
+        try:
+            conn.bind()
+        except ldapclient.ErrLDAP, e:
+            self.failUnlessEqual(e.code, ldapclient.SERVER_DOWN)
+        else:
+            self.fail('ErrLDAP not raised.')
+
+    def test7GetConnection(self):
+        'Connections are kept per endpoint.'
+        url = 'ldap://127.0.0.1:%i' % self.server.port
+        c = ldapclient.get_connection(url)
+        self.failUnless(c is ldapclient.get_connection(url))
+        self.failIf(c is ldapclient.get_connection('ldap://127.0.0.1:1'))
+
+class TestQueryBDIINative(unittest.TestCase):
+    def setUp(self):
+        self.server = LDAPServer(LDIF)
+        self.server.start()
+        self.url = 'ldap://127.0.0.1:%i' % self.server.port
+        self.ldap_lib = gridutils.LDAP_LIB
+        self.ldap_native = gridutils.LDAP_NATIVE
+        gridutils.LDAP_LIB = False
+        gridutils.LDAP_NATIVE = True
+
+    def tearDown(self):
+        gridutils.LDAP_LIB = self.ldap_lib
+        gridutils.LDAP_NATIVE = self.ldap_native
+        ldapclient.get_connection(self.url).unbind()
+        self.server.stop()
+
+    def test1Query(self):
+        'query_bdii() with built-in client reuses the connection.'
+        for i in range(2):
+            rc, res = gridutils.query_bdii('(GlueSALocalID=ops)',
+                                           ['GlueSAStateAvailableSpace'],
+                                           ldap_url=self.url)
+            self.failUnlessEqual((rc, res), (1,
+                [('GlueSALocalID=ops,GlueSEUniqueID=se.example.org,mds-vo-name=local,o=grid',
+                  {'GlueSAStateAvailableSpace': ['197000000000']})]))
+        rc, res = gridutils.query_bdii('(GlueSALocalID=ops)', [],
+                                       ldap_url=self.url, lazy=True)
+        self.failUnlessEqual(rc, 1)
+        self.failUnlessEqual(len(list(res)), 1)
+        self.failUnlessEqual(self.server.connections, 1)
+        self.failUnlessEqual(len(self.server.searches), 3)
+
+    def test2Failures(self):
+        'query_bdii() with built-in client - empty set and time limit.'
+        rc, res = gridutils.query_bdii('(GlueSALocalID=cms)', [],
+                                       ldap_url=self.url)
+        self.failUnlessEqual((rc, res[0]), (0, gridutils.LDAP_QE_EMPTYSET))
+        self.server.result_code = ldapclient.TIME_LIMIT_EXCEEDED
+        rc, res = gridutils.query_bdii('(GlueSALocalID=ops)', [],
+                                       ldap_url=self.url)
+        self.failUnlessEqual((rc, res[0]), (0, gridutils.LDAP_QE_TIMEOUT))
+        self.server.result_code = 53
+        rc, res = gridutils.query_bdii('(GlueSALocalID=ops)', [],
+                                       ldap_url=self.url)
+        self.failUnlessEqual((rc, res[0]), (0, gridutils.LDAP_QE_LDAP))
+        self.failUnless('unwilling' in res[1], res[1])
+
+if __name__ == "__main__":
+    testcases = [TestBER,
+                 TestLDAPConnection,
+                 TestQueryBDIINative]
+    for tc in testcases:
+        unittest.TextTestRunner(verbosity=2).\
+            run(unittest.TestLoader().loadTestsFromTestCase(tc))
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# NAME:        testLDIF.py
+#
+# FACILITY:    SAM (Service Availability Monitoring)
+#
+# DESCRIPTION:
+#
+#         Tests for gridmon.ldif module.
+#
+# AUTHORS:     SAM team, CERN
+#
+# CREATED:     Oct 16, 2026
+#
+# NOTES:
+#
+# MODIFIED:
+#
+##############################################################################
+
+"""
+tests for gridmon.ldif module.
+
+Tests for gridmon.ldif module.
+
+SAM (Service Availability Monitoring)
+"""
+
+import os
+import re
+import sys
+import shutil
+import tempfile
+import unittest
+import StringIO
+
+sys.path.insert(1, re.sub('/\w*$','/',os.getcwd()))
+
+from gridmon import ldif
+from gridmon import gridutils
+
+LDIF = """version: 1
+
+# ce.example.org, local, grid
+dn: GlueCEUniqueID=ce.example.org:2119/jobmanager-pbs-ops,mds-vo-name=local
+ ,o=grid
+GlueCEUniqueID: ce.example.org:2119/jobmanager-pbs-ops
+GlueCEAccessControlBaseRule: VO:ops
+GlueCEAccessControlBaseRule: VOMS:/ops/Role=lcgadmin
+GlueCEInfoHostName:: Y2UuZXhhbXBsZS5vcmcg
+GlueCEName: o
+ ps
+
+dn: GlueSEUniqueID=se.example.org,mds-vo-name=local,o=grid\r
+GlueSEImplementationName: dCache\r
+GlueSEStatus:< file:///tmp/status
+"""
+
+ENTRIES = [('GlueCEUniqueID=ce.example.org:2119/jobmanager-pbs-ops,mds-vo-name=local,o=grid',
+            {'GlueCEUniqueID': ['ce.example.org:2119/jobmanager-pbs-ops'],
+             'GlueCEAccessControlBaseRule': ['VO:ops',
+                                             'VOMS:/ops/Role=lcgadmin'],
+             'GlueCEInfoHostName': ['ce.example.org '],
+             'GlueCEName': ['ops']}),
+           ('GlueSEUniqueID=se.example.org,mds-vo-name=local,o=grid',
+            {'GlueSEImplementationName': ['dCache'],
+             'GlueSEStatus': ['file:///tmp/status']})]
+
+class TestLDIFParser(unittest.TestCase):
+    def test1Parse(self):
+        'Folding, base64, comments, CRLF.'
+        self.failUnlessEqual(list(ldif.parse(StringIO.StringIO(LDIF))),
+                             ENTRIES)
+
+    def test2Chunks(self):
+        'Entries do not depend on how data is split into chunks.'
+        for n in [1, 2, 3, 7, 64]:
+            p = ldif.LDIFParser()
+            entries = []
+            for i in range(0, len(LDIF), n):
+                p.feed(LDIF[i:i+n])
+                entries.extend(p.take())
+            p.close()
+            entries.extend(p.take())
+            self.failUnlessEqual(entries, ENTRIES)
+
+    def test3Incremental(self):
+        'Entry is available as soon as it is complete.'
+        p = ldif.LDIFParser()
+        p.feed('dn: o=grid\nobjectClass: top\n')
+        self.failUnlessEqual(p.take(), [])
+        p.feed('\ndn: o=other\n')
+        self.failUnlessEqual(p.take(), [('o=grid', {'objectClass': ['top']})])
+        p.close()
+        self.failUnlessEqual(p.take(), [('o=other', {})])
+
+    def test4Malformed(self):
+        'Malformed LDIF.'
+        for data in ['dn: o=grid\nno colon here\n',
+                     ' continuation\n',
+                     'attr: outside of entry\n',
+                     'dn: o=grid\nattr:: !!!\n']:
+            p = ldif.LDIFParser()
+            self.failUnlessRaises(ldif.ErrLDIF, lambda: (p.feed(data), p.close()))
+
+class TestLDIFCommand(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.file = os.path.join(self.dir, 'ldif')
+        open(self.file, 'w').write(LDIF)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test1Command(self):
+        'Entries from output of a command.'
+        c = ldif.LDIFCommand('cat %s' % self.file)
+        self.failUnless(c.prime())
+        self.failUnlessEqual(list(c), ENTRIES)
+        self.failUnlessEqual(c.returncode, 0)
+
+    def test2Failure(self):
+        'Failed command.'
+        c = ldif.LDIFCommand("echo 'ldap_bind: server down'; exit 255")
+        self.failUnlessRaises(ldif.ErrLDIF, c.prime)
+        self.failUnlessEqual(c.returncode, 255)
+        self.failUnlessEqual(c.output, 'ldap_bind: server down\n')
+
+    def test2Stderr(self):
+        'Only stdout is parsed; stderr is kept for error messages.'
+        c = ldif.LDIFCommand("echo 'warning: no TLS' >&2; cat %s; "
+                             "echo 'dn is not: LDIF' >&2" % self.file)
+        self.failUnlessEqual(list(c), ENTRIES)
+        self.failUnlessEqual(c.errors, 'warning: no TLS\ndn is not: LDIF\n')
+        c = ldif.LDIFCommand("cat %s; echo 'ldap_result: timeout' >&2; "
+                             "exit 3" % self.file)
+        try:
+            list(c)
+        except ldif.ErrLDIF, e:
+            self.failUnlessEqual(str(e),
+                                 'Command exited with 3. ldap_result: timeout')
+        else:
+            self.fail('ErrLDIF not raised.')
+        self.failUnlessEqual(c.output, LDIF)
+
+    def test3Large(self):
+        'Many entries.'
+        c = ldif.LDIFCommand("i=0; while [ $i -lt 2000 ]; do "
+                             "printf 'dn: o=%i\\na: b\\n\\n' $i; "
+                             "i=$((i+1)); done")
+        n = 0
+        for dn, attrs in c:
+            self.failUnlessEqual(dn, 'o=%i' % n)
+            n += 1
+        self.failUnlessEqual(n, 2000)
+
+    def test4QueryBDII(self):
+        'Lazy query_bdii() with ldapsearch CLI.'
+        ls = os.path.join(self.dir, 'ldapsearch')
+        open(ls, 'w').write('#!/bin/sh\ncase "$*" in *-b*) cat %s ;; esac\n' %
+                            self.file)
+        os.chmod(ls, 0755)
+        path = os.environ['PATH']
+        ldap_lib = gridutils.LDAP_LIB
+        ldap_native = gridutils.LDAP_NATIVE
+        os.environ['PATH'] = '%s:%s' % (self.dir, path)
+        gridutils.LDAP_LIB = False
+        gridutils.LDAP_NATIVE = False
+        try:
+            rc, res = gridutils.query_bdii('(objectClass=*)', [],
+                                           ldap_url='ldap://127.0.0.1:2170')
+            self.failUnlessEqual((rc, res), (1, ENTRIES))
+            rc, res = gridutils.query_bdii('(objectClass=*)', [],
+                                           ldap_url='ldap://127.0.0.1:2170',
+                                           lazy=True)
+            self.failUnlessEqual(rc, 1)
+            self.failIf(isinstance(res, list))
+            self.failUnlessEqual(list(res), ENTRIES)
+        finally:
+            os.environ['PATH'] = path
+            gridutils.LDAP_LIB = ldap_lib
+            gridutils.LDAP_NATIVE = ldap_native
+
+if __name__ == "__main__":
+    testcases = [TestLDIFParser,
+                 TestLDIFCommand]
+    for tc in testcases:
+        unittest.TextTestRunner(verbosity=2).\
+            run(unittest.TestLoader().loadTestsFromTestCase(tc))
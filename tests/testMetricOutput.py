@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# NAME:        testMetricOutput.py
+#
+# FACILITY:    SAM (Service Availability Monitoring)
+#
+# DESCRIPTION:
+#
+#         Tests for gridmon.metricoutput module.
+#
+# AUTHORS:     SAM team, CERN
+#
+# CREATED:     Oct 16, 2026
+#
+# NOTES:
+#
+# MODIFIED:
+#
+##############################################################################
+
+"""
+tests for gridmon.metricoutput module.
+
+Tests for gridmon.metricoutput module.
+
+SAM (Service Availability Monitoring)
+"""
+
+import os
+import re
+import sys
+import time
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(1, re.sub('/\w*$','/',os.getcwd()))
+
+from gridmon.metricoutput import DetailsBuffer, TestOutputContainer
+
+class TestDetailsBuffer(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test1AppendPrepend(self):
+        'Order of appended and prepended data.'
+        b = DetailsBuffer()
+        self.failUnlessEqual(b.getvalue(), '')
+        b.append('c')
+        b.prepend('b')
+        b.append('d')
+        b.prepend('a')
+        self.failUnlessEqual(b.getvalue(), 'abcd')
+        b.append('e')
+        b.prepend('_')
+        self.failUnlessEqual(b.getvalue(), '_abcde')
+        self.failUnlessEqual(len(b), 6)
+        b.clear()
+        self.failUnlessEqual(b.getvalue(), '')
+        self.failUnlessEqual(len(b), 0)
+
+    def test2Spill(self):
+        'Data over the size limit go to a file.'
+        b = DetailsBuffer(max_size=10, directory=self.dir)
+        b.append('0123456789')
+        b.prepend('head\n')
+        self.failUnlessEqual(os.listdir(self.dir), [])
+        b.append('abc')
+        b.append('def')
+        b.prepend('top\n')
+        self.failUnlessEqual(b.getvalue(), 'top\nhead\n0123456789abcdef')
+        b.append('g')
+        self.failUnlessEqual(b.getvalue(), 'top\nhead\n0123456789abcdefg')
+        self.failUnlessEqual(len(b), 26)
+        b.clear()
+        self.failUnlessEqual(b.getvalue(), '')
+
+    def test3Many(self):
+        'Lots of small appends and prepends.'
+        c = TestOutputContainer()
+        t = time.time()
+        for i in range(100000):
+            c.handle_detdata('line %i' % i)
+        c.handle_detdata('first', prep=True)
+        self.failUnless(time.time() - t < 5)
+        dd = c.get_detdata().split('\n')
+        self.failUnlessEqual(len(dd), 100002)
+        self.failUnlessEqual(dd[:2], ['first', 'line 0'])
+        self.failUnlessEqual(dd[-2], 'line 99999')
+
+    def test4Container(self):
+        'Container falls back to summary.'
+        c = TestOutputContainer(max_size=5, directory=self.dir)
+        c.handle_summary('OK: fine')
+        self.failUnlessEqual(c.get_detdata(), 'OK: fine')
+        c.handle_detdata('details')
+        c.handle_detdata('summary', cr=False, prep=True)
+        self.failUnlessEqual(c.get_detdata(), 'summarydetails\n')
+        c.clear_summary_details()
+        self.failUnlessEqual(c.get_detdata(), '')
+
+if __name__ == "__main__":
+    testcases = [TestDetailsBuffer]
+    for tc in testcases:
+        unittest.TextTestRunner(verbosity=2).\
+            run(unittest.TestLoader().loadTestsFromTestCase(tc))
@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# NAME:        testNSCA.py
+#
+# FACILITY:    SAM (Service Availability Monitoring)
+#
+# DESCRIPTION:
+#
+#         Tests for gridmon.nagios.nsca module.
+#
+# AUTHORS:     SAM team, CERN
+#
+# CREATED:     Oct 16, 2026
+#
+# NOTES:
+#
+# MODIFIED:
+#
+##############################################################################
+
+"""
+tests for gridmon.nagios.nsca module.
+
+Tests for gridmon.nagios.nsca module.
+
+SAM (Service Availability Monitoring)
+"""
+
+import os
+import re
+import sys
+import time
+import random
+import socket
+import struct
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(1, re.sub('/\w*$','/',os.getcwd()))
+
+from gridmon.nagios import nsca
+from gridmon.nagios import nagios
+
+PACKET_SIZE = struct.calcsize(nsca._packet_format(nsca.MAX_PLUGINOUTPUT_LENGTH))
+
+class StandInNSCA(threading.Thread):
+    """NSCA listener accepting connections and decoding data packets.
+    Closes each connection after `close_after` packets."""
+    def __init__(self, encryption=nsca.ENCRYPT_NONE, password='',
+                 close_after=None):
+        threading.Thread.__init__(self)
+        self.setDaemon(True)
+        self.encryption = encryption
+        self.password = password
+        self.close_after = close_after
+        self.connections = 0
+        self.packets = []
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(5)
+        self.port = self.sock.getsockname()[1]
+        self.timestamp = int(time.time())
+
+    def run(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except socket.error:
+                return
+            self.connections += 1
+            iv = ''.join([chr(random.randint(0, 255)) for i in range(128)])
+            conn.sendall(iv + struct.pack('!I', self.timestamp))
+            n = 0
+            while self.close_after is None or n < self.close_after:
+                data = ''
+                while len(data) < PACKET_SIZE:
+                    d = conn.recv(PACKET_SIZE - len(data))
+                    if not d:
+                        break
+                    data += d
+                if len(data) < PACKET_SIZE:
+                    break
+                if self.encryption == nsca.ENCRYPT_XOR:
+                    data = nsca._xor(data, iv, self.password)
+                self.packets.append(nsca.parse_packet(data))
+                n += 1
+            conn.close()
+
+    def stop(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        self.sock.close()
+        self.join(2)
+
+    def wait(self, n):
+        for i in range(50):
+            if len(self.packets) >= n:
+                break
+            time.sleep(0.05)
+
+class TestNSCAClient(unittest.TestCase):
+    def test1Packet(self):
+        'Packet layout and CRC32.'
+        p = nsca.build_packet(1234, 'h' * 100, 'svc', 2, 'out')
+        self.failUnlessEqual(len(p), 720)
+        self.failUnlessEqual(nsca.parse_packet(p),
+                             (3, 1234, 2, 'h' * 63, 'svc', 'out'))
+        self.failUnlessRaises(nsca.ErrNSCA, nsca.parse_packet,
+                              p[:20] + 'X' + p[21:])
+
+    def test2NoEncryption(self):
+        'Results sent over one connection.'
+        srv = StandInNSCA()
+        srv.start()
+        c = nsca.NSCAClient('127.0.0.1', srv.port)
+        c.send('host1', 'svc1', 0, 'OK: fine')
+        c.send_many([('host2', 'svc2', 2, 'CRITICAL: bad\\nmore'),
+                     ('host3', 'svc3', 1, 'WARNING: hm')])
+        srv.wait(3)
+        c.close()
+        srv.stop()
+        self.failUnlessEqual(srv.connections, 1)
+        self.failUnlessEqual([p[2:] for p in srv.packets],
+                             [(0, 'host1', 'svc1', 'OK: fine'),
+                              (2, 'host2', 'svc2', 'CRITICAL: bad\\nmore'),
+                              (1, 'host3', 'svc3', 'WARNING: hm')])
+        for p in srv.packets:
+            self.failUnless(p[1] - srv.timestamp < 2)
+
+    def test3XOR(self):
+        'XOR encryption and reconnect on closed connection.'
+        srv = StandInNSCA(nsca.ENCRYPT_XOR, 'secret', close_after=1)
+        srv.start()
+        c = nsca.NSCAClient('127.0.0.1', srv.port, nsca.ENCRYPT_XOR, 'secret')
+        c.send('host1', 'svc1', 0, 'OK: one')
+        srv.wait(1)
+        time.sleep(0.1)
+        c.send('host2', 'svc2', 0, 'OK: two')
+        srv.wait(2)
+        c.close()
+        srv.stop()
+        self.failUnlessEqual(srv.connections, 2)
+        self.failUnlessEqual([p[3] for p in srv.packets], ['host1', 'host2'])
+
+    def test4Unsupported(self):
+        'Unsupported encryption method.'
+        self.failUnlessRaises(nsca.ErrNSCA, nsca.NSCAClient, 'localhost',
+                              5667, 3)
+
+    def test5Publish(self):
+        'Publish via gridmon.nagios.'
+        srv = StandInNSCA(nsca.ENCRYPT_XOR, 'p=w')
+        srv.start()
+        conf = tempfile.mktemp()
+        open(conf, 'w').write('# send_nsca.cfg\npassword=p=w\n'
+                              'encryption_method=1\n')
+        try:
+            res = [{'host' : 'h%i' % i, 'service' : 'svc', 'status' : '1',
+                    'summary' : 'WARNING: w', 'details' : 'a\nb'}
+                   for i in range(3)]
+            nagios.publishPassiveResultNSCANative('127.0.0.1', str(srv.port),
+                                                  res, conf=conf)
+            nagios.publishPassiveResultNSCANative('127.0.0.1', str(srv.port),
+                                                  res[:1], conf=conf)
+        finally:
+            os.unlink(conf)
+        srv.wait(4)
+        nsca.get_client('127.0.0.1', srv.port, nsca.ENCRYPT_XOR, 'p=w').close()
+        srv.stop()
+        self.failUnlessEqual(srv.connections, 1)
+        self.failUnlessEqual(len(srv.packets), 4)
+        self.failUnlessEqual(srv.packets[0][2:],
+                             (1, 'h0', 'svc', 'WARNING: w\\na\\nb'))
+
+    def test6Unsent(self):
+        'Results not sent are reported.'
+        srv = StandInNSCA()
+        srv.start()
+        c = nsca.NSCAClient('127.0.0.1', srv.port)
+        send_packet = c._NSCAClient__send_packet
+        sent = []
+        def fail_after_first(*args):
+            if sent:
+                raise socket.error(32, 'Broken pipe')
+            send_packet(*args)
+            sent.append(args)
+        c._NSCAClient__send_packet = fail_after_first
+        results = [('host%i' % i, 'svc', 0, 'OK') for i in range(3)]
+        try:
+            c.send_many(results)
+        except nsca.ErrNSCA, e:
+            self.failUnlessEqual(e.sent, 1)
+            self.failUnlessEqual(e.unsent, results[1:])
+        else:
+            self.fail('ErrNSCA not raised')
+        c.close()
+        srv.stop()
+        # server not reachable
+        conf = tempfile.mktemp()
+        open(conf, 'w').write('password=\n')
+        res = ['h%i;svc;0;OK' % i for i in range(2)]
+        try:
+            try:
+                nagios.publishPassiveResultNSCANative('127.0.0.1',
+                                                      str(srv.port), res,
+                                                      conf=conf)
+            except nagios.ErrNagiosLib, e:
+                self.failUnlessEqual(e.unsent, res)
+            else:
+                self.fail('ErrNagiosLib not raised')
+        finally:
+            os.unlink(conf)
+
+
+if __name__ == "__main__":
+    testcases = [TestNSCAClient]
+    for tc in testcases:
+        unittest.TextTestRunner(verbosity=2).\
+            run(unittest.TestLoader().loadTestsFromTestCase(tc))
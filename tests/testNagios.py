@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# NAME:        testNagios.py
+#
+# FACILITY:    SAM (Service Availability Monitoring)
+#
+# DESCRIPTION:
+#
+#         Tests for gridmon.nagios.nagios module.
+#
+# AUTHORS:     SAM team, CERN
+#
+# CREATED:     Oct 16, 2026
+#
+# NOTES:
+#
+# MODIFIED:
+#
+##############################################################################
+
+"""
+tests for gridmon.nagios.nagios module.
+
+Tests for gridmon.nagios.nagios module.
+
+SAM (Service Availability Monitoring)
+"""
+
+import os
+import re
+import sys
+import glob
+import time
+import signal
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(1, re.sub('/\w*$','/',os.getcwd()))
+
+from gridmon.nagios import nagios
+from gridmon.process import signaling
+
+# stand-in for send_nsca: stores each invocation's stdin to a file in the
+# directory given as configuration file; fails on results containing 'bad',
+# reports only the results before the first one containing 'lost' as sent,
+# hangs on 'slow'
+SEND_NSCA = """#!/bin/sh
+f=`mktemp $2/inv.XXXXXX`
+cat > $f
+if grep slow $f >/dev/null; then sleep 3; fi
+if grep bad $f >/dev/null; then echo "Error: failed" >&2; exit 2; fi
+n=`tr '\\027' '\\n' < $f | sed '/lost/,$d' | wc -l`
+echo "$n data packet(s) sent to host successfully."
+"""
+
+def results(n, bad=()):
+    res = []
+    for i in range(n):
+        h = 'host%i' % i
+        if i in bad:
+            h = 'bad%i' % i
+        res.append({'host' : h, 'service' : 'svc', 'status' : '0',
+                    'summary' : 'OK: fine', 'details' : 'a\nb'})
+    return res
+
+class TestPublishNSCA(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.bin = os.path.join(self.dir, 'send_nsca')
+        open(self.bin, 'w').write(SEND_NSCA)
+        os.chmod(self.bin, 0755)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def invocations(self):
+        res = []
+        for f in glob.glob(os.path.join(self.dir, 'inv.*')):
+            res.append(open(f).read().split(nagios.ETB)[:-1])
+        return res
+
+    def test1Batched(self):
+        'Results are sent in batches.'
+        nagios.publishPassiveResultNSCA(self.bin, self.dir, 'nsca.example.com',
+                                        '5667', results(25), batch=10)
+        inv = self.invocations()
+        self.failUnlessEqual(len(inv), 3)
+        lens = [len(x) for x in inv]
+        lens.sort()
+        self.failUnlessEqual(lens, [5, 10, 10])
+        for x in inv:
+            for r in x:
+                self.failUnless(re.match('host\d+;svc;0;OK: fine\\\\na\\\\nb$', r), r)
+
+    def test2FailedReported(self):
+        'Results of failed batches are reported.'
+        res = results(6, bad=(1,))
+        try:
+            nagios.publishPassiveResultNSCA(self.bin, self.dir,
+                                            'nsca.example.com', '5667',
+                                            res, batch=3)
+        except nagios.ErrNagiosLib, e:
+            msg = e.args
+            self.failUnless('Failed 3 of 6 results' in msg, msg)
+            self.failUnless('[bad1;svc] Error: failed' in msg, msg)
+            self.failUnless('[host0;svc] Error: failed' in msg, msg)
+            self.failIf('host3' in msg, msg)
+            self.failUnlessEqual(e.unsent,
+                nagios._getPassiveResultString(res)[:3])
+        else:
+            self.fail('ErrNagiosLib not raised.')
+        # failed batch with no results reported sent is not re-sent
+        self.failUnlessEqual(len(self.invocations()), 2)
+
+    def test3EncodedOutput(self):
+        'Already encoded output is sent as is.'
+        res = results(2)
+        res[1]['output'] = 'OK: fine\\nencoded|p=1'
+        del res[1]['summary']
+        nagios.publishPassiveResultNSCA(self.bin, self.dir, 'nsca.example.com',
+                                        '5667', res)
+        inv = self.invocations()
+        self.failUnlessEqual(inv, [['host0;svc;0;OK: fine\\na\\nb',
+                                    'host1;svc;0;OK: fine\\nencoded|p=1']])
+
+    def test4PartiallySent(self):
+        'Only the results not accepted by the client are re-sent.'
+        res = results(4)
+        res[1]['host'] = 'lost1'
+        try:
+            nagios.publishPassiveResultNSCA(self.bin, self.dir,
+                                            'nsca.example.com', '5667',
+                                            res, batch=4)
+        except nagios.ErrNagiosLib, e:
+            self.failUnless('Failed 1 of 4 results' in e.args, e.args)
+            self.failUnlessEqual([r.split(';')[0] for r in e.unsent],
+                                 ['lost1'])
+        else:
+            self.fail('ErrNagiosLib not raised.')
+        sent = [[r.split(';')[0] for r in x] for x in self.invocations()]
+        sent.sort()
+        self.failUnlessEqual(sent, [['host0', 'lost1', 'host2', 'host3'],
+                                    ['host2'], ['host3'], ['lost1']])
+
+    def test5TimedOut(self):
+        'Timeout is not taken for a failure of the client.'
+        res = results(3)
+        res[0]['host'] = 'slow0'
+        handler = signal.signal(signal.SIGALRM, signaling.sig_alrm)
+        signal.alarm(1)
+        try:
+            self.failUnlessRaises(signaling.TimeoutError,
+                                  nagios.publishPassiveResultNSCA, self.bin,
+                                  self.dir, 'nsca.example.com', '5667', res)
+        finally:
+            signal.alarm(0)
+            signal.signal(signal.SIGALRM, handler)
+        self.failUnlessEqual(len(self.invocations()), 1)
+
+class TestPassiveResultPublisher(TestPublishNSCA):
+    def publisher(self, **kwargs):
+        conf = {'method'    : 'nsca',
+                'nsca_host' : 'nsca.example.com',
+                'nsca_port' : '5667',
+                'nsca_bin'  : self.bin,
+                'nsca_conf' : self.dir}
+        return nagios.PassiveResultPublisher(conf, **kwargs)
+
+    def test1Size(self):
+        'Results are flushed when enough of them are queued.'
+        p = self.publisher(max_results=5, max_age=100)
+        for i in range(4):
+            p.publish(results(3))
+        self.failUnlessEqual([len(x) for x in self.invocations()], [6, 6])
+        self.failUnlessEqual(p.pending(), 0)
+        p.publish(results(1))
+        self.failUnlessEqual(p.pending(), 1)
+        p.flush()
+        self.failUnlessEqual(len(self.invocations()), 3)
+        p.flush()
+        self.failUnlessEqual(len(self.invocations()), 3)
+
+    def test2Age(self):
+        'Results are flushed when queued for too long.'
+        p = self.publisher(max_results=100, max_age=0.2)
+        p.publish(results(1))
+        self.failUnlessEqual(p.pending(), 1)
+        time.sleep(0.3)
+        p.publish(results(1))
+        self.failUnlessEqual(p.pending(), 0)
+        self.failUnlessEqual([len(x) for x in self.invocations()], [2])
+
+    def test3Config(self):
+        'Configuration is read once.'
+        fn = os.path.join(self.dir, 'nagios-submit.conf')
+        open(fn, 'w').write('SUBMIT_METHOD=nsca\nNSCA_HOST=nsca.example.com\n'
+                            'NSCA_BIN=%s\nNSCA_CONFIG=%s\nNSCA_BATCH=2\n' % \
+                                (self.bin, self.dir))
+        conf = nagios.readPassiveResultConfig(fn)
+        self.failUnlessEqual(conf['nsca_batch'], 2)
+        self.failUnlessEqual(conf['nsca_port'], nagios.NSCA_PORT)
+        os.unlink(fn)
+        p = nagios.PassiveResultPublisher(conf)
+        p.publish(results(3))
+        p.flush()
+        self.failUnlessEqual(len(self.invocations()), 2)
+
+    def test4Requeued(self):
+        'Results not sent are put back in the queue.'
+        p = self.publisher(max_results=100, max_age=100)
+        p.publish(results(5, bad=(1, 3)))
+        self.failUnlessRaises(nagios.ErrNagiosLib, p.flush)
+        # all results of the failed batch
+        self.failUnlessEqual(p.pending(), 5)
+        p.publish(results(1))
+        os.unlink(self.bin)
+        self.failUnlessRaises(nagios.ErrNagiosLib, p.flush)
+        self.failUnlessEqual(p.pending(), 6)
+        open(self.bin, 'w').write(SEND_NSCA.replace('bad', 'nothing'))
+        os.chmod(self.bin, 0755)
+        p.flush()
+        self.failUnlessEqual(p.pending(), 0)
+        sent = [[r.split(';')[0] for r in x] for x in self.invocations()]
+        self.failUnless(['host0', 'bad1', 'host2', 'bad3', 'host4', 'host0']
+                        in sent, sent)
+
+if __name__ == "__main__":
+    testcases = [TestPublishNSCA,
+                 TestPassiveResultPublisher]
+    for tc in testcases:
+        unittest.TextTestRunner(verbosity=2).\
+            run(unittest.TestLoader().loadTestsFromTestCase(tc))
@@ -36,7 +36,11 @@ import unittest
 sys.path.insert(1, re.sub('/\w*$','/',os.getcwd()))
 
 from gridmon.probe import MetricGatherer
-from gridmon.nagios.perfdata import PerfData
+from gridmon.nagios.perfdata import PerfData, PerfDataTable, parse, \
+    percentile
+
+def isnan(x):
+    return x != x
 
 class TestPerfDataClass(unittest.TestCase):
     def test1InvalidInput(self):
@@ -52,6 +56,91 @@ class TestPerfDataClass(unittest.TestCase):
         assert pd.get() == 'a=1;; b=0;; c=2;;'
         pd.update({'b':[1,2,3.2],'a':10,'c':'123'})
         assert pd.get() == 'a=10;; b=1;2;3.2 c=123;;'
+        pd.update({'b':1,'d':4})
+        assert pd.get() == 'a=0;; b=1;; c=0;;'
+
+    def test3Merge(self):
+        'PerfData class - incremental updates.'
+        pd = PerfData(['a','b','c'])
+        pd.merge({'a':1})
+        pd.merge({'c':(1,2),'d':4})
+        assert pd.get() == 'a=1;; b=0;; c=1;2'
+        pd.merge({'a':2})
+        assert pd.get() == 'a=2;; b=0;; c=1;2'
+        self.failUnlessRaises(TypeError, pd.merge, [])
+        self.failUnlessRaises(TypeError, pd.merge, {'b':1,'c':{}})
+        assert pd.get() == 'a=2;; b=0;; c=1;2'
+        pd.set('x=1;;')
+        assert pd.get() == 'x=1;;'
+        pd.merge({'b':3})
+        assert pd.get() == 'a=2;; b=3;; c=1;2'
+
+    def test4Instances(self):
+        'PerfData class - instances do not share data.'
+        pd1 = PerfData(['a','b'])
+        pd2 = PerfData(['a','b'])
+        pd1.update({'a':1})
+        pd2.merge({'b':2})
+        assert pd1.get() == 'a=1;; b=0;;'
+        assert pd2.get() == 'a=0;; b=2;;'
+        pd3 = PerfData(['a','b'])
+        assert pd3.get() == 'a=0;; b=0;;'
+
+class TestPerfDataParse(unittest.TestCase):
+    def test1Parse(self):
+        'Parse performance data strings.'
+        assert parse('') == []
+        res = parse('a=1')
+        assert len(res) == 1 and res[0][:3] == ('a', '', 1.0)
+        assert [isnan(x) for x in res[0][3:]] == [True] * 4
+        res = parse("time=0.5s;1;2;0; 'my ''big'' size'=10KB;;;0;100 c=5")
+        assert [x[:2] for x in res] == [('time', 's'), ("my 'big' size", 'B'),
+                                        ('c', '')]
+        assert res[0][2:6] == (0.5, 1.0, 2.0, 0.0)
+        assert isnan(res[0][6])
+        assert res[1][2] == 10240.0 and res[1][5:] == (0, 102400.0)
+        assert isnan(res[1][3]) and isnan(res[1][4])
+        assert res[2][2] == 5.0
+
+    def test2ParseUnusual(self):
+        'Parse unknown values, ranges, percents and junk.'
+        res = parse('load=U;10:20;@5 junk x=12ms;;; pct=99.5%;-1e2')
+        assert [x[0] for x in res] == ['load', 'x', 'pct']
+        assert [isnan(x) for x in res[0][2:]] == [True] * 5
+        assert abs(res[1][2] - 0.012) < 1e-12 and res[1][1] == 's'
+        assert res[2][1:4] == ('%', 99.5, -100.0)
+
+    def test3Percentile(self):
+        'Percentiles.'
+        assert percentile([5], 90) == 5
+        values = [1., 2., 3., 4.]
+        assert percentile(values, 0) == 1
+        assert percentile(values, 50) == 2.5
+        assert percentile(values, 100) == 4
+        self.failUnlessRaises(ValueError, percentile, [], 50)
+        self.failUnlessRaises(ValueError, percentile, values, 101)
+
+    def test4Table(self):
+        'PerfDataTable - columns and aggregates.'
+        t = PerfDataTable()
+        t.add_many([('h%i' % i, 't=%ims;100;200 n=%i' % (i, i))
+                    for i in range(1, 11)])
+        t.add('n=U x=1', 'h11')
+        assert t.labels() == ['t', 'n', 'x']
+        assert t.uom('t') == 's'
+        assert t.sources('t') == ['h%i' % i for i in range(1, 11)]
+        assert t.column('t', 'warn').tolist() == [0.1] * 10
+        assert len(t.column('n')) == 11
+        agg = t.aggregate('n')
+        assert agg['count'] == 10
+        assert (agg['min'], agg['max'], agg['mean']) == (1, 10, 5.5)
+        assert agg['p50'] == 5.5 and abs(agg['p90'] - 9.1) < 1e-9
+        assert t.aggregate('t', 'min') == {'count' : 0}
+        summary = t.summary(percentiles=(99,))
+        assert summary['x'] == {'count':1, 'min':1, 'max':1, 'mean':1,
+                                'p99':1}
+        self.failUnlessRaises(KeyError, t.column, 'y')
+        self.failUnlessRaises(ValueError, t.column, 't', 'foo')
 
 class TestPerfDataField(unittest.TestCase):
     def test1ValidInput(self):
@@ -111,6 +200,7 @@ class TestPerfDataField(unittest.TestCase):
 
 if __name__ == "__main__":
     testcases = [TestPerfDataClass,
+                 TestPerfDataParse,
                  TestPerfDataField]
     for tc in testcases:
         unittest.TextTestRunner(verbosity=2).\
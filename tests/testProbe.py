@@ -1,5 +1,11 @@
+import os
+import time
+import shutil
+import pstats
+import tempfile
 import unittest
 from gridmon.probe import *
+from gridmon.process import signaling
 
 class SimpleMockGatherer(MetricGatherer):
     def __init__(self):
@@ -10,6 +16,25 @@ class SimpleMockGatherer(MetricGatherer):
     def metricFoo(self):
         return (0, 'hello!')
 
+class PerfMockGatherer(SimpleMockGatherer):
+    perf = [('x', 1)]
+    def metricFoo(self):
+        if self.perf:
+            self.perf_data = self.perf
+        return (0, 'hello!')
+
+class ProfiledMockGatherer(MetricGatherer):
+    set_details_header = False
+    def __init__(self, tuples):
+        MetricGatherer.__init__(self, tuples, 'Bar')
+        self.description = {'Foo' : {}}
+        self.methodMap = {'Foo' : 'metricFoo'}
+
+    def metricFoo(self):
+        time.sleep(0.2)
+        self.printd('slept')
+        return (0, 'hello!')
+
 class ComplexMockGatherer(MetricGatherer):
     def __init__(self):
         MetricGatherer.__init__(self, {'serviceURI':''}, 'Bar')
@@ -19,6 +44,63 @@ class ComplexMockGatherer(MetricGatherer):
     def gatherFoo(self):
         return (0, 'hello!')
 
+class WrapperMockGatherer(MetricGatherer):
+    def __init__(self, failing=(), parallel=0):
+        MetricGatherer.__init__(self, {'serviceURI':'foo.example.com'}, 'Wrap')
+        self.metrics = {}
+        self.description = {}
+        self.methodMap = {}
+        self.set_metrics({
+            'All' : {'metricsOrder' : ['A', 'B', 'C', 'D']},
+            'A'   : {'metricChildren' : ['C']},
+            'B'   : {'metricChildren' : [], 'critical' : 'Y'},
+            'C'   : {'metricChildren' : ['D']},
+            'D'   : {'metricChildren' : []}})
+        self.parallel_metrics = parallel
+        self.failing = failing
+        self.published = []
+
+    def _submit_service_checks(self, chres):
+        self.published.extend(chres)
+
+    def __run(self, m):
+        self.printd('running %s' % m)
+        time.sleep(0.3)
+        if m in self.failing:
+            return (2, 'failed %s' % m)
+        return (0, 'done %s' % m)
+    def metricA(self):
+        return self.__run('A')
+    def metricB(self):
+        return self.__run('B')
+    def metricC(self):
+        return self.__run('C')
+    def metricD(self):
+        return self.__run('D')
+
+class BatchMockGatherer(MetricGatherer):
+    headers = []
+    published = []
+    def __init__(self, tuples):
+        MetricGatherer.__init__(self, tuples, 'Batch')
+        self.metrics = {}
+        self.description = {}
+        self.methodMap = {}
+        self.set_metrics({'Hello' : {}})
+
+    def _set_details_header(self):
+        self.headers.append(self.hostName)
+        self.details_header = 'DN: /CN=foo'
+
+    def _submit_service_checks(self, chres):
+        self.published.extend(chres)
+
+    def metricHello(self):
+        time.sleep(0.3)
+        if self.hostName.startswith('bad'):
+            return (2, 'failed %s' % self.hostName)
+        return (0, 'hello %s' % self.hostName)
+
 class MockStdout:
     def __init__(self, expectedLines):
         self.lines = []
@@ -133,5 +215,302 @@ class testMetricGatherer(unittest.TestCase):
         #assert 'org.wlcg.Foo' == results['metricName']
         #assert 'Bar' == results['serviceType']
 
+class testMetricAllParallel(unittest.TestCase):
+    def published(self, mg):
+        res = {}
+        for r in mg.published:
+            res[r['service']] = (str(r['status']), r['summary'])
+        return res
+
+    def testAllOK(self):
+        mg = WrapperMockGatherer(parallel=4)
+        t = time.time()
+        status, summary, details = mg.metricAll()
+        # A and B run concurrently; C after A; D after C
+        assert time.time() - t < 1.1
+        assert status == 'OK'
+        res = self.published(mg)
+        assert 4 == len(res)
+        for m in ['A', 'B', 'C', 'D']:
+            assert res['.Wrap-%s-ops' % m] == ('0', 'OK: done %s' % m)
+        assert 4 == details.count('Invoking metric')
+
+    def testNodeFailureMasksDescendants(self):
+        mg = WrapperMockGatherer(failing=('A',), parallel=4)
+        status, summary, details = mg.metricAll()
+        assert status == 'CRITICAL'
+        assert summary == 'METRIC FAILED [.Wrap-A]: CRITICAL: failed A'
+        res = self.published(mg)
+        assert res['.Wrap-A-ops'][0] == '2'
+        assert res['.Wrap-B-ops'] == ('0', 'OK: done B')
+        for m in ['C', 'D']:
+            assert res['.Wrap-%s-ops' % m][0] == '1'
+            assert res['.Wrap-%s-ops' % m][1].startswith('WARNING: Masked by .Wrap-A')
+        assert 2 == details.count('Invoking metric')
+
+    def testCriticalLeafFailure(self):
+        mg = WrapperMockGatherer(failing=('B',), parallel=2)
+        status, summary, details = mg.metricAll()
+        assert status == 'CRITICAL'
+        assert summary == 'METRIC FAILED [.Wrap-B]: CRITICAL: failed B'
+        assert 4 == len(self.published(mg))
+
+    def testSequentialAsBefore(self):
+        mg = WrapperMockGatherer(failing=('A',))
+        status, summary, details = mg.metricAll()
+        assert status == 'CRITICAL'
+        res = self.published(mg)
+        assert 2 == len(res)
+        assert res['.Wrap-C-ops'][0] == '1'
+
+    def testPublishTimedOut(self):
+        "Results are flushed while the publishing timeout is armed."
+        class TimedOutPublishing(WrapperMockGatherer):
+            def _flush_service_checks(self):
+                raise signaling.TimeoutError('publishing')
+        for failing in ((), ('A',)):
+            for parallel in (0, 4):
+                mg = TimedOutPublishing(failing=failing, parallel=parallel)
+                status, summary, details = mg.metricAll()
+                assert status == 'UNKNOWN', status
+                assert summary == 'Timed out while publishing metric ' \
+                                  'results. publishing', (failing, summary)
+                assert '* Last metric: .Wrap-' in details, details
+
+    def testOutputSoFar(self):
+        "Output of a timed out command is not attributed in parallel mode."
+        class Running:
+            output = 'partial output'
+        signaling.proc[-1] = Running()
+        try:
+            assert WrapperMockGatherer()._output_so_far() == 'partial output'
+            assert WrapperMockGatherer(parallel=4)._output_so_far() == ''
+        finally:
+            del signaling.proc[-1]
+
+class testRunBatch(unittest.TestCase):
+    def setUp(self):
+        BatchMockGatherer.headers[:] = []
+        BatchMockGatherer.published[:] = []
+
+    def testReadHosts(self):
+        fn = tempfile.mktemp()
+        open(fn, 'w').write('# hosts\nfoo.example.com\n\n'
+                            'https://bar.example.com:8443/ bar\n')
+        try:
+            hosts = Runner(BatchMockGatherer)._read_hosts(fn)
+        finally:
+            os.unlink(fn)
+        assert hosts == [('foo.example.com', None),
+                         ('https://bar.example.com:8443/', 'bar')]
+
+    def testBatch(self):
+        out = MockStdout([])
+        r = Runner(BatchMockGatherer, ProbeFormatRenderer(stream=out))
+        hosts = [('h%i.example.com' % i, None) for i in range(5)]
+        hosts.append(('bad.example.com', 'nagios-bad'))
+        tuples = {'metricOptions' : '', 'timeout' : 60, 'verbosity' : 0}
+        t = time.time()
+        rc = r.run_batch(tuples, 'Hello', hosts, 6)
+        assert time.time() - t < 1.5
+        assert rc == 2
+        # details header is built once per batch
+        assert BatchMockGatherer.headers == ['h0.example.com']
+        res = {}
+        for p in BatchMockGatherer.published:
+            assert p['service'] == '.Batch-Hello-ops'
+            res[p['host']] = (str(p['status']), p['summary'])
+        assert 6 == len(res)
+        assert res['h3.example.com'] == ('0', 'OK: hello h3.example.com')
+        assert res['nagios-bad'] == ('2', 'CRITICAL: failed bad.example.com')
+        assert out.lines[0].startswith('CRITICAL: .Batch-Hello run against 6 hosts. OK: 5,')
+
+    def testBatchJSONLines(self):
+        out = MockStdout([])
+        r = Runner(BatchMockGatherer, ProbeFormatRenderer(stream=out))
+        hosts = [('h%i.example.com' % i, None) for i in range(3)]
+        hosts.append(('bad.example.com', 'nagios-bad'))
+        tuples = {'metricOptions' : '', 'timeout' : 60, 'verbosity' : 0,
+                  'outputFormat' : 'jsonl'}
+        rc = r.run_batch(tuples, 'Hello', hosts, 4)
+        assert rc == 2
+        # written at once
+        assert 1 == len(out.lines)
+        lines = out.lines[0].splitlines()
+        assert 5 == len(lines), lines
+        assert lines[0].startswith('{"detailsData": ')
+        assert '"hostName": "h0.example.com", "metricStatus": "OK", ' \
+               '"summaryData": "OK: hello h0.example.com"}' in lines[0]
+        assert '"hostName": "nagios-bad", "metricStatus": "CRITICAL"' in \
+               lines[3]
+        assert lines[4].startswith('{"metricStatus": "CRITICAL", '
+                                   '"summaryData": "CRITICAL: .Batch-Hello '
+                                   'run against 4 hosts.')
+
+class testPerfTiming(unittest.TestCase):
+    def testSingleMetric(self):
+        "Times of a metric are appended to its performance data."
+        mg = PerfMockGatherer()
+        mg.perf_timing = True
+        res = mg.gather('Foo')
+        assert res['metricStatus'] == 'OK'
+        pd = res['perfData'].split()
+        assert pd[0] == 'x=1;;', pd
+        assert [x.split('=')[0] for x in pd[1:]] == \
+                    ['time_wall', 'time_cpu', 'time_children'], pd
+        # not carried over to the next run
+        mg.perf = None
+        res = mg.gather('Foo')
+        assert res['perfData'].startswith('time_wall='), res['perfData']
+
+    def testWrapper(self):
+        "Wrapper metric gets times of the metrics it runs."
+        for parallel in (0, 4):
+            mg = WrapperMockGatherer(failing=('A',), parallel=parallel)
+            mg.perf_timing = True
+            res = mg.gather(mg.metrSuff2metrName('All'))
+            pd = res['perfData'].split()
+            labels = [x.split('=')[0] for x in pd]
+            assert labels == ['%s_%s' % (m, t) for m in 'ABCD'
+                              for t in ('wall', 'cpu', 'children')] + \
+                ['time_wall', 'time_cpu', 'time_children'], labels
+            values = dict([x.split('=') for x in pd])
+            assert 0.25 < float(values['A_wall'].split('s')[0]) < 1
+            # C and D were masked by A
+            assert values['C_wall'] == values['D_wall'] == '0.000s;;'
+            assert float(values['time_wall'].split('s')[0]) >= 0.3
+            for r in mg.published:
+                if r['service'] == '.Wrap-A-ops':
+                    assert r['perfData'].startswith('time_wall='), r
+                    # not sanitised away
+                    out = mg._encode_output(r)
+                    assert 'running A|time_wall=' in out, out
+
+    def testPublished(self):
+        "Performance data is published after '|', not sanitised to 'OR'."
+        class PublishingGatherer(WrapperMockGatherer):
+            set_details_header = False
+            _submit_service_checks = MetricGatherer._submit_service_checks
+        fd, fn = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            mg = PublishingGatherer()
+            mg.perf_timing = True
+            mg.passcheckdest = 'nagcmd'
+            mg.nagcmdfile = fn
+            mg.gather(mg.metrSuff2metrName('All'))
+            lines = open(fn).read().splitlines()
+            assert len(lines) == 4, lines
+            for l, m in zip(lines, 'ABCD'):
+                pref = 'PROCESS_SERVICE_CHECK_RESULT;foo.example.com;' \
+                       '.Wrap-%s-ops;0;OK: done %s\\n' % (m, m)
+                assert l.split('] ', 1)[1].startswith(pref), l
+                assert '\\nrunning %s|time_wall=' % m in l, l
+                assert l.count('|') == 1 and not 'OR' in l, l
+        finally:
+            os.unlink(fn)
+
+class testOutputBudget(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def testTruncated(self):
+        "Passive check output truncated; complete output in the work dir."
+        mg = SimpleMockGatherer()
+        mg.workdir_metric = self.dir
+        mg.output_budget = 200
+        r = {'host' : 'h', 'service' : 'org.sam.Foo-ops', 'status' : 2,
+             'summary' : 'CRITICAL: failed|x', 'details' : 'line|\n' * 1000,
+             'perfData' : 'p=1;;'}
+        out = mg._encode_output(r)
+        path = os.path.join(self.dir, 'org.sam.Foo-ops.output')
+        assert len(out) <= 200, len(out)
+        assert out.startswith('CRITICAL: failedORx\\nlineOR\\n'), out
+        assert out.endswith('; complete output in %s]|p=1;;' % path), out
+        assert open(path).read() == 'CRITICAL: failed|x\n%s\n|p=1;;\n' % \
+                                    r['details']
+
+    def testNotTruncated(self):
+        "Passive check output within budget; no file written."
+        mg = SimpleMockGatherer()
+        mg.workdir_metric = self.dir
+        mg.output_budget = 200
+        out = mg._encode_output({'service' : 'svc', 'summary' : 'OK: ok',
+                                 'details' : 'a\nb'})
+        assert out == 'OK: ok\\na\\nb', out
+        assert os.listdir(self.dir) == []
+        mg.output_budget = None
+        mg.sanitize = False
+        out = mg._encode_output({'service' : 'svc', 'summary' : 'OK: a|b',
+                                 'details' : 'x' * 10000})
+        assert out == 'OK: a|b\\n' + 'x' * 10000
+
+class testCmdOutputCapture(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def testUnique(self):
+        "Complete output of each command run goes to its own file."
+        mg = SimpleMockGatherer()
+        mg.execMetric = 'Foo'
+        mg.workdir_metric = self.dir
+        mg.cmd_output_head = mg.cmd_output_tail = 10
+        for i in range(2):
+            mg.run_cmd('printf "%%01000i" %i' % i)
+        files = [(int(f.split('.')[3]), f) for f in os.listdir(self.dir)]
+        files.sort()
+        files = [f for n, f in files]
+        assert len(files) == 2, files
+        for i in range(2):
+            assert files[i].startswith('Foo.printf.%i.' % os.getpid()), files
+            assert open(os.path.join(self.dir, files[i])).read() == \
+                                                        '%01000i' % i
+
+class testProfile(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.environ = os.environ.copy()
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.environ)
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def testProfile(self):
+        "--profile writes pstats file and summary at verbosity 3."
+        out = MockStdout([])
+        r = Runner(ProfiledMockGatherer, ProbeFormatRenderer(stream=out))
+        pdir = os.path.join(self.dir, 'prof')
+        rc = r.run(['probe', '-H', 'foo.example.com', '-m', 'Foo',
+                    '--profile', pdir, '-v', '3'])
+        assert rc == 0
+        files = os.listdir(pdir)
+        assert len(files) == 1, files
+        assert files[0].startswith('foo.example.com.Foo.'), files
+        assert files[0].endswith('.pstats'), files
+        stats = pstats.Stats(os.path.join(pdir, files[0]))
+        assert stats.total_tt >= 0.2, stats.total_tt
+        lines = ''.join(out.lines).splitlines()
+        assert lines[0] == 'OK: hello!', lines
+        summary = lines[-1]
+        assert summary.startswith('Profile %s: ' % os.path.join(pdir, files[0])), summary
+        assert 'sleep' in summary.split('Top: ')[1], summary
+
+    def testNoSummary(self):
+        "No profile summary below verbosity 3."
+        out = MockStdout([])
+        r = Runner(ProfiledMockGatherer, ProbeFormatRenderer(stream=out))
+        rc = r.run(['probe', '-H', 'foo.example.com', '-m', 'Foo',
+                    '--profile', self.dir])
+        assert rc == 0
+        assert len(os.listdir(self.dir)) == 1
+        assert not [l for l in out.lines if 'Profile' in l], out.lines
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# NAME:        testProbeDaemon.py
+#
+# FACILITY:    SAM (Service Availability Monitoring)
+#
+# DESCRIPTION:
+#
+#         Tests for gridmon.probedaemon module.
+#
+# AUTHORS:     SAM team, CERN
+#
+# CREATED:     Oct 16, 2026
+#
+# NOTES:
+#
+# MODIFIED:
+#
+##############################################################################
+
+"""
+tests for gridmon.probedaemon module.
+
+Tests for gridmon.probedaemon module.
+
+SAM (Service Availability Monitoring)
+"""
+
+import os
+import re
+import sys
+import time
+import signal
+import socket
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(1, re.sub('/\w*$','/',os.getcwd()))
+
+from gridmon import probe
+from gridmon import probedaemon
+
+class MockGatherer(probe.MetricGatherer):
+    set_details_header = False
+    def __init__(self, tuples):
+        probe.MetricGatherer.__init__(self, tuples, 'Foo')
+        self.set_metrics({'Hello' : {'metricDescription' : 'hello'}})
+
+    def metricHello(self):
+        self.printd('FOO=%s' % os.environ.get('FOO'))
+        return (1, 'hello from %i' % os.getpid())
+
+class TestProbeDaemon(unittest.TestCase):
+    def setUp(self):
+        self.sock = tempfile.mktemp(suffix='.sock')
+        self.pid = os.fork()
+        if self.pid == 0:
+            runner = probe.Runner(MockGatherer,
+                                  probe.ProbeFormatRenderer(sys.stdout))
+            os._exit(runner.serve(self.sock, 2))
+        for i in range(50):
+            if os.path.exists(self.sock):
+                break
+            time.sleep(0.1)
+
+    def tearDown(self):
+        os.kill(self.pid, signal.SIGTERM)
+        os.waitpid(self.pid, 0)
+        self.failIf(os.path.exists(self.sock), 'Socket was not removed.')
+
+    def test1Check(self):
+        'Run a check through the daemon.'
+        env = {'FOO' : 'bar'}
+        pids = {}
+        for i in range(3):
+            rc, out = probedaemon.request(self.sock,
+                                          ['-H', 'foo.example.com',
+                                           '-m', '.Foo-Hello'], env=env)
+            self.failUnlessEqual(rc, 1)
+            lines = out.split('\n')
+            self.failUnless(lines[0].startswith('WARNING: hello from '), out)
+            self.failUnless('FOO=bar' in lines, out)
+            pids[lines[0]] = 1
+        # every check is run in its own child
+        self.failUnlessEqual(len(pids), 3)
+
+    def test2Usage(self):
+        'Usage error is reported as by the probe.'
+        rc, out = probedaemon.request(self.sock, ['-v', 'foo'])
+        self.failUnlessEqual(rc, 1)
+        self.failUnless(out.startswith('Usage:'), out)
+
+    def test3NoDaemon(self):
+        'Client error on missing daemon.'
+        self.failUnlessRaises(probedaemon.ErrProbeDaemon,
+                              probedaemon.request, self.sock + '.none', [])
+
+def client(argv):
+    "Run client_main() in a child; return (exit code, output)."
+    r, w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(r)
+        os.dup2(w, 1)
+        sys.stdout = os.fdopen(1, 'w', 0)
+        os._exit(probedaemon.client_main(['client'] + argv))
+    os.close(w)
+    f = os.fdopen(r)
+    out = f.read()
+    f.close()
+    return os.WEXITSTATUS(os.waitpid(pid, 0)[1]), out
+
+class TestClient(unittest.TestCase):
+    def setUp(self):
+        self.sock = tempfile.mktemp(suffix='.sock')
+
+    def tearDown(self):
+        if os.path.exists(self.sock):
+            os.unlink(self.sock)
+
+    def serve(self, reply):
+        "Fake daemon answering one request with C{reply}."
+        srv = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        srv.bind(self.sock)
+        srv.listen(1)
+        def answer():
+            conn = srv.accept()[0]
+            while conn.recv(65536):
+                pass
+            conn.sendall(reply)
+            conn.close()
+            srv.close()
+        t = threading.Thread(target=answer)
+        t.setDaemon(True)
+        t.start()
+        return t
+
+    def test1Fallback(self):
+        'Probe is run directly if the daemon is not there.'
+        rc, out = client(['-f', '/bin/echo', self.sock, '-H', 'foo'])
+        self.failUnlessEqual((rc, out), (0, '-H foo\n'))
+        rc, out = client([self.sock, '-H', 'foo'])
+        self.failUnlessEqual(rc, 3)
+        self.failUnless(out.startswith('UNKNOWN: Failed connecting'), out)
+
+    def test2NoFallbackOnReplyError(self):
+        'Errors after the request was sent are UNKNOWN, even with -f.'
+        t = self.serve('garbage')
+        rc, out = client(['-f', '/bin/echo', self.sock, '-H', 'foo'])
+        t.join()
+        self.failUnlessEqual(rc, 3)
+        self.failUnless(out.startswith('UNKNOWN: Malformed'), out)
+
+if __name__ == "__main__":
+    testcases = [TestProbeDaemon,
+                 TestClient]
+    for tc in testcases:
+        unittest.TextTestRunner(verbosity=2).\
+            run(unittest.TestLoader().loadTestsFromTestCase(tc))
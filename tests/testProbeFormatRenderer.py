@@ -47,8 +47,10 @@ from gridmon import utils as samutils
 class TestProbeFormatRenderer(unittest.TestCase):
     class Writer:
         buf = ''
+        writes = 0
         def write(self, str):
             self.buf += str
+            self.writes += 1
         def print_(self):
             return self.buf
     summary = 'OK: | ||'
@@ -132,6 +134,60 @@ class TestProbeFormatRenderer(unittest.TestCase):
         'Mandatory keys missing.'
         self.failUnlessEqual(ProbeFormatRenderer(stream=self.wr).render({'a':1}),
                              3, 'Should have exited with 3 on missing mandatory keys.')
+    def test9SingleWrite(self):
+        'Output written at once; sys.stdout and data not touched.'
+        saveout = sys.stdout
+        self.tuples.update({'perfData' : 'a=1;2;3',
+                            'summaryData' : self.summary + '\n',
+                            'metricStatus' : 'CRITICAL'})
+        data = self.tuples.copy()
+        rc = ProbeFormatRenderer(stream=self.wr).render(self.tuples)
+        assert sys.stdout is saveout
+        assert self.tuples == data
+        self.failUnlessEqual(rc, 2)
+        self.failUnlessEqual(self.wr.writes, 1)
+        self.failUnlessEqual(self.wr.print_(), 'OK: OR OR\nOK: OR OR|a=1;2;3\n')
+    def test10JSONLines(self):
+        'JSON lines output.'
+        self.tuples.update({'perfData' : 'a=1;2;3',
+                            'detailsData' : 'line1\n"quoted"\t\\\n',
+                            'metricStatus' : 1})
+        r = ProbeFormatRenderer(stream=self.wr, output_format='jsonl')
+        self.failUnlessEqual(r.render(self.tuples), 1)
+        expected = '{"detailsData": "line1\\n\\"quoted\\"\\t\\\\", ' \
+                   '"metricStatus": "WARNING", "perfData": "a=1;2;3", ' \
+                   '"summaryData": "OK: | ||"}\n'
+        self.failUnlessEqual(self.wr.print_(), expected)
+        self.wr = self.Writer()
+        r = ProbeFormatRenderer(stream=self.wr)
+        self.failUnlessEqual(r.render({}, output_format='jsonl'), 3)
+        self.failUnlessEqual(self.wr.print_(),
+                             '{"metricStatus": "UNKNOWN", "summaryData": '
+                             '"UNKNOWN: No results given to render."}\n')
+        self.failUnlessRaises(ValueError, ProbeFormatRenderer,
+                              output_format='xml')
+        self.failUnlessRaises(ValueError, r.render, self.tuples,
+                              output_format='xml')
+    def test11RenderMany(self):
+        'Render a number of results at once.'
+        results = [{'summaryData' : 'OK: a|b', 'metricStatus' : 0},
+                   {'summaryData' : 'CRITICAL: c', 'metricStatus' : 2,
+                    'perfData' : 'x=1'},
+                   {'summaryData' : 'd'}]
+        r = ProbeFormatRenderer(stream=self.wr)
+        self.failUnlessEqual(r.render_many(results), [0, 2, 3])
+        self.failUnlessEqual(self.wr.writes, 1)
+        self.failUnlessEqual(self.wr.print_(),
+                             'OK: aORb\nCRITICAL: c|x=1\n'
+                             'UNKNOWN: metricStatus not given to renderer.\n')
+        self.wr = self.Writer()
+        r = ProbeFormatRenderer(stream=self.wr)
+        self.failUnlessEqual(r.render_many(results, output_format='jsonl'),
+                             [0, 2, 3])
+        lines = self.wr.print_().splitlines()
+        self.failUnlessEqual(len(lines), 3)
+        self.failUnlessEqual(lines[0],
+                       '{"metricStatus": "OK", "summaryData": "OK: a|b"}')
 
 if __name__ == "__main__":
     testcases = [TestProbeFormatRenderer]
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# NAME:        testProcessEngine.py
+#
+# FACILITY:    SAM (Service Availability Monitoring)
+#
+# DESCRIPTION:
+#
+#         Tests for gridmon.process.engine module.
+#
+# AUTHORS:     SAM team, CERN
+#
+# CREATED:     Oct 16, 2026
+#
+# NOTES:
+#
+# MODIFIED:
+#
+##############################################################################
+
+"""
+tests for gridmon.process.engine module.
+
+Tests for gridmon.process.engine module.
+
+SAM (Service Availability Monitoring)
+"""
+
+import os
+import re
+import sys
+import time
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(1, re.sub('/\w*$','/',os.getcwd()))
+
+from gridmon.process import engine
+from gridmon.process import pexpectpgrp
+from gridmon.process import signaling
+
+class TestProcessEngine(unittest.TestCase):
+    def test1Concurrent(self):
+        'Children run concurrently.'
+        t = time.time()
+        res = engine.run_cmds(['sleep 0.5; echo %i' % i for i in range(4)])
+        self.failUnless(time.time() - t < 1.5)
+        for i in range(4):
+            self.failUnlessEqual(res[i][0], 0)
+            self.failUnlessEqual(res[i][1].strip(), str(i))
+        self.failUnlessEqual(signaling.proc, {})
+
+    def test2ExitCodes(self):
+        'Exit codes and commands that cannot be executed.'
+        res = engine.run_cmds(['exit 3', 'kill -9 $$', ['/no/such/cmd']],
+                              use_pty=False)
+        self.failUnlessEqual(res[0][0], 3)
+        self.failUnlessEqual(res[1][0], 128 + 9)
+        self.failUnlessEqual(res[2][0], 127)
+        self.failUnless('/no/such/cmd' in res[2][1])
+
+    def test3Lines(self):
+        'Output is split into lines incrementally.'
+        lines = []
+        def on_line(child, line):
+            lines.append(line)
+        e = engine.ProcessEngine()
+        c = e.spawn("printf 'a\\nb'; sleep 0.2; printf 'c\\nd'", use_pty=False,
+                    on_line=on_line)
+        e.run()
+        self.failUnlessEqual(lines, ['a\n', 'bc\n', 'd'])
+        self.failUnlessEqual(c.nlines, 3)
+        self.failUnlessEqual(c.output, 'a\nbc\nd')
+
+    def test4LargeOutput(self):
+        'Large output is collected completely.'
+        rc, out = engine.run_cmds(['head -c 3000000 /dev/zero'],
+                                  use_pty=False)[0]
+        self.failUnlessEqual(rc, 0)
+        self.failUnlessEqual(len(out), 3000000)
+
+    def test5Deadlines(self):
+        'Idle and total deadlines kill whole process group.'
+        e = engine.ProcessEngine()
+        idle = e.spawn('echo start; sleep 30', idle_timeout=0.5)
+        total = e.spawn('(sleep 30) & while true; do echo x; sleep 0.1; done',
+                        timeout=0.7, use_pty=False)
+        t = time.time()
+        e.run()
+        self.failUnless(time.time() - t < 5)
+        self.failUnlessEqual(idle.timed_out, 'idle')
+        self.failUnless('while waiting for output' in idle.output)
+        self.failUnlessEqual(total.timed_out, 'total')
+        self.failUnlessEqual(total.returncode, 128 + 15)
+        # group is gone
+        for i in range(20):
+            try:
+                os.kill(-total.pid, 0)
+            except OSError:
+                break
+            time.sleep(0.1)
+        self.failUnlessRaises(OSError, os.kill, -total.pid, 0)
+
+    def test6SpawnCmd(self):
+        'spawn_cmd() on top of the engine.'
+        rc, out = pexpectpgrp.spawn_cmd('sh -c "echo out; echo err >&2; exit 2"')
+        self.failUnlessEqual(rc, 2)
+        self.failUnlessEqual(out.replace('\r', '').split('\n')[:2],
+                             ['out', 'err'])
+
+    def test7ReapedElsewhere(self):
+        'Exit status collected by someone else is not taken for success.'
+        e = engine.ProcessEngine()
+        c = e.spawn('exit 0', use_pty=False)
+        os.waitpid(c.pid, 0)
+        e.run()
+        self.failUnlessEqual(c.returncode, engine.UNKNOWN_EXIT_CODE)
+        self.failUnless('Exit status of child %i is unknown' % c.pid
+                        in c.output, c.output)
+
+class TestOutputCapture(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test1Small(self):
+        'Output within the limits is kept as is.'
+        c = engine.OutputCapture(10, 10)
+        for d in ['abc', 'defghij', 'klm']:
+            c.write(d)
+        self.failUnlessEqual(c.getvalue(), 'abcdefghijklm')
+        self.failUnlessEqual(c.elided(), 0)
+
+    def test2HeadTail(self):
+        'Middle of output is dropped and marked.'
+        path = os.path.join(self.dir, 'out')
+        c = engine.OutputCapture(4, 6, path)
+        for i in range(100):
+            c.write('%02i\n' % i)
+        c.close()
+        self.failUnlessEqual(c.size, 300)
+        self.failUnlessEqual(c.elided(), 290)
+        self.failUnlessEqual(c.getvalue(),
+            '00\n0\n[... 290 bytes of output skipped. '
+            'Complete output is in %s. ...]\n98\n99\n' % path)
+        self.failUnlessEqual(open(path).read(),
+                             ''.join(['%02i\n' % i for i in range(100)]))
+
+    def test3Child(self):
+        'Bounded capture of output of a child.'
+        path = os.path.join(self.dir, 'out')
+        c = engine.OutputCapture(1024, 1024, path)
+        rc, out = pexpectpgrp.spawn_cmd(
+                        "/bin/sh -c 'seq 1 200000; echo last line'",
+                        capture=c)
+        self.failUnlessEqual(rc, 0)
+        self.failUnless(out.startswith('1\r\n2\r\n'))
+        self.failUnless(out.endswith('200000\r\nlast line\r\n'))
+        self.failUnless('bytes of output skipped' in out)
+        self.failUnless(len(out) < 2200)
+        self.failUnlessEqual(os.path.getsize(path), c.size)
+
+if __name__ == "__main__":
+    testcases = [TestProcessEngine,
+                 TestOutputCapture]
+    for tc in testcases:
+        unittest.TextTestRunner(verbosity=2).\
+            run(unittest.TestLoader().loadTestsFromTestCase(tc))
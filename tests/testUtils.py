@@ -33,6 +33,11 @@ import os
 import sys
 import unittest
 import socket
+import time
+import shutil
+import tempfile
+import marshal
+import cPickle
 
 sys.path.insert(1, re.sub('/\w*$','/',os.getcwd()))
 
@@ -82,6 +87,142 @@ class TestUtilsDNS(unittest.TestCase):
         self.failUnlessRaises(ValueError,
                               samutils.dns_lookup_reverse, 'localhost')
 
+class TestUtilsDNSCache(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+        self.forward = socket.gethostbyname_ex
+        self.reverse = socket.gethostbyaddr
+        socket.gethostbyname_ex = self.fake_forward
+        socket.gethostbyaddr = self.fake_reverse
+        self.dir = tempfile.mkdtemp()
+        samutils.set_dns_cache(None)
+        samutils.clear_dns_cache()
+
+    def tearDown(self):
+        socket.gethostbyname_ex = self.forward
+        socket.gethostbyaddr = self.reverse
+        samutils.set_dns_cache(None)
+        samutils.clear_dns_cache()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def fake_forward(self, hostname):
+        self.calls.append(hostname)
+        if hostname.startswith('slow'):
+            time.sleep(0.5)
+        if hostname.startswith('bad'):
+            raise socket.gaierror(-2, 'Name or service not known')
+        return hostname, [], ['10.0.0.%i' % len(hostname)]
+
+    def fake_reverse(self, ip):
+        self.calls.append(ip)
+        return 'host.example.org', [], [ip]
+
+    def test1Cached(self):
+        "Successful and failed lookups are cached."
+        for i in range(3):
+            self.assertEqual(samutils.dns_lookup_forward('h.org'), ['10.0.0.5'])
+            self.assertEqual(samutils.dns_lookup_reverse('10.0.0.1'),
+                             'host.example.org')
+            self.assertRaises(IOError, samutils.dns_lookup_forward, 'bad.org')
+        self.assertEqual(self.calls, ['h.org', '10.0.0.1', 'bad.org'])
+        samutils.dns_lookup_forward('h.org').append('x')
+        self.assertEqual(samutils.dns_lookup_forward('h.org'), ['10.0.0.5'])
+        samutils.clear_dns_cache()
+        samutils.dns_lookup_forward('h.org')
+        self.assertEqual(self.calls[-1], 'h.org')
+        self.assertEqual(len(self.calls), 4)
+
+    def test2NoCaching(self):
+        "Caching is disabled with zero TTLs."
+        samutils.set_dns_cache(None, 0, 0)
+        for i in range(2):
+            samutils.dns_lookup_forward('h.org')
+            self.assertRaises(IOError, samutils.dns_lookup_forward, 'bad.org')
+        self.assertEqual(len(self.calls), 4)
+
+    def test3Persisted(self):
+        "Cache persisted in a file is loaded by another process."
+        path = os.path.join(self.dir, 'dns')
+        samutils.set_dns_cache(path)
+        samutils.dns_lookup_forward('h.org')
+        self.assertRaises(IOError, samutils.dns_lookup_forward, 'bad.org')
+        # written at exit
+        samutils.save_dns_cache()
+        samutils.clear_dns_cache()
+        samutils.set_dns_cache(path)
+        self.assertEqual(samutils.dns_lookup_forward('h.org'), ['10.0.0.5'])
+        self.assertRaises(IOError, samutils.dns_lookup_forward, 'bad.org')
+        self.assertEqual(len(self.calls), 2)
+        open(path, 'w').write('garbage')
+        samutils.clear_dns_cache()
+        samutils.set_dns_cache(path)
+        samutils.dns_lookup_forward('h.org')
+        self.assertEqual(len(self.calls), 3)
+
+    def test5SavedInBatches(self):
+        "Persisted cache is written after a batch of new lookups."
+        path = os.path.join(self.dir, 'dns')
+        batch = samutils.DNS_CACHE_SAVE_BATCH
+        samutils.DNS_CACHE_SAVE_BATCH = 3
+        try:
+            samutils.set_dns_cache(path)
+            samutils.dns_lookup_forward('h1.org')
+            samutils.dns_lookup_forward('h2.org')
+            self.failIf(os.path.exists(path))
+            samutils.dns_lookup_forward('h3.org')
+            self.failUnless(os.path.exists(path))
+            os.utime(path, (1000, 1000))
+            samutils.dns_lookup_forward('h4.org')
+            samutils.dns_lookup_forward('h1.org')
+            self.assertEqual(int(os.stat(path).st_mtime), 1000)
+            # pending lookups written when switching the file
+            samutils.set_dns_cache(None)
+            samutils.clear_dns_cache()
+            samutils.set_dns_cache(path)
+            for h in ['h1.org', 'h2.org', 'h3.org', 'h4.org']:
+                samutils.dns_lookup_forward(h)
+            self.assertEqual(len(self.calls), 4)
+        finally:
+            samutils.DNS_CACHE_SAVE_BATCH = batch
+
+    def test6Untrusted(self):
+        "Only cache files of the user in dump_data() format are read."
+        path = os.path.join(self.dir, 'dns')
+        samutils.set_dns_cache(path)
+        samutils.dns_lookup_forward('h.org')
+        samutils.save_dns_cache()
+        entries = samutils.load_data(open(path).read())
+        # pickles are not loaded
+        open(path, 'w').write(cPickle.dumps(entries))
+        samutils.clear_dns_cache()
+        samutils.set_dns_cache(path)
+        samutils.dns_lookup_forward('h.org')
+        self.assertEqual(len(self.calls), 2)
+        if os.getuid() == 0:
+            # files of other users are ignored
+            open(path, 'w').write(samutils.dump_data(entries))
+            os.chown(path, 1, 1)
+            samutils.clear_dns_cache()
+            samutils.set_dns_cache(path)
+            samutils.dns_lookup_forward('h.org')
+            self.assertEqual(len(self.calls), 3)
+
+    def test4Many(self):
+        "Concurrent lookups of a number of hostnames."
+        samutils.dns_lookup_forward('h.org')
+        names = ['slow1.org', 'slow2.org', 'slow3.org', 'bad.org', 'h.org',
+                 '', 'slow1.org']
+        t = time.time()
+        res = samutils.dns_lookup_forward_many(names)
+        self.failUnless(time.time() - t < 1.4)
+        self.assertEqual(res['slow1.org'], ['10.0.0.9'])
+        self.assertEqual(res['h.org'], ['10.0.0.5'])
+        self.failUnless(isinstance(res['bad.org'], IOError))
+        self.failUnless(isinstance(res[''], ValueError))
+        self.assertEqual(len(self.calls), 5)
+        samutils.dns_lookup_forward_many(names)
+        self.assertEqual(len(self.calls), 5)
+
 class TestParseURI(unittest.TestCase):
     def test1(self):
         "parse_uri2(''), parse_uri3('')"
@@ -152,12 +293,87 @@ class TestUtilsStatusAndRetcode(unittest.TestCase):
         for s in (3, 'UNKNOWN', 'Unknown', 'Bad Input'):
             assert 3 == samutils.to_retcode(s)
 
+class TestUtilsEncodeOutput(unittest.TestCase):
+    def test1Encode(self):
+        "utils.encode_output() - sanitise and escape."
+        out, trunc = samutils.encode_output('OK: a|b', 'x||y\nz\n')
+        self.failUnlessEqual(out, 'OK: aORb\\nxORy\\nz\\n')
+        self.failIf(trunc)
+        self.failUnlessEqual(samutils.outputsanitiser('a|||b'), 'aOROR' + 'b')
+        out, trunc = samutils.encode_output('OK', 'a|b', 'p=1;;',
+                                            sanitize=False)
+        self.failUnlessEqual(out, 'OK\\na|b|p=1;;')
+        out, trunc = samutils.encode_output('OK', 'abc', 'p=1', budget=11)
+        self.failUnlessEqual((out, trunc), ('OK\\nabc|p=1', False))
+
+    def test2Truncate(self):
+        "utils.encode_output() - truncate to budget."
+        details = 'line\n' * 10000
+        out, trunc = samutils.encode_output('CRITICAL: bad', details, 'p=1',
+                                            budget=100)
+        self.failUnless(trunc)
+        self.failUnlessEqual(len(out), 100)
+        self.failUnless(out.startswith('CRITICAL: bad\\nline\\nline'), out)
+        self.failUnless(out.endswith('\\n%s|p=1' % samutils.OUTPUT_TRUNCATED),
+                        out)
+        out, trunc = samutils.encode_output('CRITICAL: bad', details,
+                                            budget=100, ref='/tmp/x.output')
+        self.failUnless(len(out) <= 100, len(out))
+        self.failUnless(out.endswith(samutils.OUTPUT_TRUNCATED_REF % \
+                                     '/tmp/x.output'), out)
+        # escaped new line is not split
+        for budget in range(30, 40):
+            out, trunc = samutils.encode_output('S', '\n' * 100,
+                                                budget=budget)
+            self.failUnless(len(out) <= budget)
+            self.failIf(out[:-len(samutils.OUTPUT_TRUNCATED)].rstrip('\\n').endswith('\\'), out)
+        # budget smaller than the note
+        out, trunc = samutils.encode_output('OK: long summary', '', 'p=1',
+                                            budget=5)
+        self.failUnlessEqual((out, trunc), ('OK: l', True))
+
+class TestUtilsReadOwnFile(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test1(self):
+        "Only regular files of the user are read."
+        path = os.path.join(self.dir, 'f')
+        self.failUnlessEqual(samutils.read_own_file(path), None)
+        open(path, 'w').write('data')
+        self.failUnlessEqual(samutils.read_own_file(path), 'data')
+        link = os.path.join(self.dir, 'l')
+        os.symlink(path, link)
+        self.failUnlessEqual(samutils.read_own_file(link), None)
+        self.failUnlessEqual(samutils.read_own_file(self.dir), None)
+        if os.getuid() == 0:
+            os.chown(path, 1, 1)
+            self.failUnlessEqual(samutils.read_own_file(path), None)
+class TestUtilsDumpData(unittest.TestCase):
+    def test1(self):
+        "Only intact data in dump_data() format is loaded."
+        obj = {('A', 'h.org'): (1.5, ['10.0.0.1'], None)}
+        data = samutils.dump_data(obj)
+        self.failUnlessEqual(samutils.load_data(data), obj)
+        for bad in ['', 'garbage', cPickle.dumps(obj), marshal.dumps(obj),
+                    data[:-1], data[:-1] + chr(ord(data[-1]) ^ 1),
+                    samutils.DATA_MAGIC + 'xyz\n' + marshal.dumps(obj)]:
+            self.failUnlessRaises(ValueError, samutils.load_data, bad)
+        self.failUnlessRaises(ValueError, samutils.dump_data, object())
+
 
 if __name__ == "__main__":
     testcases = [TestParseURI,
                  TestUtilsDNS,
+                 TestUtilsDNSCache,
                  TestUtilsURL2HostIP,
-                 TestUtilsStatusAndRetcode]
+                 TestUtilsStatusAndRetcode,
+                 TestUtilsEncodeOutput,
+                 TestUtilsReadOwnFile,
+                 TestUtilsDumpData]
     for tc in testcases:
         unittest.TextTestRunner(verbosity=2).\
             run(unittest.TestLoader().loadTestsFromTestCase(tc))